@@ -5,7 +5,14 @@ from project.api_services.paystack_api import PaystackClient
 app = create_app()
 
 
-from project.jobs import check_inspection_dates
+from project.jobs import (
+    check_inspection_dates,
+    create_timeline_partitions,
+    dispatch_due_deadlines,
+    drain_webhook_inbox,
+    refresh_bank_directory_job,
+    retry_pending_emails,
+)
 
 with app.app_context():
 
@@ -13,6 +20,36 @@ with app.app_context():
         scheduler.add_job(
             func=check_inspection_dates, trigger="interval", hours=1, id="myCheckJob"
         )
+        scheduler.add_job(
+            func=dispatch_due_deadlines,
+            trigger="interval",
+            seconds=30,
+            id="deadlineDispatchJob",
+        )
+        scheduler.add_job(
+            func=drain_webhook_inbox,
+            trigger="interval",
+            minutes=1,
+            id="webhookDrainJob",
+        )
+        scheduler.add_job(
+            func=refresh_bank_directory_job,
+            trigger="interval",
+            hours=6,
+            id="bankDirectoryRefreshJob",
+        )
+        scheduler.add_job(
+            func=retry_pending_emails,
+            trigger="interval",
+            minutes=5,
+            id="emailRetryJob",
+        )
+        scheduler.add_job(
+            func=create_timeline_partitions,
+            trigger="interval",
+            days=1,
+            id="timelinePartitionJob",
+        )
         if not scheduler.running:
             scheduler.start()
         print("scheduler is running")
@@ -1,4 +1,5 @@
 from project.api_services.sendgrid_api import celery
+import project.tasks
 
 if __name__ == "__main__":
     celery.start()
@@ -0,0 +1,167 @@
+"""moved order booleans into status and flags
+
+Revision ID: 7f1d4b2a9c6e
+Revises: 2c4f8a6e1b93
+Create Date: 2026-10-19 09:14:37.502861
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7f1d4b2a9c6e'
+down_revision = '2c4f8a6e1b93'
+branch_labels = None
+depends_on = None
+
+
+STATUSES = ('initiated', 'payment_pending', 'partially_paid', 'commenced', 'shipped', 'inspection', 'disputed', 'dispute_resolved', 'arbitration', 'returning', 'refund_approved', 'refunding', 'disbursement_approved', 'disbursing', 'closed')
+PAID_STATUSES = STATUSES[3:]
+
+
+def in_list(statuses):
+    return '(' + ', '.join(f"'{status}'" for status in statuses) + ')'
+
+
+# bits of Order.flags, see project.order_status.OrderFlag
+FLAGS = {
+    'conditions_set': 1,
+    'conditions_met': 2,
+    'product_overpay': 4,
+    'seller_confirm_delivery': 8,
+    'delivery_time_elapsed': 16,
+    'extra_time_initiated': 32,
+    'inspection_time_elapsed': 64,
+    'dispute_raised': 128,
+    'dispute_time_elapsed': 256,
+    'partial_disbursement_approved': 512,
+    'partial_disbursement_initiated': 1024,
+    'partial_disbursement_dispatched': 2048,
+    'special_attention': 4096,
+    'order_rated': 8192,
+    'extra_time_elapsed': 16384,
+    'full_amount_refunded': 32768,
+    'partial_dispersals': 65536,
+    'partial_disbursements': 131072,
+    'product_sent_out': 262144,
+    'buyer_confirm_delivery': 524288,
+}
+
+# the lifecycle booleans, now read from status
+STATUS_COLUMNS = {
+    'full_payment_verified': PAID_STATUSES,
+    'order_commenced': PAID_STATUSES,
+    'need_to_balance': ('partially_paid',),
+    'dispute_ongoing': ('disputed',),
+    'dispute_resloved': ('dispute_resolved', 'arbitration'),
+    'arbitration_required': ('arbitration',),
+    'product_to_be_returned': ('returning', 'refund_approved', 'refunding'),
+    'refund_approved': ('refund_approved', 'refunding'),
+    'refund_initiated': ('refunding',),
+    'refund_processing': ('refunding',),
+    'seller_disbursement_approved': ('disbursement_approved', 'disbursing'),
+    'seller_disbursement_initiated': ('disbursing',),
+    'seller_disbursement_processing': ('disbursing',),
+    'order_closed': ('closed',),
+    'refund_dispatched': ('closed',),
+    'seller_disbursement_dispatched': ('closed',),
+}
+
+# columns nothing reads any more, or that duplicate another table
+UNUSED_COLUMNS = {
+    'order_initiated': 'true',
+    'payment_initiated': "status != 'initiated'",
+    'payment_abandoned': 'false',
+    'delivery_time_triggered': f'status IN {in_list(PAID_STATUSES)}',
+    'inspection_time_triggered': '(flags & 524288) != 0',
+    'dispute_time_triggered': '(flags & 128) != 0',
+    'arbitration_ongoing': 'false',
+    'arbitration_conluded': 'false',
+    'product_return_commenced': "status IN ('returning', 'refund_approved', 'refunding')",
+    'partial_disbursement_processing': '(flags & 1024) != 0 AND (flags & 2048) = 0',
+    'product_return_confirm_buyer': 'COALESCE((SELECT buyer_confirm_return FROM "ProductReturn" WHERE "ProductReturn".order_id = "Order".id), false)',
+    'product_return_confirm_seller': 'COALESCE((SELECT seller_confirm_return FROM "ProductReturn" WHERE "ProductReturn".order_id = "Order".id), false)',
+}
+
+NULLABLE_COLUMNS = ('delivery_time_elapsed', 'inspection_time_elapsed', 'dispute_time_triggered', 'dispute_time_elapsed', 'arbitration_required', 'arbitration_ongoing', 'arbitration_conluded')
+
+
+def upgrade():
+    # ### commands auto generated by Alembic - please adjust! ###
+    with op.batch_alter_table('Order', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('flags', sa.Integer(), nullable=False, server_default='0'))
+
+    # ### end Alembic commands ###
+
+    # status has been kept since it was added, orders still at the default
+    # whose booleans show they moved on are caught up, the furthest point
+    # an order has reached wins
+    op.execute(
+        """
+        UPDATE "Order"
+        SET status = CASE
+            WHEN order_closed THEN 'closed'
+            WHEN refund_initiated THEN 'refunding'
+            WHEN refund_approved THEN 'refund_approved'
+            WHEN product_to_be_returned THEN 'returning'
+            WHEN seller_disbursement_initiated THEN 'disbursing'
+            WHEN seller_disbursement_approved THEN 'disbursement_approved'
+            WHEN dispute_conclusion = 'unresolved' THEN 'arbitration'
+            WHEN dispute_resloved AND dispute_conclusion IS NULL THEN 'dispute_resolved'
+            WHEN dispute_ongoing AND dispute_conclusion IS NULL THEN 'disputed'
+            WHEN buyer_confirm_delivery OR dispute_conclusion = 'accepted' THEN 'inspection'
+            WHEN product_sent_out THEN 'shipped'
+            WHEN full_payment_verified THEN 'commenced'
+            WHEN need_to_balance THEN 'partially_paid'
+            WHEN payment_initiated THEN 'payment_pending'
+            ELSE 'initiated'
+        END
+        WHERE status = 'initiated'
+        """
+    )
+    op.execute(
+        'UPDATE "Order" SET flags = 0'
+        + ''.join(f' + CASE WHEN {column} THEN {bit} ELSE 0 END' for column, bit in FLAGS.items())
+    )
+    recount()
+
+    with op.batch_alter_table('Order', schema=None) as batch_op:
+        batch_op.drop_index('ix_Order_inspection_deadline_at_open', postgresql_where=sa.text('order_closed = false'))
+        batch_op.create_index('ix_Order_inspection_deadline_at_open', ['inspection_deadline_at', 'id'], unique=False, postgresql_where=sa.text("status != 'closed'"))
+        for column in (*FLAGS, *STATUS_COLUMNS, *UNUSED_COLUMNS):
+            batch_op.drop_column(column)
+
+
+def downgrade():
+    columns = (*FLAGS, *STATUS_COLUMNS, *UNUSED_COLUMNS)
+
+    with op.batch_alter_table('Order', schema=None) as batch_op:
+        for column in columns:
+            batch_op.add_column(sa.Column(column, sa.Boolean(), nullable=column in NULLABLE_COLUMNS, server_default=sa.false()))
+
+    assignments = [f'{column} = (flags & {bit}) != 0' for column, bit in FLAGS.items()]
+    assignments += [f'{column} = status IN {in_list(statuses)}' for column, statuses in STATUS_COLUMNS.items()]
+    assignments += [f'{column} = {value}' for column, value in UNUSED_COLUMNS.items()]
+    op.execute('UPDATE "Order" SET ' + ', '.join(assignments))
+
+    with op.batch_alter_table('Order', schema=None) as batch_op:
+        for column in columns:
+            batch_op.alter_column(column, existing_type=sa.Boolean(), server_default=None)
+        batch_op.drop_index('ix_Order_inspection_deadline_at_open', postgresql_where=sa.text("status != 'closed'"))
+        batch_op.create_index('ix_Order_inspection_deadline_at_open', ['inspection_deadline_at', 'id'], unique=False, postgresql_where=sa.text('order_closed = false'))
+        batch_op.drop_column('flags')
+
+
+def recount():
+    op.execute(
+        'UPDATE "MerchantStats" SET '
+        + ', '.join(
+            f"""{status}_count = (
+                SELECT COUNT(*) FROM "Order"
+                WHERE "Order".merchant_id = "MerchantStats".merchant_id
+                    AND "Order".status = '{status}'
+            )"""
+            for status in STATUSES
+        )
+    )
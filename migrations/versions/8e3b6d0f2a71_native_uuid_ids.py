@@ -0,0 +1,99 @@
+"""changed id and foreign key columns to native uuid
+
+Revision ID: 8e3b6d0f2a71
+Revises: 1a7d3e5c9b42
+Create Date: 2026-10-18 22:03:41.906127
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e3b6d0f2a71'
+down_revision = '1a7d3e5c9b42'
+branch_labels = None
+depends_on = None
+
+
+# every column holding a unique_id hex string, primary and foreign keys
+ID_COLUMNS = {
+    'Merchant': ['id'],
+    'MerchantDetails': ['id', 'merchant_id'],
+    'BusinessDetails': ['id', 'merchant_id'],
+    'MerchantStats': ['merchant_id'],
+    'Order': ['id', 'merchant_id'],
+    'order_details': ['id', 'order_id'],
+    'TransactionHistory': ['id', 'order_id'],
+    'Customer': ['id', 'order_id'],
+    'TransactionCondition': ['id', 'order_id'],
+    'Dispute': ['id', 'order_id'],
+    'Arbitration': ['id', 'order_id'],
+    'ProductReturn': ['id', 'order_id'],
+    'TransactionTimeline': ['id', 'order_id'],
+    'DeliveryInformation': ['id', 'order_id'],
+    'WebhookEvent': ['id'],
+    'EmailOutbox': ['id'],
+    'LedgerPosting': ['id', 'order_id'],
+    'OrderBalance': ['order_id'],
+}
+
+# plain indexes on columns that are already the whole primary key
+REDUNDANT_ID_INDEXES = [
+    'Merchant', 'MerchantDetails', 'BusinessDetails', 'Order', 'order_details',
+    'TransactionHistory', 'Customer', 'TransactionCondition', 'Dispute',
+    'Arbitration', 'ProductReturn', 'DeliveryInformation', 'WebhookEvent',
+    'EmailOutbox', 'LedgerPosting',
+]
+
+
+def foreign_keys():
+    # foreign keys have to be dropped while both sides change type, their
+    # definitions are read back from the catalog to recreate them as they
+    # were. partitions inherit theirs from the parent table
+    tables = [f'"{table}"' if table != table.lower() else table for table in ID_COLUMNS]
+    return op.get_bind().execute(
+        sa.text(
+            """
+            SELECT conrelid::regclass::text, conname, pg_get_constraintdef(oid)
+            FROM pg_constraint
+            WHERE contype = 'f' AND conparentid = 0
+                AND conrelid::regclass::text = ANY(:tables)
+            """
+        ),
+        {'tables': tables},
+    ).all()
+
+
+def change_id_types(column_type, using):
+    constraints = foreign_keys()
+    for table, name, _ in constraints:
+        op.execute(f'ALTER TABLE {table} DROP CONSTRAINT "{name}"')
+
+    for table, columns in ID_COLUMNS.items():
+        op.execute(
+            f'ALTER TABLE "{table}" '
+            + ', '.join(
+                f'ALTER COLUMN {column} TYPE {column_type} USING {using.format(column=column)}'
+                for column in columns
+            )
+        )
+
+    for table, name, definition in constraints:
+        op.execute(f'ALTER TABLE {table} ADD CONSTRAINT "{name}" {definition}')
+
+
+def upgrade():
+    # 16 bytes per id instead of a 33 byte varchar, in the tables and in
+    # every index over them. existing hex ids cast as they are
+    change_id_types('UUID', '{column}::uuid')
+
+    for table in REDUNDANT_ID_INDEXES:
+        op.execute(f'DROP INDEX IF EXISTS "ix_{table}_id"')
+
+
+def downgrade():
+    change_id_types('VARCHAR(50)', "replace({column}::text, '-', '')")
+
+    for table in REDUNDANT_ID_INDEXES:
+        op.execute(f'CREATE INDEX IF NOT EXISTS "ix_{table}_id" ON "{table}" (id)')
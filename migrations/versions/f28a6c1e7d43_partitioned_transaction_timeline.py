@@ -0,0 +1,192 @@
+"""partitioned append-only transaction timeline with event codes
+
+Revision ID: f28a6c1e7d43
+Revises: e4b87d2c9f16
+Create Date: 2026-10-18 20:31:19.207845
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f28a6c1e7d43'
+down_revision = 'e4b87d2c9f16'
+branch_labels = None
+depends_on = None
+
+
+# months of partitions created past the current one, the
+# timelinePartitionJob keeps this many ahead from then on
+PARTITIONS_AHEAD = 2
+
+
+def upgrade():
+    # event codes for existing events, matched from their text
+    with op.batch_alter_table('TransactionTimeline', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('event_code', sa.String(length=40), nullable=True))
+
+    op.execute(
+        """
+        UPDATE "TransactionTimeline"
+        SET event_code = CASE
+            WHEN event_occurrance LIKE '%Order Success fully created%' THEN 'order_created'
+            WHEN event_occurrance LIKE '%has been set%' THEN 'condition_set'
+            WHEN event_occurrance LIKE '%payment of escrow service for order%' THEN 'payment_initiated'
+            WHEN event_occurrance LIKE '%Partial payment of%' THEN 'payment_partial'
+            WHEN event_occurrance LIKE '%Full balance payment of%' THEN 'payment_completed'
+            WHEN event_occurrance LIKE '%Full payment of%' THEN 'payment_completed'
+            WHEN event_occurrance LIKE '%sent out for delivey%' THEN 'product_sent_out'
+            WHEN event_occurrance LIKE '%confirmed by seller as delivered%' THEN 'seller_confirmed_delivery'
+            WHEN event_occurrance LIKE '%confirmed by buyer as delivered%' THEN 'buyer_confirmed_delivery'
+            WHEN event_occurrance LIKE '%Delivery time for order%' THEN 'delivery_elapsed'
+            WHEN event_occurrance LIKE '%All conditions have been met%' THEN 'conditions_met'
+            WHEN event_occurrance LIKE '%has been confirmed as met%' THEN 'condition_met'
+            WHEN event_occurrance LIKE '%reminder to inspect%' THEN 'inspection_extended'
+            WHEN event_occurrance LIKE '%Auto payout failed%' THEN 'auto_payout_failed'
+            WHEN event_occurrance LIKE '%Inspection time elapsed%' THEN 'inspection_elapsed'
+            WHEN event_occurrance LIKE '%Dispute raised on condition%' THEN 'condition_disputed'
+            WHEN event_occurrance LIKE '%Dispute raised on product%' THEN 'dispute_raised'
+            WHEN event_occurrance LIKE '%Dispute issue added%' THEN 'dispute_raised'
+            WHEN event_occurrance LIKE '%successfuly settled for dispute%' THEN 'condition_dispute_settled'
+            WHEN event_occurrance LIKE '%All disputes for order%' THEN 'disputes_resolved'
+            WHEN event_occurrance LIKE '%successfully resolved%' THEN 'dispute_resolved'
+            WHEN event_occurrance LIKE '%Dispute resolution time%' THEN 'dispute_elapsed'
+            WHEN event_occurrance LIKE '%concluded and product was accepted%' THEN 'dispute_accepted'
+            WHEN event_occurrance LIKE '%product return has commenced%' THEN 'dispute_rejected'
+            WHEN event_occurrance LIKE '%unresolved and arbitration required%' THEN 'dispute_unresolved'
+            WHEN event_occurrance LIKE '%has been sent out for return%' THEN 'return_sent_out'
+            WHEN event_occurrance LIKE '%marked as delivered by the buyer%' THEN 'return_confirmed_buyer'
+            WHEN event_occurrance LIKE '%marked as delivered by the seller%' THEN 'return_confirmed_seller'
+            WHEN event_occurrance LIKE '%Time for return of product%' THEN 'return_elapsed'
+            WHEN event_occurrance LIKE '%Inspection time for returned product%' THEN 'return_inspection_elapsed'
+            WHEN event_occurrance LIKE '%Conditions of the return of product%' THEN 'return_accepted'
+            WHEN event_occurrance LIKE '%Refund of funds for product%' THEN 'refund_approved'
+            WHEN event_occurrance LIKE '%Refund have been successfully initiated%' THEN 'refund_initiated'
+            WHEN event_occurrance LIKE '%Refund of %successfully verified%' THEN 'refund_completed'
+            WHEN event_occurrance LIKE '%Partial Disbursements for order%' THEN 'partial_disbursement_approved'
+            WHEN event_occurrance LIKE '%Partial Disbursements have been successfully initiated%' THEN 'partial_disbursement_initiated'
+            WHEN event_occurrance LIKE '%Partial disbursement of%' THEN 'partial_disbursement_completed'
+            WHEN event_occurrance LIKE '%Full Disbursements of funds for order%' THEN 'disbursement_approved'
+            WHEN event_occurrance LIKE '%Full Disbursements have been successfully initiated%' THEN 'disbursement_initiated'
+            WHEN event_occurrance LIKE '%Full disbursement of%' THEN 'disbursement_completed'
+            WHEN event_occurrance LIKE '%was given a rating%' THEN 'order_rated'
+            WHEN event_occurrance LIKE '%has been successfully closed%' THEN 'order_closed'
+            ELSE 'other'
+        END
+        """
+    )
+
+    # move the table aside and recreate it range partitioned by month on
+    # date. the primary key has to include the partition column
+    op.execute('ALTER TABLE "TransactionTimeline" RENAME TO "TransactionTimeline_old"')
+    op.execute('ALTER TABLE "TransactionTimeline_old" RENAME CONSTRAINT "TransactionTimeline_pkey" TO "TransactionTimeline_old_pkey"')
+    op.execute('ALTER TABLE "TransactionTimeline_old" RENAME CONSTRAINT "TransactionTimeline_order_id_fkey" TO "TransactionTimeline_old_order_id_fkey"')
+    op.execute('ALTER INDEX "ix_TransactionTimeline_id" RENAME TO "ix_TransactionTimeline_old_id"')
+
+    op.execute(
+        """
+        CREATE TABLE "TransactionTimeline" (
+            id VARCHAR(50) NOT NULL,
+            event_code VARCHAR(40) NOT NULL,
+            event_occurrance TEXT NOT NULL,
+            category VARCHAR(30),
+            date TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            order_id VARCHAR(50),
+            CONSTRAINT "TransactionTimeline_pkey" PRIMARY KEY (id, date),
+            CONSTRAINT "TransactionTimeline_order_id_fkey" FOREIGN KEY(order_id) REFERENCES "Order" (id)
+        ) PARTITION BY RANGE (date)
+        """
+    )
+    op.create_index('ix_TransactionTimeline_id', 'TransactionTimeline', ['id'], unique=False)
+    op.create_index('ix_TransactionTimeline_order_id_date', 'TransactionTimeline', ['order_id', 'date', 'id'], unique=False)
+
+    # one partition per month from the oldest event to PARTITIONS_AHEAD
+    # months from now, and a default one so a missed month never fails
+    # an insert
+    op.execute(
+        f"""
+        DO $$
+        DECLARE
+            month DATE;
+        BEGIN
+            FOR month IN
+                SELECT generate_series(
+                    date_trunc('month', LEAST(
+                        COALESCE((SELECT MIN(date) FROM "TransactionTimeline_old"), now()),
+                        now()
+                    )),
+                    date_trunc('month', now()) + interval '{PARTITIONS_AHEAD} months',
+                    interval '1 month'
+                )::date
+            LOOP
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF "TransactionTimeline" FOR VALUES FROM (%L) TO (%L)',
+                    'TransactionTimeline_y' || to_char(month, 'YYYY') || 'm' || to_char(month, 'MM'),
+                    month,
+                    month + interval '1 month'
+                );
+            END LOOP;
+        END $$
+        """
+    )
+    op.execute('CREATE TABLE "TransactionTimeline_default" PARTITION OF "TransactionTimeline" DEFAULT')
+
+    op.execute(
+        """
+        INSERT INTO "TransactionTimeline" (id, event_code, event_occurrance, category, date, order_id)
+        SELECT id, event_code, event_occurrance, category, date, order_id
+        FROM "TransactionTimeline_old"
+        """
+    )
+    op.drop_table('TransactionTimeline_old')
+
+    # events are append-only, retention drops whole partitions instead
+    op.execute(
+        """
+        CREATE FUNCTION transaction_timeline_append_only() RETURNS trigger AS $$
+        BEGIN
+            RAISE EXCEPTION 'TransactionTimeline is append-only';
+        END
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER transaction_timeline_append_only
+        BEFORE UPDATE OR DELETE ON "TransactionTimeline"
+        FOR EACH ROW EXECUTE FUNCTION transaction_timeline_append_only()
+        """
+    )
+
+
+def downgrade():
+    op.execute('DROP TRIGGER transaction_timeline_append_only ON "TransactionTimeline"')
+    op.execute('DROP FUNCTION transaction_timeline_append_only()')
+
+    op.execute('ALTER TABLE "TransactionTimeline" RENAME TO "TransactionTimeline_partitioned"')
+    op.execute('ALTER TABLE "TransactionTimeline_partitioned" RENAME CONSTRAINT "TransactionTimeline_pkey" TO "TransactionTimeline_partitioned_pkey"')
+    op.execute('ALTER TABLE "TransactionTimeline_partitioned" RENAME CONSTRAINT "TransactionTimeline_order_id_fkey" TO "TransactionTimeline_partitioned_order_id_fkey"')
+    op.execute('ALTER INDEX "ix_TransactionTimeline_id" RENAME TO "ix_TransactionTimeline_partitioned_id"')
+    op.execute('ALTER INDEX "ix_TransactionTimeline_order_id_date" RENAME TO "ix_TransactionTimeline_partitioned_order_id_date"')
+
+    op.create_table('TransactionTimeline',
+    sa.Column('id', sa.String(length=50), nullable=False),
+    sa.Column('event_occurrance', sa.Text(), nullable=False),
+    sa.Column('category', sa.String(length=30), nullable=True),
+    sa.Column('date', sa.DateTime(), nullable=False),
+    sa.Column('order_id', sa.String(length=50), nullable=True),
+    sa.ForeignKeyConstraint(['order_id'], ['Order.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_TransactionTimeline_id', 'TransactionTimeline', ['id'], unique=False)
+
+    op.execute(
+        """
+        INSERT INTO "TransactionTimeline" (id, event_occurrance, category, date, order_id)
+        SELECT id, event_occurrance, category, date, order_id
+        FROM "TransactionTimeline_partitioned"
+        """
+    )
+    # dropping the parent drops every partition with it
+    op.drop_table('TransactionTimeline_partitioned')
@@ -7,7 +7,6 @@ from flask_bcrypt import Bcrypt
 from flask_apscheduler import APScheduler
 from .config import configuration
 import redis
-import multiprocessing
 
 
 # instantiating flask modules
@@ -33,7 +32,14 @@ def create_app(config_type=configuration["development"]):
     bcrypt.init_app(app)
     scheduler.init_app(app)
     migrate.init_app(app, db)
-    app.lock = multiprocessing.Lock()
+
+    from .commands import register_commands
+    from .loaders import report_statement_count
+    from .helpers import warm_templates
+
+    register_commands(app)
+    app.after_request(report_statement_count)
+    warm_templates()
 
     status = "dev"
 
@@ -79,9 +85,12 @@ def user_identity_lookup(user):
 def user_lookup_callback(_jwt_header, jwt_payload):
     """
     Automatically load authenticated user object
-    from database, making current_user available
-    for route wrapped with the @jwt_required() decorator
+    from the merchant cache (or database on a miss),
+    making current_user available for route wrapped
+    with the @jwt_required() decorator
     """
 
+    from .merchant_cache import load_merchant
+
     identity = jwt_payload["sub"]
-    return Merchant.query.filter_by(id=identity).one_or_none()
+    return load_merchant(identity)
@@ -0,0 +1,146 @@
+import difflib
+import json
+import re
+import threading
+import time
+from datetime import datetime
+import redis
+from project import r_client
+from project import metrics
+
+
+# paystack's bank list, cached as a snapshot in redis with an in-process
+# copy on top, indexed by normalized name and by code. the snapshot never
+# expires, a failed refresh leaves the last good one in place so lookups
+# keep working while paystack's /bank endpoint is slow or down
+
+BANK_DIRECTORY_KEY = "bank_directory"
+LOCAL_TTL = 300
+CANDIDATE_CUTOFF = 0.6
+MAX_CANDIDATES = 5
+
+# only corporate suffixes are dropped, words like "of" or "nigeria" tell
+# banks apart (e.g. bank of industry and industry bank)
+_NAME_NOISE = {"plc", "ltd", "limited"}
+
+_directory = {"by_name": None, "by_code": None, "loaded_at": 0.0}
+_refresh_lock = threading.Lock()
+
+
+def normalize_bank_name(name: str) -> str:
+    words = re.sub(r"[^a-z0-9]+", " ", name.lower()).split()
+    return " ".join(word for word in words if word not in _NAME_NOISE)
+
+
+def _index(banks: list):
+    by_name, by_code = {}, {}
+    for bank in banks:
+        by_name.setdefault(normalize_bank_name(bank["name"]), bank)
+        if bank.get("code"):
+            by_code[bank["code"]] = bank
+
+    _directory["by_name"] = by_name
+    _directory["by_code"] = by_code
+    _directory["loaded_at"] = time.monotonic()
+
+
+def refresh_bank_directory() -> int:
+    """
+    fetch the bank list from paystack and replace the snapshot.
+    returns the number of banks, or 0 if the fetch failed
+    """
+
+    from project.api_services.paystack_api import PaystackClient
+
+    with _refresh_lock:
+        bank_response, _ = PaystackClient().get_supported_banks()
+
+        if not isinstance(bank_response, dict) or not bank_response.get("status"):
+            print(f"failed to refresh bank directory -- {bank_response}")
+            metrics.incr("bank_directory.refresh_failed")
+            return 0
+
+        banks = [
+            {
+                "name": bank["name"],
+                "code": bank.get("code"),
+                "active": bank.get("active", False),
+            }
+            for bank in bank_response["data"]
+        ]
+        _index(banks)
+
+        try:
+            r_client.set(
+                BANK_DIRECTORY_KEY,
+                json.dumps(
+                    {"banks": banks, "fetched_at": datetime.utcnow().isoformat()}
+                ),
+            )
+        except redis.exceptions.RedisError as e:
+            print(f"failed to store bank directory -- {e}")
+
+        return len(banks)
+
+
+def _load_directory() -> bool:
+    if (
+        _directory["by_name"] is not None
+        and time.monotonic() - _directory["loaded_at"] < LOCAL_TTL
+    ):
+        return True
+
+    try:
+        snapshot = r_client.get(BANK_DIRECTORY_KEY)
+    except redis.exceptions.RedisError as e:
+        print(f"bank directory unavailable in redis -- {e}")
+        snapshot = None
+
+    if snapshot:
+        _index(json.loads(snapshot)["banks"])
+        return True
+
+    # keep serving a stale in-process copy rather than nothing
+    if _directory["by_name"] is not None:
+        return True
+
+    return refresh_bank_directory() > 0
+
+
+def lookup_bank(name: str):
+    """
+    find a bank by name, ignoring case, punctuation and suffixes such as
+    plc. only exact matches on the normalized name are returned, returns
+    None if the bank is unknown or the directory can't be loaded
+    """
+
+    if not name or not _load_directory():
+        return None
+
+    bank = _directory["by_name"].get(normalize_bank_name(name))
+    metrics.incr("bank_directory.exact_match" if bank else "bank_directory.no_match")
+    return bank
+
+
+def bank_candidates(name: str) -> list:
+    """
+    banks with names close to name, for the caller to confirm one by its
+    code. never used to pick a bank on its own
+    """
+
+    if not name or not _load_directory():
+        return []
+
+    close = difflib.get_close_matches(
+        normalize_bank_name(name),
+        _directory["by_name"].keys(),
+        n=MAX_CANDIDATES,
+        cutoff=CANDIDATE_CUTOFF,
+    )
+    return [_directory["by_name"][match] for match in close]
+
+
+def bank_by_code(code: str):
+    if not code or not _load_directory():
+        return None
+    return _directory["by_code"].get(code)
@@ -0,0 +1,79 @@
+import os
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from project import metrics
+
+
+# process wide keep-alive sessions for the payment providers. each
+# provider gets one requests.Session with a bounded connection pool, so
+# calls reuse connections instead of paying for a new TCP and TLS
+# handshake. sessions are created lazily per process, a forked gunicorn
+# or celery worker never shares the parent's sockets
+
+POOL_SIZE = 20
+DEFAULT_TIMEOUT = (3.05, 15)
+
+# only idempotent GETs are retried, payment and payout POSTs never are
+RETRY = Retry(
+    total=3,
+    connect=3,
+    read=2,
+    backoff_factor=0.3,
+    backoff_jitter=0.5,
+    status_forcelist=(429, 500, 502, 503, 504),
+    allowed_methods=frozenset({"GET"}),
+    raise_on_status=False,
+)
+
+LATENCY_BUCKETS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(provider: str) -> requests.Session:
+    key = (provider, os.getpid())
+    session = _sessions.get(key)
+    if session is not None:
+        return session
+
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=RETRY
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[key] = session
+
+    return session
+
+
+def provider_request(
+    provider: str, endpoint: str, method: str, url: str, timeout=None, **kwargs
+) -> requests.Response:
+    """
+    send a request to a provider through its pooled session. timeout is a
+    (connect, read) tuple, latency is recorded per provider endpoint in
+    the http.<provider>.<endpoint>.ms histogram
+    """
+
+    started = time.perf_counter()
+    try:
+        return get_session(provider).request(
+            method, url, timeout=timeout or DEFAULT_TIMEOUT, **kwargs
+        )
+    except requests.exceptions.RequestException:
+        metrics.incr(f"http.{provider}.{endpoint}.error")
+        raise
+    finally:
+        metrics.observe(
+            f"http.{provider}.{endpoint}.ms",
+            (time.perf_counter() - started) * 1000,
+            buckets=LATENCY_BUCKETS,
+        )
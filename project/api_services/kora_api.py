@@ -1,7 +1,13 @@
-import requests
 import json
 import os
 import dotenv
+from project.api_services.http_session import provider_request
+
+
+# (connect, read) timeouts per endpoint
+TIMEOUTS = {
+    "single_payout": (3.05, 30),
+}
 
 
 class KoraClient:
@@ -17,11 +23,22 @@ class KoraClient:
         except Exception as e:
             print(e)
 
+    def request(self, endpoint: str, method: str, url: str, **kwargs):
+        return provider_request(
+            "kora",
+            endpoint,
+            method,
+            url,
+            timeout=TIMEOUTS.get(endpoint),
+            headers=self.headers,
+            **kwargs,
+        )
+
     def single_payout(self, payload: dict):
         try:
             url = f"{self.BASE_URL}/transactions/disburse"
-            response = requests.post(
-                url, data=json.dumps(payload), headers=self.headers
+            response = self.request(
+                "single_payout", "POST", url, data=json.dumps(payload)
             )
 
             return response.json(), response.status_code
@@ -1,7 +1,22 @@
-import requests
 import json
 import os
+import time
 import dotenv
+import redis
+from project import r_client
+from project import metrics
+from project.api_services.http_session import provider_request
+
+
+# (connect, read) timeouts per endpoint
+TIMEOUTS = {
+    "initialize_transaction": (3.05, 15),
+    "verify_transaction": (3.05, 10),
+    "get_supported_banks": (3.05, 10),
+    "create_transfer_receipient": (3.05, 15),
+    "resolve_account_number": (3.05, 10),
+    "initiate_payout": (3.05, 30),
+}
 
 
 class PaystackClient:
@@ -17,11 +32,22 @@ class PaystackClient:
         except Exception as e:
             print(e)
 
+    def request(self, endpoint: str, method: str, url: str, **kwargs):
+        return provider_request(
+            "paystack",
+            endpoint,
+            method,
+            url,
+            timeout=TIMEOUTS.get(endpoint),
+            headers=self.headers,
+            **kwargs,
+        )
+
     def initialize_transaction(self, payload: dict):
         try:
             url = f"{self.BASE_URL}/transaction/initialize"
-            response = requests.post(
-                url, data=json.dumps(payload), headers=self.headers
+            response = self.request(
+                "initialize_transaction", "POST", url, data=json.dumps(payload)
             )
 
             return response.json(), response.status_code
@@ -33,7 +59,7 @@ class PaystackClient:
     def paystack_verify_transaction(self, reference):
         try:
             url = f"{self.BASE_URL}/transaction/verify/{reference}"
-            response = requests.get(url, headers=self.headers)
+            response = self.request("verify_transaction", "GET", url)
             return response.json(), response.status_code
 
         except Exception as e:
@@ -44,7 +70,7 @@ class PaystackClient:
         try:
             url = f"{self.BASE_URL}/bank"
             params = {"country": "nigeria"}
-            response = requests.get(url, headers=self.headers, params=params)
+            response = self.request("get_supported_banks", "GET", url, params=params)
             return response.json(), response.status_code
         except Exception as e:
             print(e)
@@ -55,7 +81,9 @@ class PaystackClient:
             url = f"{self.BASE_URL}/transferrecipient"
             body = json.dumps(payload)
             print(body)
-            response = requests.post(url, data=body, headers=self.headers)
+            response = self.request(
+                "create_transfer_receipient", "POST", url, data=body
+            )
             print(response.json())
             print("successful")
             return response.json(), response.status_code
@@ -71,7 +99,7 @@ class PaystackClient:
                 "account_number": payload["account_number"],
                 "bank_code": payload["bank_code"],
             }
-            response = requests.get(url, params=params, headers=self.headers)
+            response = self.request("resolve_account_number", "GET", url, params=params)
             return response.json(), response.status_code
         except Exception as e:
             print(e)
@@ -81,7 +109,7 @@ class PaystackClient:
         try:
             url = f"{self.BASE_URL}/transfer"
             body = json.dumps(payload)
-            response = requests.post(url, data=body, headers=self.headers)
+            response = self.request("initiate_payout", "POST", url, data=body)
             return response.json(), response.status_code
         except Exception as e:
             print(e)
@@ -91,32 +119,91 @@ class PaystackClient:
 # !!! FUNCTIONS TO STREAMLINE PAYSTACK SERVICES !!!
 
 
-def validate_account_details(payload: dict):
+# account resolutions are cached by (bank_code, account_number). accounts
+# paystack can't resolve are cached for a shorter time, provider errors
+# are never cached. concurrent lookups of the same account wait for the
+# first one instead of all calling paystack
+
+RESOLVED_ACCOUNT_PREFIX = "resolved_account:"
+RESOLVED_ACCOUNT_TTL = 60 * 60 * 24
+UNRESOLVED_ACCOUNT_TTL = 60 * 10
+RESOLVE_LOCK_TTL = 15
+RESOLVE_WAIT_SECONDS = 10
+
+
+def resolve_account(bank_code: str, account_number: str):
+    cache_key = f"{RESOLVED_ACCOUNT_PREFIX}{bank_code}:{account_number}"
+    lock_key = f"{cache_key}:lock"
+
     try:
-        p_client = PaystackClient()
+        cached = r_client.get(cache_key)
+        if cached:
+            metrics.incr("resolved_account.hit")
+            cached = json.loads(cached)
+            return cached["response"], cached["status_code"]
+
+        metrics.incr("resolved_account.miss")
+        leader = r_client.set(lock_key, 1, nx=True, ex=RESOLVE_LOCK_TTL)
+        if not leader:
+            deadline = time.monotonic() + RESOLVE_WAIT_SECONDS
+            while time.monotonic() < deadline:
+                time.sleep(0.1)
+                cached = r_client.get(cache_key)
+                if cached:
+                    metrics.incr("resolved_account.coalesced")
+                    cached = json.loads(cached)
+                    return cached["response"], cached["status_code"]
+                if not r_client.exists(lock_key):
+                    break
+    except redis.exceptions.RedisError as e:
+        print(f"resolved account cache unavailable -- {e}")
+        leader = False
+
+    response, status_code = PaystackClient().resolve_account_number(
+        payload={"account_number": account_number, "bank_code": bank_code}
+    )
+
+    if isinstance(response, dict) and response.get("status"):
+        ttl = RESOLVED_ACCOUNT_TTL
+    elif isinstance(response, dict) and status_code in (400, 404, 422):
+        ttl = UNRESOLVED_ACCOUNT_TTL
+    else:
+        ttl = None
 
-        bank_response, br_stat_code = p_client.get_supported_banks()
+    try:
+        if ttl:
+            r_client.set(
+                cache_key,
+                json.dumps({"response": response, "status_code": status_code}),
+                ex=ttl,
+            )
+        if leader:
+            r_client.delete(lock_key)
+    except redis.exceptions.RedisError as e:
+        print(f"failed to cache resolved account -- {e}")
+
+    return response, status_code
 
-        if bank_response["status"] == False:
-            return {"status": False, "message": "failed to get bank"}, br_stat_code
 
-        bank = next(
-            (
-                bank
-                for bank in bank_response["data"]
-                if bank["name"] == payload["bank_name"]
-            ),
-            None,
+def validate_account_details(payload: dict):
+    try:
+        from project.api_services.bank_directory import (
+            lookup_bank,
+            bank_by_code,
+            bank_candidates,
         )
 
+        # a bank_code confirms one of the candidates offered for a name
+        # that didn't match exactly
+        if payload.get("bank_code"):
+            bank = bank_by_code(payload["bank_code"])
+        else:
+            bank = lookup_bank(payload.get("bank_name"))
+
         if bank and bank["active"]:
             bank_code = bank.get("code")
-            req_payload = {
-                "account_number": payload["account_number"],
-                "bank_code": bank_code,
-            }
-            validate_response, v_stat_code = p_client.resolve_account_number(
-                payload=req_payload
+            validate_response, v_stat_code = resolve_account(
+                bank_code, payload["account_number"]
             )
 
             if validate_response["status"]:
@@ -136,6 +223,11 @@ def validate_account_details(payload: dict):
             return {
                 "status": False,
                 "message": "bank not found",
+                "candidates": [
+                    {"name": candidate["name"], "code": candidate["code"]}
+                    for candidate in bank_candidates(payload.get("bank_name"))
+                    if candidate["active"]
+                ],
             }, 400
     except Exception as e:
         print("soemthing went wrong with function")
@@ -1,4 +1,7 @@
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from celery import Celery
 from flask import jsonify
 from dotenv import load_dotenv
@@ -13,7 +16,12 @@ from sendgrid.helpers.mail import (
     Substitution,
 )
 from itsdangerous import URLSafeTimedSerializer
-from project.helpers import get_email_html_template, get_payment_verification_template
+from project.helpers import (
+    get_email_html_template,
+    get_payment_verification_template,
+    template_env,
+)
+from project import metrics
 
 
 load_dotenv()
@@ -23,6 +31,25 @@ celery = Celery(
 )
 
 
+_sendgrid_clients = {}
+_sendgrid_clients_lock = threading.Lock()
+
+
+def sendgrid_client() -> SendGridAPIClient:
+    """
+    one SendGrid client per process, shared by every mailer
+    """
+
+    pid = os.getpid()
+    if pid not in _sendgrid_clients:
+        with _sendgrid_clients_lock:
+            if pid not in _sendgrid_clients:
+                _sendgrid_clients[pid] = SendGridAPIClient(
+                    os.environ.get("SENDGRID_API_KEY_2")
+                )
+    return _sendgrid_clients[pid]
+
+
 class Mailer:
     def __init__(self):
         try:
@@ -34,9 +61,12 @@ class Mailer:
         except Exception as e:
             print(e)
 
-    def send_verification_mail(self, email, name):
+    def verification_token(self, email):
+        return self.SERIALIZER.dumps(email, salt="email-confirm-salt")
+
+    def send_verification_mail(self, email, name, token=None):
         try:
-            token = self.SERIALIZER.dumps(email, salt="email-confirm-salt")
+            token = token or self.verification_token(email)
             verification_url = f"https://elegant-buck-deciding.ngrok-free.app/api/dev/v1/verify_email/{token}"
 
             message = Mail(
@@ -49,7 +79,7 @@ class Mailer:
             )
 
             try:
-                sg = SendGridAPIClient(self.SENDGRID_API_KEY_2)
+                sg = sendgrid_client()
                 response = sg.send(message)
                 print("we got a response")
                 print(f"Email sent with status code {response.status_code}")
@@ -82,7 +112,7 @@ class Mailer:
                 ),
             )
             try:
-                sg = SendGridAPIClient(self.SENDGRID_API_KEY_2)
+                sg = sendgrid_client()
                 response = sg.send(message)
                 print("we got a response")
                 print(f"Email sent with status code {response.status_code}")
@@ -102,3 +132,87 @@ class Mailer:
         except Exception as e:
             print(e)
             return (e), 400
+
+
+# SendGrid accepts at most 1000 personalizations per request
+SENDGRID_PERSONALIZATION_LIMIT = 1000
+BULK_MAIL_WORKERS = 4
+
+
+class BulkMailer:
+    """
+    send one template to many recipients. the template is rendered once
+    with a -field- substitution tag in place of each per-recipient value,
+    and recipients are packed up to SendGrid's personalization limit into
+    each request, sent concurrently over the shared client
+    """
+
+    def __init__(self, max_workers: int = BULK_MAIL_WORKERS):
+        self.SENDER_EMAIL_ADDRESS = os.environ.get("SENDER_EMAIL_ADDRESS")
+        self.max_workers = max_workers
+
+    def send(
+        self, subject: str, file_name: str, recipients: list, context: dict = None
+    ) -> dict:
+        """
+        recipients are dicts with an email and the template fields that
+        differ per recipient, context holds the fields shared by all of
+        them. returns the outcome for each recipient email
+        """
+
+        if not recipients:
+            return {}
+
+        fields = {key for recipient in recipients for key in recipient} - {"email"}
+        html_content = template_env.get_template(file_name).render(
+            {**(context or {}), **{field: f"-{field}-" for field in fields}}
+        )
+
+        batches = [
+            recipients[i : i + SENDGRID_PERSONALIZATION_LIMIT]
+            for i in range(0, len(recipients), SENDGRID_PERSONALIZATION_LIMIT)
+        ]
+
+        outcomes = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for batch_outcomes in executor.map(
+                lambda batch: self._send_batch(subject, html_content, fields, batch),
+                batches,
+            ):
+                outcomes.update(batch_outcomes)
+
+        return outcomes
+
+    def _send_batch(self, subject, html_content, fields, batch) -> dict:
+        message = Mail(
+            from_email=self.SENDER_EMAIL_ADDRESS,
+            subject=subject,
+            html_content=html_content,
+        )
+        for recipient in batch:
+            personalization = Personalization()
+            personalization.add_to(To(recipient["email"]))
+            for field in fields:
+                personalization.add_substitution(
+                    Substitution(f"-{field}-", str(recipient.get(field, "")))
+                )
+            message.add_personalization(personalization)
+
+        started = time.perf_counter()
+        try:
+            response = sendgrid_client().send(message)
+            outcome = {"status": "sent", "status_code": response.status_code}
+            metrics.incr("email.bulk.sent", len(batch))
+        except Exception as e:
+            print(f"bulk email batch of {len(batch)} failed -- {e}")
+            outcome = {
+                "status": "failed",
+                "status_code": getattr(e, "status_code", None),
+                "error": str(e),
+            }
+            metrics.incr("email.bulk.failed", len(batch))
+        metrics.observe(
+            "email.bulk.batch_send_ms", (time.perf_counter() - started) * 1000
+        )
+
+        return {recipient["email"]: outcome for recipient in batch}
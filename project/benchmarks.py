@@ -0,0 +1,125 @@
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import Column, DateTime, Index, MetaData, String, Table, insert, text
+from project import db
+
+
+# insert throughput and on-disk size of the order table under different
+# primary key layouts. each layout gets a scratch copy of the columns that
+# carry ids and is filled with the same synthetic orders, so the numbers
+# only differ by the id type and how ids are generated
+
+LAYOUTS = ("varchar_uuid4", "uuid_uuid4", "uuid_uuid7")
+
+
+def layout_table(layout: str) -> tuple:
+    """
+    the scratch table for a layout and a function returning new ids for it
+    """
+
+    from project.merchants.models import HexUUID, uuid7
+
+    if layout == "varchar_uuid4":
+        column_type, new_id = String(50), lambda: uuid.uuid4().hex
+    elif layout == "uuid_uuid4":
+        column_type, new_id = HexUUID, lambda: uuid.uuid4().hex
+    elif layout == "uuid_uuid7":
+        column_type, new_id = HexUUID, lambda: uuid7().hex
+    else:
+        raise ValueError(f"unknown id layout {layout}")
+
+    name = f"benchmark_order_{layout}"
+    table = Table(
+        name,
+        MetaData(),
+        Column("id", column_type, primary_key=True),
+        Column("merchant_id", column_type, nullable=False),
+        Column("reference_no", String(50), nullable=False, unique=True),
+        Column("date_initiated", DateTime, nullable=False),
+        Index(
+            f"ix_{name}_merchant_id_date_initiated_id",
+            "merchant_id",
+            "date_initiated",
+            "id",
+        ),
+    )
+    return table, new_id
+
+
+def benchmark_layout(
+    layout: str, orders: int, merchants: int, batch_size: int, seed: int = 0
+) -> dict:
+    from nanoid import generate
+
+    table, new_id = layout_table(layout)
+    connection = db.session.connection()
+    table.drop(connection, checkfirst=True)
+    table.create(connection)
+    db.session.commit()
+
+    rand = random.Random(seed)
+    merchant_ids = [new_id() for _ in range(merchants)]
+    now = datetime.utcnow()
+
+    elapsed, created = 0.0, 0
+    while created < orders:
+        size = min(batch_size, orders - created)
+        rows = [
+            {
+                "id": new_id(),
+                "merchant_id": rand.choice(merchant_ids),
+                "reference_no": generate(),
+                "date_initiated": now + timedelta(milliseconds=created + index),
+            }
+            for index in range(size)
+        ]
+        started = time.perf_counter()
+        db.session.execute(insert(table), rows)
+        db.session.commit()
+        elapsed += time.perf_counter() - started
+        created += size
+
+    connection = db.session.connection()
+    sizes = connection.execute(
+        text(
+            """
+            SELECT
+                pg_relation_size(CAST(:table AS regclass)),
+                pg_relation_size(CAST(:primary_key AS regclass)),
+                pg_indexes_size(CAST(:table AS regclass))
+            """
+        ),
+        {"table": f'"{table.name}"', "primary_key": f'"{table.name}_pkey"'},
+    ).one()
+
+    table.drop(connection)
+    db.session.commit()
+
+    return {
+        "layout": layout,
+        "orders": created,
+        "insert_seconds": round(elapsed, 2),
+        "orders_per_second": round(created / elapsed) if elapsed else None,
+        "table_bytes": sizes[0],
+        "primary_key_bytes": sizes[1],
+        "index_bytes": sizes[2],
+    }
+
+
+def benchmark_ids(
+    orders: int = 1000000, merchants: int = 1000, batch_size: int = 10000
+) -> list:
+    """
+    insert the same synthetic orders under every layout in LAYOUTS and
+    report insert throughput and table, primary key and total index size.
+    postgres only, raises ValueError elsewhere
+    """
+
+    if db.engine.dialect.name != "postgresql":
+        raise ValueError("id layouts can only be benchmarked on postgres")
+
+    return [
+        benchmark_layout(layout, orders, merchants, batch_size) for layout in LAYOUTS
+    ]
@@ -0,0 +1,138 @@
+import json
+import click
+
+
+# flask cli commands for maintenance tasks, run with `flask <command>`
+
+
+def register_commands(app):
+    @app.cli.command("rebuild-order-index")
+    @click.option("--batch-size", default=5000, show_default=True)
+    def rebuild_order_index(batch_size):
+        """
+        rebuild the redis order existence index from the Order table
+        """
+
+        from project.order_index import rebuild_index
+
+        total = rebuild_index(batch_size=batch_size)
+        click.echo(f"indexed {total} order reference numbers")
+
+    @app.cli.command("order-index-stats")
+    def order_index_stats():
+        """
+        show the size of the order index and its hit/miss counters
+        """
+
+        from project.order_index import index_stats
+
+        click.echo(json.dumps(index_stats(), indent=4))
+
+    @app.cli.command("metrics")
+    def show_metrics():
+        """
+        dump every recorded counter and histogram
+        """
+
+        from project.metrics import snapshot
+
+        click.echo(json.dumps(snapshot(), indent=4))
+
+    @app.cli.command("refresh-bank-directory")
+    def refresh_bank_directory_command():
+        """
+        reload the cached bank directory from paystack
+        """
+
+        from project.api_services.bank_directory import refresh_bank_directory
+
+        click.echo(f"loaded {refresh_bank_directory()} banks")
+
+    @app.cli.command("rebuild-merchant-stats")
+    def rebuild_merchant_stats_command():
+        """
+        recompute every merchant's stats row from their orders and the ledger
+        """
+
+        from project.merchant_stats import rebuild_merchant_stats
+
+        click.echo(f"rebuilt stats for {rebuild_merchant_stats()} merchants")
+
+    @app.cli.command("create-timeline-partitions")
+    @click.option("--months-ahead", default=2, show_default=True)
+    def create_timeline_partitions_command(months_ahead):
+        """
+        create the monthly transaction timeline partitions up to months ahead
+        """
+
+        from project.timeline import ensure_timeline_partitions
+
+        for name in ensure_timeline_partitions(months_ahead=months_ahead):
+            click.echo(name)
+
+    @app.cli.command("drop-timeline-partitions")
+    @click.argument("before", type=click.DateTime(formats=["%Y-%m"]))
+    def drop_timeline_partitions_command(before):
+        """
+        drop the transaction timeline partitions for months before BEFORE (YYYY-MM)
+        """
+
+        from project.timeline import drop_timeline_partitions
+
+        dropped = drop_timeline_partitions(before)
+        click.echo(f"dropped {len(dropped)} partitions {dropped}")
+
+    @app.cli.command("seed-orders")
+    @click.option("--orders", default=100000, show_default=True)
+    @click.option("--merchants", default=50, show_default=True)
+    @click.option("--batch-size", default=5000, show_default=True)
+    def seed_orders_command(orders, merchants, batch_size):
+        """
+        fill the database with synthetic merchants and orders, never on production
+        """
+
+        from project.seed import seed_merchants, seed_orders
+
+        merchant_ids = seed_merchants(merchants)
+        total = seed_orders(merchant_ids, orders, batch_size=batch_size)
+        click.echo(f"seeded {total} orders for {len(merchant_ids)} merchants")
+
+    @app.cli.command("check-query-plans")
+    @click.option("--min-rows", default=10000, show_default=True)
+    def check_query_plans_command(min_rows):
+        """
+        EXPLAIN the queries of the read endpoints and fail on a Seq Scan of a large table
+        """
+
+        from project.query_plans import check_query_plans
+
+        try:
+            failures = check_query_plans(min_rows=min_rows)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+
+        for failure in failures:
+            click.echo(json.dumps(failure, indent=4))
+        if failures:
+            raise click.ClickException(f"{len(failures)} queries failed the plan check")
+        click.echo("no sequential scans on large tables")
+
+    @app.cli.command("benchmark-ids")
+    @click.option("--orders", default=1000000, show_default=True)
+    @click.option("--merchants", default=1000, show_default=True)
+    @click.option("--batch-size", default=10000, show_default=True)
+    def benchmark_ids_command(orders, merchants, batch_size):
+        """
+        compare insert throughput and index size of varchar and uuid primary keys
+        """
+
+        from project.benchmarks import benchmark_ids
+
+        try:
+            results = benchmark_ids(
+                orders=orders, merchants=merchants, batch_size=batch_size
+            )
+        except ValueError as e:
+            raise click.ClickException(str(e))
+
+        click.echo(json.dumps(results, indent=4))
@@ -0,0 +1,169 @@
+from datetime import datetime, timezone
+import redis
+from project import r_client
+
+
+# order deadlines (delivery, inspection, dispute and return windows) kept in
+# a redis sorted set scored by due timestamp. a deadline is registered when
+# the state transition that starts it happens, and the dispatcher job only
+# ever touches the members that are due, however many orders exist.
+# claimed deadlines sit in a second sorted set scored by lease expiry until
+# the dispatcher has committed their work, so a crash never loses one
+
+DEADLINES_KEY = "order_deadlines"
+DEADLINES_PROCESSING_KEY = "order_deadlines_processing"
+DEADLINE_LEASE_SECONDS = 300
+DEADLINE_HANDLERS = {}
+
+DELIVERY = "delivery"
+INSPECTION = "inspection"
+DISPUTE = "dispute"
+RETURN = "return"
+RETURN_INSPECTION = "return_inspection"
+
+DISPUTE_RESOLUTION_DAYS = 7
+
+
+def deadline_handler(kind: str):
+    """
+    register the function called with (order, now) when a deadline of
+    the given kind falls due
+    """
+
+    def decorator(f):
+        DEADLINE_HANDLERS[kind] = f
+        return f
+
+    return decorator
+
+
+def _timestamp(date: datetime) -> float:
+    return date.replace(tzinfo=timezone.utc).timestamp()
+
+
+def _member(kind: str, ref_no: str) -> str:
+    return f"{kind}:{ref_no}"
+
+
+def schedule_deadline(kind: str, ref_no: str, due_at: datetime):
+    """
+    register (or move) the deadline of the given kind for an order
+    """
+
+    try:
+        r_client.zadd(DEADLINES_KEY, {_member(kind, ref_no): _timestamp(due_at)})
+    except redis.exceptions.RedisError as e:
+        print(f"failed to schedule {kind} deadline for order {ref_no} -- {e}")
+
+
+def cancel_deadline(kind: str, ref_no: str):
+    try:
+        pipe = r_client.pipeline()
+        pipe.zrem(DEADLINES_KEY, _member(kind, ref_no))
+        pipe.zrem(DEADLINES_PROCESSING_KEY, _member(kind, ref_no))
+        pipe.execute()
+    except redis.exceptions.RedisError as e:
+        print(f"failed to cancel {kind} deadline for order {ref_no} -- {e}")
+
+
+def pop_due_deadlines(now: datetime, limit: int = 100) -> list:
+    """
+    claim up to limit deadlines that are due at now. the due members are
+    moved into the processing set with a lease in one MULTI, retried if
+    another dispatcher touched the set in between, so no two dispatchers
+    claim the same deadline. call ack_deadlines once the work is committed
+    or release_deadlines if it is not
+    """
+
+    due = []
+
+    def claim(pipe):
+        due[:] = pipe.zrangebyscore(
+            DEADLINES_KEY, "-inf", _timestamp(now), start=0, num=limit, withscores=True
+        )
+        pipe.multi()
+        if not due:
+            return
+
+        lease = _timestamp(now) + DEADLINE_LEASE_SECONDS
+        pipe.zrem(DEADLINES_KEY, *[member for member, _ in due])
+        pipe.zadd(DEADLINES_PROCESSING_KEY, {member: lease for member, _ in due})
+
+    r_client.transaction(claim, DEADLINES_KEY)
+
+    claimed = []
+    for member, score in due:
+        kind, ref_no = member.split(":", 1)
+        due_at = datetime.fromtimestamp(score, timezone.utc).replace(tzinfo=None)
+        claimed.append((kind, ref_no, due_at))
+
+    return claimed
+
+
+def ack_deadlines(claimed: list):
+    """
+    drop claimed deadlines from the processing set once their work is
+    committed. if this fails the lease runs out and they fire again, which
+    the handlers tolerate as they check the order state first
+    """
+
+    if not claimed:
+        return
+
+    try:
+        r_client.zrem(
+            DEADLINES_PROCESSING_KEY,
+            *[_member(kind, ref_no) for kind, ref_no, _ in claimed],
+        )
+    except redis.exceptions.RedisError as e:
+        print(f"failed to acknowledge {len(claimed)} order deadlines -- {e}")
+
+
+def release_deadlines(claimed: list):
+    """
+    put claimed deadlines back with their original due time, used when
+    the work done for them could not be committed
+    """
+
+    if not claimed:
+        return
+
+    try:
+        pipe = r_client.pipeline()
+        pipe.zadd(
+            DEADLINES_KEY,
+            {
+                _member(kind, ref_no): _timestamp(due_at)
+                for kind, ref_no, due_at in claimed
+            },
+        )
+        pipe.zrem(
+            DEADLINES_PROCESSING_KEY,
+            *[_member(kind, ref_no) for kind, ref_no, _ in claimed],
+        )
+        pipe.execute()
+    except redis.exceptions.RedisError as e:
+        print(f"failed to release {len(claimed)} order deadlines -- {e}")
+
+
+def recover_expired_deadlines(now: datetime) -> int:
+    """
+    move deadlines whose lease ran out, because the dispatcher holding them
+    died before acknowledging, back into the deadline set as due now
+    """
+
+    expired = []
+
+    def recover(pipe):
+        expired[:] = pipe.zrangebyscore(
+            DEADLINES_PROCESSING_KEY, "-inf", _timestamp(now)
+        )
+        pipe.multi()
+        if not expired:
+            return
+
+        pipe.zrem(DEADLINES_PROCESSING_KEY, *expired)
+        pipe.zadd(DEADLINES_KEY, {member: _timestamp(now) for member in expired})
+
+    r_client.transaction(recover, DEADLINES_PROCESSING_KEY)
+    return len(expired)
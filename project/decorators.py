@@ -1,11 +1,18 @@
 from datetime import datetime
+import hashlib
+import hmac
+import json
+import time
+import redis
 
 from flask_jwt_extended import current_user, get_jwt
 from functools import wraps
-from flask import jsonify
+from flask import jsonify, g, make_response
 from flask import request
 from project import r_client, db
-from project.helpers import redis_confirmation
+from project import metrics
+from project.loaders import load_order
+from project.merchant_cache import hash_api_key
 
 
 def api_secret_key_required(f):
@@ -14,7 +21,13 @@ def api_secret_key_required(f):
 
         api_private_key = request.headers.get("X-API-Key")
 
-        if not api_private_key == current_user.merchant_details.api_secret_key:
+        expected_hash = g.get("merchant_api_key_hash") or hash_api_key(
+            current_user.merchant_details.api_secret_key
+        )
+
+        if not api_private_key or not hmac.compare_digest(
+            hash_api_key(api_private_key), expected_hash
+        ):
             return jsonify({"status": "error", "data": "unauthorized access"}), 401
 
         return f(*args, **kwargs)
@@ -22,28 +35,23 @@ def api_secret_key_required(f):
     return decorated_function
 
 
-def order_exists(f):
-    from project.merchants.models import Order
+def order_exists(f=None, *, load: tuple = ()):
+    """
+    reject requests for unknown orders and load the order for the view.
+    can be used bare or as @order_exists(load=(...)) to eager load the
+    relationships the view is going to touch
+    """
+
+    from project.order_index import reference_exists
+
+    if f is None:
+        return lambda func: order_exists(func, load=load)
 
     @wraps(f)
     def decorated_function(*args, **kwargs):
 
         ref_no = kwargs.get("ref_no")
-        confirmed = redis_confirmation()
-        if not confirmed:
-            target_order = Order.query.filter_by(reference_no=ref_no).first()
-
-            if not target_order:
-                return (
-                    jsonify(
-                        {"status": "error", "message": f"order {ref_no} doesn't exist"}
-                    ),
-                    400,
-                )
-            return f(*args, **kwargs)
-
-        orders = r_client.lrange("order_ref_nos", 0, -1)
-        if ref_no not in orders:
+        if not reference_exists(ref_no) or not load_order(ref_no, load):
             return (
                 jsonify(
                     {"status": "error", "message": f"order {ref_no} doesn't exist"}
@@ -56,28 +64,11 @@ def order_exists(f):
 
 
 def to_be_returned(f):
-    from project.merchants.models import Order
-
     @wraps(f)
     def decorated_function(*args, **kwargs):
         ref_no = kwargs.get("ref_no")
-        confirmed = redis_confirmation()
-        if not confirmed:
-            target_order = Order.query.filter_by(reference_no=ref_no).first()
-            if not target_order.product_to_be_returned:
-                return (
-                    jsonify(
-                        {
-                            "status": "error",
-                            "message": f"order {ref_no} is not set to be returned",
-                        }
-                    ),
-                    400,
-                )
-            return f(*args, **kwargs)
-
-        to_return = r_client.get(f"return_{ref_no}")
-        if not to_return or to_return == None:
+        target_order = load_order(ref_no)
+        if not target_order or not target_order.product_to_be_returned:
             return (
                 jsonify(
                     {
@@ -90,3 +81,187 @@ def to_be_returned(f):
         return f(*args, **kwargs)
 
     return decorated_function
+
+
+def query_budget(max_statements: int):
+    """
+    expected number of SQL statements for a route, requests that go over
+    it are logged and counted when the response is sent
+    """
+
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            g.query_budget = max_statements
+            return f(*args, **kwargs)
+
+        return decorated_function
+
+    return decorator
+
+
+IDEMPOTENCY_KEY_PREFIX = "idempotency:"
+# longer than the slowest guarded view can run: a paystack payout and a
+# korapay fallback at up to 33s each, plus lock waits and database work
+IDEMPOTENCY_IN_FLIGHT_TTL = 5 * 60
+IDEMPOTENCY_RESULT_TTL = 60 * 60 * 24
+IDEMPOTENCY_WAIT_SECONDS = 10
+
+
+def provider_call_started():
+    """
+    mark that the view is about to call a payment provider. from here on
+    a failed request is kept under its idempotency key like a successful
+    one, since a retry could move the money a second time
+    """
+
+    g.idempotency_side_effect = True
+
+
+def _store_idempotent_result(cache_key: str, entry: dict):
+    try:
+        r_client.set(cache_key, json.dumps(entry), ex=IDEMPOTENCY_RESULT_TTL)
+    except redis.exceptions.RedisError as e:
+        print(f"failed to store idempotent result {cache_key} -- {e}")
+        metrics.incr("idempotency.store_failed")
+
+
+def _release_idempotency_key(cache_key: str):
+    try:
+        r_client.delete(cache_key)
+    except redis.exceptions.RedisError as e:
+        print(f"failed to release idempotency key {cache_key} -- {e}")
+
+
+def idempotent(f):
+    """
+    honour an Idempotency-Key header. the first request with a key runs
+    the view and its response is kept in redis for a day, replays of the
+    key get that response back without the view running again. a
+    duplicate that arrives while the first is still running waits for it.
+    failures are released for a retry unless the view already called a
+    payment provider, see provider_call_started. requests without the
+    header are not affected
+    """
+
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+
+        idempotency_key = request.headers.get("Idempotency-Key")
+        if not idempotency_key:
+            return f(*args, **kwargs)
+
+        cache_key = f"{IDEMPOTENCY_KEY_PREFIX}{current_user.id}:{request.endpoint}:{idempotency_key}"
+        fingerprint = hashlib.sha256(
+            request.method.encode("utf-8")
+            + request.path.encode("utf-8")
+            + request.get_data()
+        ).hexdigest()
+
+        try:
+            claimed = r_client.set(
+                cache_key,
+                json.dumps({"state": "in_flight", "fingerprint": fingerprint}),
+                nx=True,
+                ex=IDEMPOTENCY_IN_FLIGHT_TTL,
+            )
+        except redis.exceptions.RedisError as e:
+            print(f"idempotency store unavailable -- {e}")
+            return f(*args, **kwargs)
+
+        if claimed:
+            g.idempotency_side_effect = False
+            try:
+                response = make_response(f(*args, **kwargs))
+            except Exception:
+                if g.idempotency_side_effect:
+                    _store_idempotent_result(
+                        cache_key,
+                        {
+                            "state": "done",
+                            "fingerprint": fingerprint,
+                            "status": 500,
+                            "body": json.dumps(
+                                {"status": "error", "message": "something went wrong"}
+                            ),
+                            "content_type": "application/json",
+                        },
+                    )
+                else:
+                    _release_idempotency_key(cache_key)
+                raise
+
+            # server errors before any provider call are released so the
+            # client can retry them, after one they are kept
+            if response.status_code >= 500 and not g.idempotency_side_effect:
+                _release_idempotency_key(cache_key)
+                return response
+
+            if response.status_code >= 500:
+                metrics.incr(f"idempotency.failure_kept.{request.endpoint}")
+
+            _store_idempotent_result(
+                cache_key,
+                {
+                    "state": "done",
+                    "fingerprint": fingerprint,
+                    "status": response.status_code,
+                    "body": response.get_data(as_text=True),
+                    "content_type": response.content_type,
+                },
+            )
+            return response
+
+        deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+        while True:
+            try:
+                entry = r_client.get(cache_key)
+            except redis.exceptions.RedisError as e:
+                print(f"idempotency store unavailable -- {e}")
+                return (
+                    jsonify(
+                        {
+                            "status": "error",
+                            "message": "a request with this idempotency key may still be in progress, retry later",
+                        }
+                    ),
+                    409,
+                )
+            entry = json.loads(entry) if entry else None
+
+            if entry and entry["fingerprint"] != fingerprint:
+                return (
+                    jsonify(
+                        {
+                            "status": "error",
+                            "message": "idempotency key was used for a different request",
+                        }
+                    ),
+                    422,
+                )
+
+            if entry and entry["state"] == "done":
+                metrics.incr(f"idempotency.replayed.{request.endpoint}")
+                response = make_response(entry["body"], entry["status"])
+                response.content_type = entry["content_type"]
+                response.headers["Idempotent-Replayed"] = "true"
+                return response
+
+            if not entry:
+                # the first request failed, let this one run it instead
+                return decorated_function(*args, **kwargs)
+
+            if time.monotonic() >= deadline:
+                return (
+                    jsonify(
+                        {
+                            "status": "error",
+                            "message": "a request with this idempotency key is still in progress",
+                        }
+                    ),
+                    409,
+                )
+
+            time.sleep(0.1)
+
+    return decorated_function
@@ -39,13 +39,40 @@ from ..merchants.models import (
     DisputeSchema,
     ProductReturn,
 )
-from ..decorators import api_secret_key_required, order_exists, to_be_returned
+from ..decorators import (
+    api_secret_key_required,
+    order_exists,
+    to_be_returned,
+    query_budget,
+    idempotent,
+    provider_call_started,
+)
+from ..loaders import load_order
+from ..order_status import OrderStatus, can_transition, transition
+from ..timeline import TimelineEvent
+from ..deadlines import (
+    schedule_deadline,
+    cancel_deadline,
+    DISPUTE,
+    DISPUTE_RESOLUTION_DAYS,
+    INSPECTION,
+    RETURN,
+    RETURN_INSPECTION,
+)
 from ..api_services.paystack_api import PaystackClient
 from ..api_services.kora_api import KoraClient
+from ..fees import from_kobo
 from project import db, jwt, bcrypt, r_client
+from project import ledger
 
 load_dotenv()
 
+CONCLUSION_STATUSES = {
+    "accepted": OrderStatus.INSPECTION,
+    "rejected": OrderStatus.RETURNING,
+    "unresolved": OrderStatus.ARBITRATION,
+}
+
 
 @dispute.post("raise_issue/<ref_no>")
 @jwt_required()
@@ -57,9 +84,18 @@ def raise_issue(ref_no):
         data = request.get_json()
         con_id = data.get("condition_disputed")
 
-        target_order = Order.query.filter_by(reference_no=ref_no).first()
+        target_order = load_order(ref_no)
         target_condition = TransactionCondition.query.filter_by(id=con_id).first()
 
+        if not can_transition(target_order, OrderStatus.DISPUTED):
+            return (
+                jsonify(
+                    status="error",
+                    message=f"order can't be disputed while {target_order.status.value}",
+                ),
+                400,
+            )
+
         if target_order.conditions_met:
             return (
                 jsonify(
@@ -81,6 +117,7 @@ def raise_issue(ref_no):
 
             new_timeline_con = TransactionTimeline(
                 event_occurrance=f"Dispute raised on condition {con_id}",
+                event_code=TimelineEvent.CONDITION_DISPUTED,
                 category="Dispute",
                 order=target_order,
             )
@@ -105,23 +142,30 @@ def raise_issue(ref_no):
             event_occurrance=f"Dispute raised on product {ref_no}"
             if not target_order.dispute_raised
             else f"Dispute issue added on product {ref_no}",
+            event_code=TimelineEvent.DISPUTE_RAISED,
             category="Dispute",
             order=target_order,
         )
 
+        first_dispute = not target_order.dispute_raised
         target_order.date_updated = datetime.utcnow()
         target_order.dispute_raised = True
         target_order.dispute_raised_date = (
-            datetime.utcnow()
-            if not target_order.dispute_raised
-            else target_order.dispute_raised_date
+            datetime.utcnow() if first_dispute else target_order.dispute_raised_date
         )
-        target_order.dispute_time_triggered = True
-        target_order.dispute_ongoing = True
+        transition(target_order, OrderStatus.DISPUTED)
 
         db.session.add_all([new_dispute, new_timeline])
         db.session.commit()
 
+        if first_dispute:
+            schedule_deadline(
+                DISPUTE,
+                ref_no,
+                target_order.dispute_raised_date
+                + timedelta(days=DISPUTE_RESOLUTION_DAYS),
+            )
+
         # notify merchant that an issue has been raised concerning the product
         # ensure to include logic to pause the inspection time as a dispute will verify inspection
 
@@ -134,12 +178,13 @@ def raise_issue(ref_no):
 
 
 @dispute.get("get_dispute/<ref_no>/<id>")
+@query_budget(3)
 @jwt_required()
 @api_secret_key_required
 @order_exists
 def get_dispute(ref_no, id):
     try:
-        target_order = Order.query.filter_by(reference_no=ref_no).first()
+        target_order = load_order(ref_no)
 
         target_dispute = Dispute.query.filter_by(order=target_order, id=id).first()
 
@@ -171,12 +216,13 @@ def get_dispute(ref_no, id):
 
 
 @dispute.get("get_disputes/<ref_no>")
+@query_budget(3)
 @jwt_required()
 @api_secret_key_required
 @order_exists
 def get_disputes(ref_no):
     try:
-        target_order = Order.query.filter_by(reference_no=ref_no).first()
+        target_order = load_order(ref_no)
 
         target_disputes = Dispute.query.filter_by(order=target_order).all()
 
@@ -213,7 +259,7 @@ def get_disputes(ref_no):
 @order_exists
 def resolve_dispute(ref_no, id):
     try:
-        target_order = Order.query.filter_by(reference_no=ref_no).first()
+        target_order = load_order(ref_no)
 
         if target_order.dispute_resloved:
             return (
@@ -223,6 +269,15 @@ def resolve_dispute(ref_no, id):
                 400,
             )
 
+        if not can_transition(target_order, OrderStatus.DISPUTE_RESOLVED):
+            return (
+                jsonify(
+                    status="error",
+                    message=f"order has no disputes to resolve while {target_order.status.value}",
+                ),
+                400,
+            )
+
         target_dispute = Dispute.query.filter_by(id=id, order=target_order).first()
 
         if target_dispute.dispute_resolved:
@@ -249,6 +304,7 @@ def resolve_dispute(ref_no, id):
             target_con.dispute_settled = True
             new_timeline_con = TransactionTimeline(
                 event_occurrance=f"Dispute on condition {target_con.id} has been successfuly settled for dispute {target_dispute.id}",
+                event_code=TimelineEvent.CONDITION_DISPUTE_SETTLED,
                 category="Dispute",
                 order=target_order,
             )
@@ -261,6 +317,7 @@ def resolve_dispute(ref_no, id):
 
         new_timeline = TransactionTimeline(
             event_occurrance=f"Dispute '{target_dispute.dispute_title}' on product {ref_no} successfully resolved",
+            event_code=TimelineEvent.DISPUTE_RESOLVED,
             category="Dispute",
             order=target_order,
         )
@@ -270,15 +327,17 @@ def resolve_dispute(ref_no, id):
         )
 
         if all_verified:
-            target_order.dispute_resloved = True
             target_order.date_updated = datetime.utcnow()
+            transition(target_order, OrderStatus.DISPUTE_RESOLVED)
             new_timeline1 = TransactionTimeline(
                 event_occurrance=f"All disputes for order {ref_no} have successfully been resolved... awaiting dispute conclusion",
+                event_code=TimelineEvent.DISPUTES_RESOLVED,
                 category="Dispute",
                 order=target_order,
             )
             db.session.add(new_timeline1)
             db.session.commit()
+            cancel_deadline(DISPUTE, ref_no)
 
         db.session.add(new_timeline)
         db.session.commit()
@@ -296,10 +355,10 @@ def resolve_dispute(ref_no, id):
 @dispute.put("resolve_all_disputes/<ref_no>")
 @jwt_required()
 @api_secret_key_required
-@order_exists
+@order_exists(load=("dispute",))
 def resolve_all_disputes(ref_no):
     try:
-        target_order = Order.query.filter_by(reference_no=ref_no).first()
+        target_order = load_order(ref_no)
 
         if target_order.dispute_resloved:
             return (
@@ -309,6 +368,15 @@ def resolve_all_disputes(ref_no):
                 400,
             )
 
+        if not can_transition(target_order, OrderStatus.DISPUTE_RESOLVED):
+            return (
+                jsonify(
+                    status="error",
+                    message=f"order has no disputes to resolve while {target_order.status.value}",
+                ),
+                400,
+            )
+
         for dispute in target_order.dispute:
             if dispute.dispute_resolved == False:
                 target_con = (
@@ -325,6 +393,7 @@ def resolve_all_disputes(ref_no):
                         target_con.dispute_settled = True
                         new_timeline_con = TransactionTimeline(
                             event_occurrance=f"Dispute on condition {target_con.id} has been successfuly settled for dispute {dispute.id}",
+                            event_code=TimelineEvent.CONDITION_DISPUTE_SETTLED,
                             category="Dispute",
                             order=target_order,
                         )
@@ -334,21 +403,24 @@ def resolve_all_disputes(ref_no):
                 dispute.dispute_resolved_date = datetime.utcnow()
                 new_timeline1 = TransactionTimeline(
                     event_occurrance=f"Dispute '{dispute.dispute_title}' on product {ref_no} successfully resolved",
+                    event_code=TimelineEvent.DISPUTE_RESOLVED,
                     category="Dispute",
                     order=target_order,
                 )
 
                 db.session.add(new_timeline1)
 
-        target_order.dispute_resloved = True
         target_order.date_updated = datetime.utcnow()
+        transition(target_order, OrderStatus.DISPUTE_RESOLVED)
         new_timeline = TransactionTimeline(
             event_occurrance=f"All disputes for order {ref_no} have successfully been resolved... awaiting dispute conclusion",
+            event_code=TimelineEvent.DISPUTES_RESOLVED,
             category="Dispute",
             order=target_order,
         )
         db.session.add(new_timeline)
         db.session.commit()
+        cancel_deadline(DISPUTE, ref_no)
 
         return (
             jsonify(status="success", message="successfully resolved all disputes"),
@@ -364,10 +436,10 @@ def resolve_all_disputes(ref_no):
 @dispute.post("add_dispute_conclusion/<ref_no>")
 @jwt_required()
 @api_secret_key_required
-@order_exists
+@order_exists(load=("order_details", "transaction_condition"))
 def add_dispute_conclusion(ref_no):
     try:
-        target_order = Order.query.filter_by(reference_no=ref_no).first()
+        target_order = load_order(ref_no)
 
         if not target_order.dispute_resloved:
             return (
@@ -381,6 +453,16 @@ def add_dispute_conclusion(ref_no):
         data = request.get_json()
         conclusion = data.get("dispute_conclusion").lower()
 
+        concluded_status = CONCLUSION_STATUSES.get(conclusion)
+        if concluded_status and not can_transition(target_order, concluded_status):
+            return (
+                jsonify(
+                    status="error",
+                    message=f"dispute already concluded as {target_order.dispute_conclusion}",
+                ),
+                400,
+            )
+
         if conclusion == "accepted":
 
             for condition in target_order.transaction_condition:
@@ -391,6 +473,7 @@ def add_dispute_conclusion(ref_no):
                     condition.date_met = datetime.utcnow()
                     new_timeline_con = TransactionTimeline(
                         event_occurrance=f"Condition {condition.id} has been confirmed as met via resolved dispute",
+                        event_code=TimelineEvent.CONDITION_MET,
                         category="Dispute Conclusion",
                         order=target_order,
                     )
@@ -399,6 +482,7 @@ def add_dispute_conclusion(ref_no):
 
             new_timeline_accept = TransactionTimeline(
                 event_occurrance=f"Dsipute was concluded and product was accepted",
+                event_code=TimelineEvent.DISPUTE_ACCEPTED,
                 category="Dispute Conclusion",
                 order=target_order,
             )
@@ -406,8 +490,15 @@ def add_dispute_conclusion(ref_no):
             db.session.add(new_timeline_accept)
             target_order.conditions_met = True
             target_order.dispute_conclusion = "accepted"
+            transition(target_order, OrderStatus.INSPECTION)
+            # back into inspection with a fresh window, the sweep and the
+            # deadline dispatcher only see orders with a deadline ahead
+            target_order.inspection_deadline_at = datetime.utcnow() + timedelta(
+                days=target_order.order_details.product_inspection_time
+            )
             target_order.date_updated = datetime.utcnow()
             db.session.commit()
+            schedule_deadline(INSPECTION, ref_no, target_order.inspection_deadline_at)
             return (
                 jsonify(
                     status="success",
@@ -429,23 +520,27 @@ def add_dispute_conclusion(ref_no):
 
             new_product_return = ProductReturn(
                 time_for_return=int(time),
-                amount_to_refund=target_order.order_details.amount_remaining_to_be_disbursed,
+                amount_to_refund=from_kobo(ledger.get_balance(target_order.id).escrow),
                 order=target_order,
             )
             target_order.dispute_conclusion = "rejected"
-            target_order.product_to_be_returned = True
-            target_order.product_return_commenced = True
+            transition(target_order, OrderStatus.RETURNING)
             target_order.date_updated = datetime.utcnow()
 
-            r_client.set(f"return_{ref_no}", True)
             new_timeline_return = TransactionTimeline(
                 event_occurrance=f"Product {ref_no} was rejected and product return has commenced",
+                event_code=TimelineEvent.DISPUTE_REJECTED,
                 category="Dispute Conclusion",
                 order=target_order,
             )
 
             db.session.add_all([new_product_return, new_timeline_return])
             db.session.commit()
+            schedule_deadline(
+                RETURN,
+                ref_no,
+                new_product_return.date_initiated_return + timedelta(days=int(time)),
+            )
             return (
                 jsonify(
                     status="success",
@@ -457,12 +552,13 @@ def add_dispute_conclusion(ref_no):
         if conclusion == "unresolved":
             new_timeline_unresolved = TransactionTimeline(
                 event_occurrance=f"Dispute on order {ref_no} was unresolved and arbitration required",
+                event_code=TimelineEvent.DISPUTE_UNRESOLVED,
                 category="Dispute Conclusion",
                 order=target_order,
             )
 
             target_order.dispute_conclusion = "unresolved"
-            target_order.arbitation_required = True
+            transition(target_order, OrderStatus.ARBITRATION)
             target_order.date_updated = datetime.utcnow()
             db.session.add(new_timeline_unresolved)
             db.session.commit()
@@ -483,11 +579,11 @@ def add_dispute_conclusion(ref_no):
 @dispute.post("confirm_return_sendout/<ref_no>")
 @jwt_required()
 @api_secret_key_required
-@order_exists
+@order_exists(load=("product_return", "customer"))
 @to_be_returned
 def confirm_return_sendout(ref_no):
     try:
-        target_order = Order.query.filter_by(reference_no=ref_no).first()
+        target_order = load_order(ref_no)
         if target_order.product_return.product_sent_out:
             return (
                 jsonify(status="error", message="product has already been sent out"),
@@ -520,12 +616,14 @@ def confirm_return_sendout(ref_no):
 
         new_timeline = TransactionTimeline(
             event_occurrance=f"Product {ref_no} has been sent out for return",
+            event_code=TimelineEvent.RETURN_SENT_OUT,
             category="Product Return",
             order=target_order,
         )
 
         db.session.add_all([new_delivery, new_timeline])
         db.session.commit()
+        cancel_deadline(RETURN, ref_no)
 
         return (
             jsonify(
@@ -544,11 +642,11 @@ def confirm_return_sendout(ref_no):
 @dispute.put("buyer_confirm_return/<ref_no>")
 @jwt_required()
 @api_secret_key_required
-@order_exists
+@order_exists(load=("product_return",))
 @to_be_returned
 def buyer_confirm_return(ref_no):
     try:
-        target_order = Order.query.filter_by(reference_no=ref_no).first()
+        target_order = load_order(ref_no)
 
         if target_order.product_return_confirm_buyer:
             return (
@@ -559,13 +657,13 @@ def buyer_confirm_return(ref_no):
                 400,
             )
 
-        target_order.product_return_confirm_buyer = True
-        target_order.product_return.buyer_confirm_delivery = True
+        target_order.product_return.buyer_confirm_return = True
         target_order.product_return.date_buyer_confirm_return = datetime.utcnow()
         target_order.date_updated = datetime.utcnow()
 
         new_timeline = TransactionTimeline(
             event_occurrance=f"Return of product {ref_no} has been successfully marked as delivered by the buyer",
+            event_code=TimelineEvent.RETURN_CONFIRMED_BUYER,
             category="Product Return",
             order=target_order,
         )
@@ -589,11 +687,11 @@ def buyer_confirm_return(ref_no):
 @dispute.put("seller_confirm_return/<ref_no>")
 @jwt_required()
 @api_secret_key_required
-@order_exists
+@order_exists(load=("product_return",))
 @to_be_returned
 def seller_confirm_return(ref_no):
     try:
-        target_order = Order.query.filter_by(reference_no=ref_no).first()
+        target_order = load_order(ref_no)
 
         if target_order.product_return_confirm_seller:
             return (
@@ -604,11 +702,9 @@ def seller_confirm_return(ref_no):
                 400,
             )
 
-        target_order.product_return_confirm_buyer = True
-        target_order.product_return.buyer_confirm_delivery = True
+        target_order.product_return.buyer_confirm_return = True
         target_order.product_return.date_buyer_confirm_return = datetime.utcnow()
-        target_order.product_return_confirm_seller = True
-        target_order.product_return.seller_confirm_delivery = True
+        target_order.product_return.seller_confirm_return = True
         target_order.product_return.date_seller_confirm_return = datetime.utcnow()
         target_order.product_return.returned_product_inspection_time_triggered = True
         target_order.product_return.date_returned_product_inspection_time_triggered = (
@@ -618,12 +714,21 @@ def seller_confirm_return(ref_no):
 
         new_timeline = TransactionTimeline(
             event_occurrance=f"Return of product {ref_no} has been successfully marked as delivered by the seller",
+            event_code=TimelineEvent.RETURN_CONFIRMED_SELLER,
             category="Product Return",
             order=target_order,
         )
 
         db.session.add(new_timeline)
         db.session.commit()
+        schedule_deadline(
+            RETURN_INSPECTION,
+            ref_no,
+            target_order.product_return.date_returned_product_inspection_time_triggered
+            + timedelta(
+                days=target_order.product_return.returned_product_inspection_time or 1
+            ),
+        )
 
         return (
             jsonify(
@@ -641,11 +746,11 @@ def seller_confirm_return(ref_no):
 @dispute.put("accept_return_conditions/<ref_no>")
 @jwt_required()
 @api_secret_key_required
-@order_exists
+@order_exists(load=("product_return",))
 @to_be_returned
 def accept_return_conditions(ref_no):
     try:
-        target_order = Order.query.filter_by(reference_no=ref_no).first()
+        target_order = load_order(ref_no)
 
         if not target_order.product_return_confirm_seller:
             return (
@@ -666,23 +771,26 @@ def accept_return_conditions(ref_no):
             )
 
         target_order.product_return.seller_accept_return_condition = True
-        target_order.product_return_complete.product_return_complete = True
+        target_order.product_return.product_return_complete = True
         target_order.product_return.date_of_completion = datetime.utcnow()
         new_timelin_acc = TransactionTimeline(
             event_occurrance=f"Conditions of the return of product {ref_no} has been successfully accepted",
+            event_code=TimelineEvent.RETURN_ACCEPTED,
             category="Product Return",
             order=target_order,
         )
 
-        target_order.refund_approved = True
+        transition(target_order, OrderStatus.REFUND_APPROVED)
         target_order.date_updated = datetime.utcnow()
         new_timeline_ref = TransactionTimeline(
             event_occurrance=f"Refund of funds for product {ref_no} has been successfully approved",
+            event_code=TimelineEvent.REFUND_APPROVED,
             category="Refund",
             order=target_order,
         )
         db.session.add_all([new_timelin_acc, new_timeline_ref])
         db.session.commit()
+        cancel_deadline(RETURN_INSPECTION, ref_no)
 
         return (
             jsonify(
@@ -701,11 +809,12 @@ def accept_return_conditions(ref_no):
 @dispute.put("initiate_refund/<ref_no>")
 @jwt_required()
 @api_secret_key_required
-@order_exists
+@idempotent
+@order_exists(load=("product_return", "customer"))
 @to_be_returned
 def initiate_refund(ref_no):
     try:
-        target_order = Order.query.filter_by(reference_no=ref_no).first()
+        target_order = load_order(ref_no)
 
         if not target_order.refund_approved:
             return (
@@ -724,9 +833,26 @@ def initiate_refund(ref_no):
                 400,
             )
 
-        amount_to_refund = target_order.product_return.amount_to_refund
+        # checked before any money moves, nothing may fail once the refund
+        # has been sent
+        if not can_transition(target_order, OrderStatus.REFUNDING):
+            return (
+                jsonify(
+                    status="error",
+                    message=f"order can't be refunded while {target_order.status.value}",
+                ),
+                400,
+            )
+
+        # whatever escrow still holds goes back to the buyer
+        amount_to_refund = ledger.get_balance(target_order.id).escrow
+        if not amount_to_refund:
+            return (
+                jsonify(status="error", message="nothing left to refund for order"),
+                400,
+            )
+
         customer = target_order.customer
-        p_amount_to_refund = amount_to_refund * 100
         customer_name = (
             f"{target_order.customer.last_name} {target_order.customer.first_name}"
         )
@@ -740,10 +866,11 @@ def initiate_refund(ref_no):
             "reason": reason,
             "curreny": "NGN",
             "recipient": customer.receipient_code,
-            "amount": p_amount_to_refund,
+            "amount": amount_to_refund,
             "reference": pk_ref,
         }
 
+        provider_call_started()
         response, stat_code = p_client.initiate_payout(payload=payload)
         if stat_code == 400:
             # USING KORAPAY TO IMMEDIATELY SEND OUT MONEY IF PAYSTACK DOESNT WORK
@@ -753,7 +880,7 @@ def initiate_refund(ref_no):
                 "reference": k_ref,
                 "destination": {
                     "type": "bank_account",
-                    "amount": amount_to_refund,
+                    "amount": from_kobo(amount_to_refund),
                     "currency": "NGN",
                     "narration": reason,
                     "bank_account": {
@@ -772,11 +899,11 @@ def initiate_refund(ref_no):
             if k_response["status"] and k_stat_code == 200:
                 r_client.set(k_ref, ref_no)
 
-                target_order.refund_initiated = True
-                target_order.refund_processing = True
+                transition(target_order, OrderStatus.REFUNDING)
                 target_order.date_updated = datetime.utcnow()
                 new_timeline = TransactionTimeline(
                     event_occurrance=f"Refund have been successfully initiated with ref_no {k_ref}",
+                    event_code=TimelineEvent.REFUND_INITIATED,
                     category="Refund",
                     order=target_order,
                 )
@@ -811,11 +938,11 @@ def initiate_refund(ref_no):
                 "transfer_code": response["data"]["transfer_code"],
             }
             r_client.set(pk_ref, json.dumps(info_dict))
-            target_order.refund_initiated = True
-            target_order.refund_processing = True
+            transition(target_order, OrderStatus.REFUNDING)
             target_order.date_updated = datetime.utcnow()
             new_timeline = TransactionTimeline(
                 event_occurrance=f"Refund have been successfully initiated with ref_no {pk_ref}",
+                event_code=TimelineEvent.REFUND_INITIATED,
                 category="Refund",
                 order=target_order,
             )
@@ -0,0 +1,201 @@
+import time
+from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from project import db
+from project import metrics
+
+
+# transactional email outbox. queue_email adds the email to the current
+# session so it is committed together with the change it reports on, and
+# it is handed to celery only once that commit succeeds. a failed send is
+# retried with backoff, after MAX_EMAIL_ATTEMPTS the email is dead-lettered.
+# emails of the bulk templates queued in one commit go out together in one
+# BulkMailer send, retries are sent one by one
+
+MAX_EMAIL_ATTEMPTS = 5
+
+
+def _send_payment_confirmation(mailer, recipient, payload):
+    return mailer.send_payment_confirmation_mail(recipient, payload)
+
+
+def _send_verification(mailer, recipient, payload):
+    return mailer.send_verification_mail(
+        recipient, payload["name"], token=payload["token"]
+    )
+
+
+def _send_bulk(template: str, recipients: list) -> dict:
+    from project.api_services.sendgrid_api import BulkMailer
+
+    subject, file_name = BULK_TEMPLATES[template]
+    return BulkMailer().send(subject, file_name, recipients)
+
+
+def _send_inspection_reminder(mailer, recipient, payload):
+    outcome = _send_bulk("inspection_reminder", [{"email": recipient, **payload}])[
+        recipient
+    ]
+    return outcome, outcome["status_code"] if outcome["status"] == "sent" else 500
+
+
+EMAIL_SENDERS = {
+    "payment_confirmation": _send_payment_confirmation,
+    "verification": _send_verification,
+    "inspection_reminder": _send_inspection_reminder,
+}
+
+# subject and template file of the emails sent in bulk. their payloads are
+# substituted into the subject and html as they are, so values must be
+# escaped when the email is queued
+BULK_TEMPLATES = {
+    "inspection_reminder": (
+        "Please inspect your order by -inspection_deadline-",
+        "emailInspectionReminder.html",
+    ),
+}
+
+
+def queue_email(template: str, recipient: str, payload: dict):
+    from project.merchants.models import EmailOutbox
+
+    email = EmailOutbox(template=template, recipient=recipient, payload=payload)
+    db.session.add(email)
+    return email
+
+
+def deliver_email(outbox_id: str) -> str:
+    """
+    send a queued email. returns its status afterwards, pending means the
+    send failed and should be retried. emails already sent, dead-lettered
+    or being sent by another worker are skipped
+    """
+
+    from project.merchants.models import EmailOutbox
+    from project.api_services.sendgrid_api import Mailer
+
+    email = (
+        EmailOutbox.query.filter_by(id=outbox_id, status="pending")
+        .with_for_update(skip_locked=True)
+        .first()
+    )
+    if not email:
+        db.session.rollback()
+        return "skipped"
+
+    started = time.perf_counter()
+    try:
+        data, status_code = EMAIL_SENDERS[email.template](
+            Mailer(), email.recipient, email.payload
+        )
+        error = None if status_code < 300 else f"{status_code} -- {data}"
+    except Exception as e:
+        error = str(e)
+    metrics.observe(
+        f"email.{email.template}.send_ms", (time.perf_counter() - started) * 1000
+    )
+
+    record_attempt(email, error)
+    status = email.status
+    db.session.commit()
+    return status
+
+
+def deliver_bulk_emails(outbox_ids: list) -> dict:
+    """
+    send queued emails of the bulk templates, one BulkMailer send per
+    template. returns the status of each email afterwards, emails already
+    sent, dead-lettered or being sent by another worker are skipped
+    """
+
+    from project.merchants.models import EmailOutbox
+
+    emails = (
+        EmailOutbox.query.filter(
+            EmailOutbox.id.in_(outbox_ids), EmailOutbox.status == "pending"
+        )
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+
+    by_template = {}
+    for email in emails:
+        by_template.setdefault(email.template, []).append(email)
+
+    for template, group in by_template.items():
+        started, failure = time.perf_counter(), None
+        try:
+            outcomes = _send_bulk(
+                template,
+                [{"email": email.recipient, **email.payload} for email in group],
+            )
+        except Exception as e:
+            outcomes, failure = {}, str(e)
+        metrics.observe(
+            f"email.{template}.send_ms", (time.perf_counter() - started) * 1000
+        )
+
+        for email in group:
+            outcome = outcomes.get(email.recipient, {"error": failure})
+            sent = outcome.get("status") == "sent"
+            record_attempt(email, None if sent else outcome["error"] or "not sent")
+
+    statuses = {email.id: email.status for email in emails}
+    db.session.commit()
+    return statuses
+
+
+def record_attempt(email, error: str = None):
+    email.attempts += 1
+    if error is None:
+        email.status = "sent"
+        email.last_error = None
+        email.date_sent = datetime.utcnow()
+        metrics.incr(f"email.{email.template}.sent")
+    else:
+        print(f"failed to send {email.template} email {email.id} -- {error}")
+        email.last_error = error
+        if email.attempts >= MAX_EMAIL_ATTEMPTS:
+            email.status = "dead"
+            metrics.incr(f"email.{email.template}.dead")
+
+
+@event.listens_for(Session, "after_flush")
+def collect_queued_emails(session, flush_context):
+    from project.merchants.models import EmailOutbox
+
+    queued = session.info.setdefault("queued_emails", set())
+    queued_bulk = session.info.setdefault("queued_bulk_emails", set())
+    for obj in session.new:
+        if isinstance(obj, EmailOutbox):
+            (queued_bulk if obj.template in BULK_TEMPLATES else queued).add(obj.id)
+
+
+@event.listens_for(Session, "after_commit")
+def dispatch_queued_emails(session):
+    queued = session.info.pop("queued_emails", ())
+    queued_bulk = session.info.pop("queued_bulk_emails", ())
+    if not queued and not queued_bulk:
+        return
+
+    from project.tasks import send_email_task, send_bulk_emails_task
+
+    # retry_pending_emails picks up anything that can't be handed to celery
+    for outbox_id in queued:
+        try:
+            send_email_task.delay(outbox_id)
+        except Exception as e:
+            print(f"failed to queue email {outbox_id} -- {e}")
+
+    if queued_bulk:
+        try:
+            send_bulk_emails_task.delay(sorted(queued_bulk))
+        except Exception as e:
+            print(f"failed to queue {len(queued_bulk)} bulk emails -- {e}")
+
+
+@event.listens_for(Session, "after_rollback")
+def discard_queued_emails(session):
+    session.info.pop("queued_emails", None)
+    session.info.pop("queued_bulk_emails", None)
@@ -0,0 +1,184 @@
+import os
+from bisect import bisect_left
+from collections import namedtuple
+from decimal import Decimal, ROUND_HALF_UP, InvalidOperation
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# escrow fee engine. all amounts are integer kobo, bands are looked up by
+# binary search over their upper bounds and fees are rounded up to the
+# next kobo. schedules are versioned, the one in use is picked with the
+# FEE_SCHEDULE_VERSION environment variable
+
+FeeBand = namedtuple(
+    "FeeBand",
+    ["upper_bound", "escrow_basis_points", "minimum_escrow_fee", "process_fee"],
+)
+FeeQuote = namedtuple(
+    "FeeQuote",
+    [
+        "price",
+        "escrow_fee",
+        "process_fee",
+        "escrow_percent",
+        "total_fees",
+        "amount_to_pay",
+    ],
+)
+
+DEFAULT_FEE_SCHEDULE_VERSION = "2024-01"
+
+FEE_SCHEDULES = {
+    "2024-01": (
+        FeeBand(10_000_000, 260, 200_000, 100_000),
+        FeeBand(50_000_000, 170, 300_000, 100_000),
+        FeeBand(100_000_000, 120, 900_000, 250_000),
+        FeeBand(500_000_000, 100, 1_300_000, 250_000),
+        FeeBand(1_000_000_000, 80, 5_000_000, 500_000),
+        FeeBand(None, 60, 8_000_000, 500_000),
+    ),
+}
+
+# keeps price * basis points inside int64 for the vectorized path
+MAX_PRICE = 10**14
+
+
+def to_kobo(amount) -> int:
+    try:
+        kobo = (Decimal(str(amount)) * 100).quantize(Decimal("1"), ROUND_HALF_UP)
+    except InvalidOperation:
+        raise ValueError(f"invalid amount {amount}")
+    if not kobo.is_finite() or kobo < 0 or kobo > MAX_PRICE:
+        raise ValueError(f"invalid amount {amount}")
+    return int(kobo)
+
+
+def from_kobo(kobo: int) -> float:
+    return kobo / 100
+
+
+class FeeSchedule:
+    def __init__(self, version: str, bands: tuple):
+        self.version = version
+        self.bands = bands
+        self.bounds = [band.upper_bound for band in bands[:-1]]
+        self._arrays = None
+
+    def band(self, price: int) -> FeeBand:
+        return self.bands[bisect_left(self.bounds, price)]
+
+    def quote(self, price: int) -> FeeQuote:
+        band = self.band(price)
+        escrow_fee = max(
+            -(-price * band.escrow_basis_points // 10_000), band.minimum_escrow_fee
+        )
+        total_fees = escrow_fee + band.process_fee
+        return FeeQuote(
+            price,
+            escrow_fee,
+            band.process_fee,
+            Decimal(band.escrow_basis_points) / 100,
+            total_fees,
+            price + total_fees,
+        )
+
+    def quote_many(self, prices: list) -> list:
+        """
+        quote many kobo prices at once, vectorized with numpy when it is
+        installed
+        """
+
+        if np is None or len(prices) < 64:
+            return [self.quote(price) for price in prices]
+
+        if self._arrays is None:
+            self._arrays = tuple(
+                np.array([getattr(band, field) for band in self.bands], dtype=np.int64)
+                for field in (
+                    "escrow_basis_points",
+                    "minimum_escrow_fee",
+                    "process_fee",
+                )
+            )
+        basis_points, minimum_fees, process_fees = self._arrays
+
+        price = np.asarray(prices, dtype=np.int64)
+        band = np.searchsorted(
+            np.array(self.bounds, dtype=np.int64), price, side="left"
+        )
+        escrow_fee = np.maximum(
+            -(-price * basis_points[band] // 10_000), minimum_fees[band]
+        )
+        process_fee = process_fees[band]
+        total_fees = escrow_fee + process_fee
+
+        return [
+            FeeQuote(p, e, f, Decimal(b) / 100, t, p + t)
+            for p, e, f, b, t in zip(
+                price.tolist(),
+                escrow_fee.tolist(),
+                process_fee.tolist(),
+                basis_points[band].tolist(),
+                total_fees.tolist(),
+            )
+        ]
+
+
+def current_schedule_version() -> str:
+    return os.environ.get("FEE_SCHEDULE_VERSION", DEFAULT_FEE_SCHEDULE_VERSION)
+
+
+_schedules = {}
+
+
+def get_schedule(version: str = None) -> FeeSchedule:
+    version = version or current_schedule_version()
+    if version not in _schedules:
+        if version not in FEE_SCHEDULES:
+            raise ValueError(f"unknown fee schedule {version}")
+        _schedules[version] = FeeSchedule(version, FEE_SCHEDULES[version])
+    return _schedules[version]
+
+
+def quote(price, version: str = None) -> FeeQuote:
+    """
+    fees for a price in naira, every amount in the quote is in kobo
+    """
+
+    return get_schedule(version).quote(to_kobo(price))
+
+
+def quote_many(prices, version: str = None) -> list:
+    return get_schedule(version).quote_many([to_kobo(price) for price in prices])
+
+
+# quotes memoized per schedule version, so catalogues re-quoted on every
+# checkout page load only pay for prices they haven't asked for before
+
+QUOTE_MEMO_SIZE = 100_000
+
+_quote_memo = {}
+
+
+def quote_many_memoized(prices: list, version: str = None) -> list:
+    """
+    quote many kobo prices, reusing earlier quotes for the same schedule
+    version. new prices are quoted together in one vectorized pass
+    """
+
+    schedule = get_schedule(version)
+    memo = _quote_memo.setdefault(schedule.version, {})
+
+    quotes = {price: memo.get(price) for price in prices}
+    missing = [price for price, fees in quotes.items() if fees is None]
+    if missing:
+        quotes.update(zip(missing, schedule.quote_many(missing)))
+        if len(memo) + len(missing) > QUOTE_MEMO_SIZE:
+            memo.clear()
+        memo.update((price, quotes[price]) for price in missing)
+
+    return [quotes[price] for price in prices]
@@ -1,23 +1,41 @@
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
 import redis
-import math
 from flask import Request
 import os
 import dotenv
 import json
 import hmac
 import hashlib
+import base64
+from datetime import datetime
 from project import r_client
 
 
-def get_email_html_template(file_name, name, verification_url):
-    env = Environment(
-        loader=FileSystemLoader(
-            "C:\\Users\\VP\\OneDrive\\Desktop\\trustLock_api\\project\\html_templates"
-        )
-    )
+# one jinja environment for every email template. templates are found
+# relative to the package, compiled once per process (and kept compiled
+# across restarts by the bytecode cache) and loaded up front by
+# warm_templates when the app is created
+
+TEMPLATE_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "html_templates"
+)
+
+template_env = Environment(
+    loader=FileSystemLoader(TEMPLATE_DIR),
+    bytecode_cache=FileSystemBytecodeCache(
+        os.environ.get("JINJA_BYTECODE_CACHE_DIR") or None
+    ),
+    auto_reload=False,
+)
+
+
+def warm_templates():
+    for file_name in template_env.list_templates(extensions=["html"]):
+        template_env.get_template(file_name)
+
 
-    template = env.get_template(file_name)
+def get_email_html_template(file_name, name, verification_url):
+    template = template_env.get_template(file_name)
 
     html_content = template.render(
         {"first_name": name, "verification_url": verification_url}
@@ -27,13 +45,7 @@ def get_email_html_template(file_name, name, verification_url):
 
 
 def get_payment_verification_template(file_name, payload: dict):
-    env = Environment(
-        loader=FileSystemLoader(
-            "C:\\Users\\VP\\OneDrive\\Desktop\\trustLock_api\\project\\html_templates"
-        )
-    )
-
-    template = env.get_template(file_name)
+    template = template_env.get_template(file_name)
 
     html_content = template.render(
         {
@@ -49,59 +61,6 @@ def get_payment_verification_template(file_name, payload: dict):
     return html_content
 
 
-def calculate_fees(price: float) -> tuple:
-    """
-    a function to calculate the fees to be paid given the price a customer wants to pay for a product or service
-    """
-
-    def round_up(value, decimal_places):
-        factor = 10**decimal_places
-        return math.ceil(value * factor) / factor
-
-    if 0 <= price <= 100_000.00:
-        escrow_percent = 2.6
-        escrow_fee = (escrow_percent / 100) * price
-        escrow_fee = 2_000.00 if escrow_fee <= 2_000.00 else escrow_fee
-        escrow_fee = round_up(escrow_fee, 2)
-        process_fee = 1_000.00
-        return escrow_fee, process_fee, escrow_percent
-    elif 100_000.01 <= price <= 500_000.00:
-        escrow_percent = 1.7
-        escrow_fee = (escrow_percent / 100) * price
-        escrow_fee = 3_000.00 if escrow_fee <= 3_000.00 else escrow_fee
-        escrow_fee = round_up(escrow_fee, 2)
-        process_fee = 1_000.00
-        return escrow_fee, process_fee, escrow_percent
-    elif 500_000.01 <= price <= 1_000_000.00:
-        escrow_percent = 1.2
-        escrow_fee = (escrow_percent / 100) * price
-        escrow_fee = 9_000.00 if escrow_fee <= 9_000.00 else escrow_fee
-        escrow_fee = round_up(escrow_fee, 2)
-        process_fee = 2_500.00
-        return escrow_fee, process_fee, escrow_percent
-    elif 1_000_000.01 <= price <= 5_000_000.00:
-        escrow_percent = 1.0
-        escrow_fee = (escrow_percent / 100) * price
-        escrow_fee = 13_000.00 if escrow_fee <= 13_000.00 else escrow_fee
-        escrow_fee = round_up(escrow_fee, 2)
-        process_fee = 2_500.00
-        return escrow_fee, process_fee, escrow_percent
-    elif 5_000_000.01 <= price <= 10_000_000.00:
-        escrow_percent = 0.8
-        escrow_fee = (escrow_percent / 100) * price
-        escrow_fee = 50_000.00 if escrow_fee <= 50_000.00 else escrow_fee
-        escrow_fee = round_up(escrow_fee, 2)
-        process_fee = 5_000.00
-        return escrow_fee, process_fee, escrow_percent
-    else:
-        escrow_percent = 0.6
-        escrow_fee = (escrow_percent / 100) * price
-        escrow_fee = 80_000.00 if escrow_fee <= 80_000.00 else escrow_fee
-        escrow_fee = round_up(escrow_fee, 2)
-        process_fee = 5_000.00
-        return escrow_fee, process_fee, escrow_percent
-
-
 def signature_validation(request: Request, service: str):
     secret_code = "KORA_SECRETKEY" if service == "kora" else "PAYSTACK_SECRETKEY"
     signature_header = (
@@ -137,3 +96,24 @@ def redis_confirmation() -> bool:
     except:
         print("Failed to connect to Redis server.")
         return False
+
+
+def encode_cursor(date: datetime, id: str) -> str:
+    """
+    opaque cursor for keyset pagination over (date, id)
+    """
+
+    raw = json.dumps([date.isoformat(), id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("utf-8")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """
+    reverse of encode_cursor, raises ValueError on a malformed cursor
+    """
+
+    try:
+        date, id = json.loads(base64.urlsafe_b64decode(cursor.encode("utf-8")))
+        return datetime.fromisoformat(date), id
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"invalid cursor {cursor}") from e
@@ -1,98 +1,479 @@
 from project import create_app
+from project.deadlines import (
+    deadline_handler,
+    DELIVERY,
+    INSPECTION,
+    DISPUTE,
+    RETURN,
+    RETURN_INSPECTION,
+)
+from project.timeline import TimelineEvent
 
 app = create_app()
 
 
+INSPECTION_SWEEP_BATCH_SIZE = 200
+INSPECTION_WATERMARK_KEY = "inspection_sweep_watermark"
+DEADLINE_DISPATCH_BATCH_SIZE = 100
+
+
+def process_inspection_deadline(order, now):
+    """
+    act on an order whose inspection deadline has passed. the first time
+    round one extra day is added to the deadline and "reminded" is returned
+    so the caller can email the buyer, once that has also passed the full
+    disbursement to the seller is approved
+    """
+
+    from project.merchants.models import TransactionTimeline
+    from project.deadlines import schedule_deadline
+    from project.order_status import OrderStatus, transition
+    from project import db, metrics
+    from datetime import timedelta
+
+    # orders under dispute or being returned are settled by the dispute
+    # flow, anything further along is already with the payout flow
+    if order.status != OrderStatus.INSPECTION:
+        metrics.incr(f"inspection.skipped.{order.status.value}")
+        return
+
+    if not order.extra_time_initiated:
+        order.extra_time_initiated = True
+        order.inspection_deadline_at = now + timedelta(days=1)
+        order.date_updated = now
+
+        new_timeline = TransactionTimeline(
+            event_occurrance=f"Email sent for a reminder to inspect order product {order.reference_no} and extra time of 1 day was added",
+            event_code=TimelineEvent.INSPECTION_EXTENDED,
+            category="Inspection",
+            order=order,
+        )
+        db.session.add(new_timeline)
+        schedule_deadline(INSPECTION, order.reference_no, order.inspection_deadline_at)
+
+        metrics.incr("inspection.extended")
+        return "reminded"
+
+    order.extra_time_elapsed = True
+    order.inspection_time_elapsed = True
+    order.inspection_deadline_at = None
+    order.date_updated = now
+
+    # no money moves here. the disbursement is approved and the payout,
+    # its ledger entry and the close follow through the payout flow
+    transition(order, OrderStatus.DISBURSEMENT_APPROVED)
+
+    new_timeline = TransactionTimeline(
+        event_occurrance=f"Inspection time elapsed, full disbursement of funds for order {order.reference_no} ready for initiation",
+        event_code=TimelineEvent.INSPECTION_ELAPSED,
+        category="Disbursement Approval",
+        order=order,
+    )
+    db.session.add(new_timeline)
+    metrics.incr("inspection.disbursement_approved")
+
+
+def queue_inspection_reminders(orders: list):
+    """
+    queue the reminder emails for the buyers of orders given extra
+    inspection time. called before the batch commits so the emails are
+    committed with it, and sent together once it has
+    """
+
+    from project.email_outbox import queue_email
+    from markupsafe import escape
+    from datetime import datetime
+
+    year = datetime.utcnow().year
+    for order in orders:
+        customer = order.customer
+        if not customer or not customer.email_address:
+            continue
+
+        queue_email(
+            "inspection_reminder",
+            customer.email_address,
+            {
+                "customer_name": str(escape(customer.first_name.capitalize())),
+                "product_name": str(escape(order.order_details.product_name)),
+                "reference_no": str(escape(order.reference_no)),
+                "inspection_deadline": order.inspection_deadline_at.strftime(
+                    "%d %b %Y %H:%M UTC"
+                ),
+                "year": year,
+            },
+        )
+
+
 def check_inspection_dates():
+    """
+    incremental sweep over orders whose inspection deadline has passed.
+    only open orders due after the last run's watermark are selected, using
+    the partial index on inspection_deadline_at, in bounded batches with one
+    commit per batch. an order given extra time gets a later deadline and so
+    is picked up again by a later run
+    """
+
     with app.app_context():
 
-        from project.merchants.models import (
-            Merchant,
-            MerchantDetails,
-            Order,
-            Customer,
-            TransactionHistory,
-            TransactionTimeline,
-        )
-        from project import db
-        from datetime import datetime, timedelta, time, date
-        import uuid
+        from project.merchants.models import Order
+        from project.order_status import OrderStatus
+        from project import db, r_client
+        from project.deadlines import schedule_deadline
+        from project.helpers import encode_cursor, decode_cursor
+        from sqlalchemy import tuple_
+        from sqlalchemy.orm import selectinload
+        from datetime import datetime, timedelta
+        import redis
 
-        orders = Order.query.filter_by(product_inspected=False).all()
+        now = datetime.utcnow()
 
-        for order in orders:
+        try:
+            watermark = r_client.get(INSPECTION_WATERMARK_KEY)
+            watermark = decode_cursor(watermark) if watermark else None
+        except (redis.exceptions.RedisError, ValueError) as e:
+            print(
+                f"inspection sweep watermark unavailable, sweeping all due orders -- {e}"
+            )
+            watermark = None
 
-            # add conditions to ensure that disputed orders do not count and alos orders that conditions have been met.
-            print(order.id)
-            if order.product_delivered:
-                inspection_time = order.inspection_time
-                date_of_delivery = order.date_product_delivered
-                day_of_final_inspection = date_of_delivery + timedelta(
-                    days=inspection_time
+        processed = 0
+        while True:
+            query = Order.query.options(
+                selectinload(Order.order_details), selectinload(Order.customer)
+            ).filter(
+                Order.status != OrderStatus.CLOSED,
+                Order.inspection_deadline_at != None,
+                Order.inspection_deadline_at <= now,
+            )
+            if watermark:
+                query = query.filter(
+                    tuple_(Order.inspection_deadline_at, Order.id) > watermark
                 )
 
-                timeline = TransactionTimeline.query.filter(
-                    TransactionTimeline.event_occurrance.like(
-                        "Email sent for a reminder to inspect order product%"
-                    )
-                ).first()
-                if not timeline:
-                    print(f"something went wrong with order {order.id} records")
-
-                if (order.extra_time_elapsed and not order.order_closed) or (
-                    datetime.utcnow >= timeline.date + timedelta(days=1)
-                ):
-                    order.extra_time_elapsed = True
-                    db.session.commit()
-                    if not order.amount_verified:
-                        new_timeline = TransactionTimeline(
-                            event_occurrance=f"Auto payout failed due to data inconsisteny",
-                            order=order,
-                        )
-                        print(
-                            f"Auto payout failed due to data inconsisteny for order {order.id}"
-                        )
-
-                    # send email to inform them that transaction has been closed
-                    # transfer money to seller using paystack
-
-                    order.order_closed = True
-                    order.date_closed = datetime.utcnow
-
-                    new_timeline = TransactionTimeline(
-                        event_occurrance=f"Inspection time elapsed, money has been sent out to the seller in full, order has been closed",
-                        order=order,
-                    )
-
-                    new_transaction = TransactionHistory(
-                        amount=order.product_amount,
-                        trans_reference=f"auto_credit_{uuid.uuid4().hex()}",
-                        sender="TrustLock",
-                        receiver="Seller",
-                        trans_action="TrustLock Debit",
-                        description="Automatic credit of seller due to failed buyer inspection confirmation within set period",
-                        order=order,
-                    )
-
-                    db.session.add(new_timeline)
-                    db.session.add(new_transaction)
-
-                    db.session.commit()
-
-                    print(f"order {order.id} has been closed and money has been sent.")
-
-                if datetime.utcnow() >= day_of_final_inspection:
-                    # send email to remind them to inspect product or money will be paid in full
-
-                    new_timeline = TransactionTimeline(
-                        event_occurrance=f"Email sent for a reminder to inspect order product {order.reference_no} and extra time of 1 day was added",
-                        order=order,
-                    )
-
-                    order.extra_time_initiated = True
-
-                    print(f"extra time initiated for order {order.id}")
-            else:
-                pass
-        print("task completed successfully", datetime.utcnow())
+            orders = (
+                query.order_by(Order.inspection_deadline_at, Order.id)
+                .limit(INSPECTION_SWEEP_BATCH_SIZE)
+                .all()
+            )
+            if not orders:
+                break
+
+            watermark = (orders[-1].inspection_deadline_at, orders[-1].id)
+
+            # one savepoint per order, an order that fails is left as it was
+            # and retried through its deadline instead of failing the batch
+            reminded = []
+            for order in orders:
+                ref_no = order.reference_no
+                try:
+                    with db.session.begin_nested():
+                        result = process_inspection_deadline(order, now)
+                    if result == "reminded":
+                        reminded.append(order)
+                except Exception as e:
+                    print(f"inspection deadline for order {ref_no} failed -- {e}")
+                    schedule_deadline(INSPECTION, ref_no, now + timedelta(minutes=5))
+
+            queue_inspection_reminders(reminded)
+            db.session.commit()
+            processed += len(orders)
+
+            try:
+                r_client.set(INSPECTION_WATERMARK_KEY, encode_cursor(*watermark))
+            except redis.exceptions.RedisError as e:
+                print(f"failed to store inspection sweep watermark -- {e}")
+
+            if len(orders) < INSPECTION_SWEEP_BATCH_SIZE:
+                break
+
+        print(f"task completed successfully, {processed} orders", datetime.utcnow())
+        return "task completed succcssfully"
+
+
+@deadline_handler(DELIVERY)
+def delivery_deadline(order, now):
+    from project.merchants.models import TransactionTimeline
+    from project import db
+
+    if order.order_closed or order.buyer_confirm_delivery:
+        return
+
+    order.delivery_time_elapsed = True
+    order.date_updated = now
+
+    new_timeline = TransactionTimeline(
+        event_occurrance=f"Delivery time for order {order.reference_no} has elapsed without confirmed delivery",
+        event_code=TimelineEvent.DELIVERY_ELAPSED,
+        category="Delivery",
+        order=order,
+    )
+    db.session.add(new_timeline)
+
+
+@deadline_handler(INSPECTION)
+def inspection_deadline(order, now):
+    # the sweep may already have acted on this order and moved its deadline
+    if (
+        order.order_closed
+        or not order.inspection_deadline_at
+        or order.inspection_deadline_at > now
+    ):
+        return
+
+    return process_inspection_deadline(order, now)
+
+
+@deadline_handler(DISPUTE)
+def dispute_deadline(order, now):
+    from project.merchants.models import TransactionTimeline
+    from project import db
+
+    if not order.dispute_ongoing:
+        return
+
+    order.dispute_time_elapsed = True
+    order.special_attention = True
+    order.date_updated = now
+
+    new_timeline = TransactionTimeline(
+        event_occurrance=f"Dispute resolution time for order {order.reference_no} has elapsed, order flagged for attention",
+        event_code=TimelineEvent.DISPUTE_ELAPSED,
+        category="Dispute",
+        order=order,
+    )
+    db.session.add(new_timeline)
+
+
+@deadline_handler(RETURN)
+def return_deadline(order, now):
+    from project.merchants.models import TransactionTimeline
+    from project import db
+
+    product_return = order.product_return
+    if order.order_closed or not product_return or product_return.product_sent_out:
+        return
+
+    order.special_attention = True
+    order.date_updated = now
+
+    new_timeline = TransactionTimeline(
+        event_occurrance=f"Time for return of product {order.reference_no} has elapsed without the product being sent out",
+        event_code=TimelineEvent.RETURN_ELAPSED,
+        category="Product Return",
+        order=order,
+    )
+    db.session.add(new_timeline)
+
+
+@deadline_handler(RETURN_INSPECTION)
+def return_inspection_deadline(order, now):
+    from project.merchants.models import TransactionTimeline
+    from project import db
+
+    product_return = order.product_return
+    if (
+        order.order_closed
+        or not product_return
+        or product_return.seller_accept_return_condition
+    ):
+        return
+
+    order.special_attention = True
+    order.date_updated = now
+
+    new_timeline = TransactionTimeline(
+        event_occurrance=f"Inspection time for returned product {order.reference_no} has elapsed without the seller accepting the return",
+        event_code=TimelineEvent.RETURN_INSPECTION_ELAPSED,
+        category="Product Return",
+        order=order,
+    )
+    db.session.add(new_timeline)
+
+
+def dispatch_due_deadlines():
+    """
+    pop the order deadlines that are due from the redis sorted set and run
+    their handlers. work done scales with the number of due deadlines, not
+    with the number of orders. a handler that fails is retried 5 minutes later
+    and a batch whose commit fails is put back as it was
+    """
+
+    with app.app_context():
+
+        from project.merchants.models import Order
+        from project.deadlines import (
+            DEADLINE_HANDLERS,
+            ack_deadlines,
+            pop_due_deadlines,
+            recover_expired_deadlines,
+            release_deadlines,
+            schedule_deadline,
+        )
+        from project import db, metrics
+        from datetime import datetime, timedelta
+        import redis
+
+        now = datetime.utcnow()
+        dispatched = 0
+
+        try:
+            recovered = recover_expired_deadlines(now)
+            if recovered:
+                metrics.incr("deadlines.recovered", recovered)
+        except redis.exceptions.RedisError as e:
+            print(f"unable to recover expired order deadlines -- {e}")
+
+        while True:
+            try:
+                due = pop_due_deadlines(now, limit=DEADLINE_DISPATCH_BATCH_SIZE)
+            except redis.exceptions.RedisError as e:
+                print(f"unable to read order deadlines -- {e}")
+                break
+
+            if not due:
+                break
+
+            orders = Order.query.filter(
+                Order.reference_no.in_({ref_no for _, ref_no, _ in due})
+            ).all()
+            orders = {order.reference_no: order for order in orders}
+            reminded = []
+
+            for kind, ref_no, due_at in due:
+                handler = DEADLINE_HANDLERS.get(kind)
+                order = orders.get(ref_no)
+                if not handler or not order:
+                    print(f"dropping {kind} deadline for unknown order {ref_no}")
+                    continue
+
+                try:
+                    with db.session.begin_nested():
+                        result = handler(order, now)
+                    dispatched += 1
+                    if result == "reminded":
+                        reminded.append(order)
+                except Exception as e:
+                    print(f"{kind} deadline for order {ref_no} failed -- {e}")
+                    schedule_deadline(kind, ref_no, now + timedelta(minutes=5))
+
+            try:
+                queue_inspection_reminders(reminded)
+                db.session.commit()
+            except Exception as e:
+                print(f"failed to commit {len(due)} order deadlines -- {e}")
+                db.session.rollback()
+                release_deadlines(due)
+                break
+
+            ack_deadlines(due)
+
+            if len(due) < DEADLINE_DISPATCH_BATCH_SIZE:
+                break
+
+        print(f"dispatched {dispatched} order deadlines", datetime.utcnow())
+        return "task completed succcssfully"
+
+
+WEBHOOK_DRAIN_BATCH_SIZE = 100
+WEBHOOK_DRAIN_DELAY_SECONDS = 60
+
+
+def drain_webhook_inbox():
+    """
+    retry webhook events still pending a minute after they were received,
+    either because queueing them on celery failed or because processing
+    them failed. events are taken oldest first in bounded batches
+    """
+
+    with app.app_context():
+
+        from project.merchants.models import WebhookEvent
+        from project.webhooks import process_webhook_event
+        from datetime import datetime, timedelta
+
+        cutoff = datetime.utcnow() - timedelta(seconds=WEBHOOK_DRAIN_DELAY_SECONDS)
+
+        event_ids = [
+            event_id
+            for (event_id,) in WebhookEvent.query.with_entities(WebhookEvent.id)
+            .filter(
+                WebhookEvent.status == "pending",
+                WebhookEvent.date_received <= cutoff,
+            )
+            .order_by(WebhookEvent.date_received)
+            .limit(WEBHOOK_DRAIN_BATCH_SIZE)
+            .all()
+        ]
+
+        failed = sum(1 for event_id in event_ids if not process_webhook_event(event_id))
+
+        print(
+            f"drained {len(event_ids)} webhook events, {failed} failed",
+            datetime.utcnow(),
+        )
+        return "task completed succcssfully"
+
+
+def refresh_bank_directory_job():
+    """
+    keep the cached paystack bank directory fresh
+    """
+
+    from project.api_services.bank_directory import refresh_bank_directory
+    from datetime import datetime
+
+    total = refresh_bank_directory()
+    print(f"bank directory refreshed with {total} banks", datetime.utcnow())
+    return "task completed succcssfully"
+
+
+EMAIL_RETRY_BATCH_SIZE = 100
+EMAIL_RETRY_DELAY_MINUTES = 10
+
+
+def retry_pending_emails():
+    """
+    send outbox emails still pending 10 minutes after they were queued,
+    which happens when handing them to celery failed
+    """
+
+    with app.app_context():
+
+        from project.merchants.models import EmailOutbox
+        from project.email_outbox import deliver_email
+        from datetime import datetime, timedelta
+
+        cutoff = datetime.utcnow() - timedelta(minutes=EMAIL_RETRY_DELAY_MINUTES)
+
+        outbox_ids = [
+            outbox_id
+            for (outbox_id,) in EmailOutbox.query.with_entities(EmailOutbox.id)
+            .filter(EmailOutbox.status == "pending", EmailOutbox.date_created <= cutoff)
+            .order_by(EmailOutbox.date_created)
+            .limit(EMAIL_RETRY_BATCH_SIZE)
+            .all()
+        ]
+
+        statuses = [deliver_email(outbox_id) for outbox_id in outbox_ids]
+
+        print(
+            f"retried {len(outbox_ids)} pending emails, {statuses.count('sent')} sent",
+            datetime.utcnow(),
+        )
+        return "task completed succcssfully"
+
+
+def create_timeline_partitions():
+    """
+    make sure the transaction timeline has partitions for the coming months
+    """
+
+    with app.app_context():
+
+        from project.timeline import ensure_timeline_partitions
+        from datetime import datetime
+
+        partitions = ensure_timeline_partitions()
+        print(f"timeline partitions ready -- {partitions}", datetime.utcnow())
         return "task completed succcssfully"
@@ -0,0 +1,158 @@
+from datetime import datetime
+from sqlalchemy import insert, update
+from project import db
+from project import metrics
+from project.fees import to_kobo, from_kobo
+
+
+# double-entry ledger for order money, in integer kobo. every movement is
+# one entry of two postings, taken out of one account and put into
+# another, so the postings of an order always sum to zero. postings are
+# append-only. each order's running balances live on its OrderBalance row
+# and are moved with a relative UPDATE ... SET x = x + :delta in the same
+# transaction, so concurrent entries on one order never lose each other's
+# writes and an account can't be overdrawn without any lock being held.
+# the merchant's stats row is moved along with the balance. the naira
+# amounts on order_details are only copied from the balance for display,
+# payouts and refunds are sized from the balance itself
+
+BUYER = "buyer"
+ESCROW = "escrow"
+MERCHANT = "merchant"
+FEES = "fees"
+
+ACCOUNTS = (BUYER, ESCROW, MERCHANT, FEES)
+
+# money comes in from the buyer, so theirs is the only account that goes
+# negative. every other account has to cover what is taken out of it
+OVERDRAFT_ACCOUNTS = {BUYER}
+
+
+def transfer(
+    order_id: str,
+    source: str,
+    destination: str,
+    amount: int,
+    reference: str,
+    description: str = None,
+) -> str:
+    """
+    move amount kobo from one account of an order to another, returns the
+    entry id. reference names the entry, the same reference can't be
+    posted twice. raises ValueError on a bad account or amount, or when
+    the source account can't cover the amount
+    """
+
+    from project.merchants.models import Order, LedgerPosting, OrderBalance, unique_id
+    from project.merchant_stats import record_transfer
+
+    if source not in ACCOUNTS or destination not in ACCOUNTS or source == destination:
+        raise ValueError(f"invalid ledger accounts {source} to {destination}")
+    if not isinstance(amount, int) or isinstance(amount, bool) or amount <= 0:
+        raise ValueError(f"invalid ledger amount {amount}")
+
+    entry_id = unique_id()
+    now = datetime.utcnow()
+    db.session.execute(
+        insert(LedgerPosting),
+        [
+            {
+                "id": unique_id(),
+                "entry_id": entry_id,
+                "order_id": order_id,
+                "account": account,
+                "amount": delta,
+                "reference": reference,
+                "description": description,
+                "date_created": now,
+            }
+            for account, delta in ((source, -amount), (destination, amount))
+        ],
+    )
+
+    source_column = getattr(OrderBalance, source)
+    destination_column = getattr(OrderBalance, destination)
+    query = update(OrderBalance).where(OrderBalance.order_id == order_id)
+    if source not in OVERDRAFT_ACCOUNTS:
+        query = query.where(source_column >= amount)
+
+    result = db.session.execute(
+        query.values(
+            {
+                source: source_column - amount,
+                destination: destination_column + amount,
+                "date_updated": now,
+            }
+        ).execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        metrics.incr("ledger.rejected")
+        raise ValueError(
+            f"{source} balance of order {order_id} can't cover {amount} kobo"
+        )
+
+    record_transfer(
+        db.session.get(Order, order_id).merchant_id, source, destination, amount
+    )
+
+    metrics.incr(f"ledger.{source}.{destination}")
+    return entry_id
+
+
+def posted(reference: str) -> bool:
+    from project.merchants.models import LedgerPosting
+
+    return (
+        db.session.query(LedgerPosting.id).filter_by(reference=reference).first()
+        is not None
+    )
+
+
+def order_fees(order_details) -> int:
+    return to_kobo(order_details.escrow_fee) + to_kobo(order_details.process_fee)
+
+
+def get_balance(order_id: str):
+    """
+    the materialized balances of an order, one primary key lookup
+    """
+
+    from project.merchants.models import OrderBalance
+
+    return db.session.get(OrderBalance, order_id, populate_existing=True)
+
+
+def merchant_payable(order_details, balance) -> int:
+    """
+    kobo still owed to the merchant, the product amount less what has been
+    paid out to them, never more than escrow holds
+    """
+
+    owed = to_kobo(order_details.product_amount) - balance.merchant
+    return max(0, min(owed, balance.escrow))
+
+
+def sync_order_amounts(order):
+    """
+    copy an order's balance onto the naira amounts of its order_details,
+    returns the balance
+    """
+
+    balance = get_balance(order.id)
+    details = order.order_details
+    details.current_holdings_amount = from_kobo(balance.escrow)
+    details.total_amount_disbursed = from_kobo(balance.merchant)
+    details.amount_remaining_to_be_disbursed = from_kobo(
+        max(0, to_kobo(details.product_amount) - balance.merchant)
+    )
+    return balance
+
+
+def get_postings(order_id: str) -> list:
+    from project.merchants.models import LedgerPosting
+
+    return (
+        LedgerPosting.query.filter_by(order_id=order_id)
+        .order_by(LedgerPosting.date_created, LedgerPosting.entry_id)
+        .all()
+    )
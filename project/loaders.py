@@ -0,0 +1,131 @@
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import selectinload
+from project import metrics
+import time
+
+
+def load_order(ref_no: str, load: tuple = ()):
+    """
+    fetch an order by reference number once per request. the decorators
+    and the view share the same instance through flask.g, relationships
+    named in load are batch loaded alongside it
+    """
+
+    from project.merchants.models import Order
+
+    loaded_orders = g.setdefault("loaded_orders", {})
+
+    if ref_no not in loaded_orders:
+        query = Order.query.filter_by(reference_no=ref_no)
+        if load:
+            query = query.options(
+                *(selectinload(getattr(Order, relationship)) for relationship in load)
+            )
+        loaded_orders[ref_no] = query.first()
+
+    return loaded_orders[ref_no]
+
+
+def lock_order(ref_no: str, load: tuple = ()):
+    """
+    fetch an order by reference number with SELECT ... FOR UPDATE, so
+    concurrent requests for the same order queue on its row (on any worker
+    or host) while requests for other orders run in parallel. the lock is
+    held until the session commits or rolls back. time spent waiting for
+    it is recorded in the order_lock.wait_ms histogram
+    """
+
+    from project.merchants.models import Order
+
+    query = Order.query.filter_by(reference_no=ref_no).with_for_update()
+    if load:
+        query = query.options(
+            *(selectinload(getattr(Order, relationship)) for relationship in load)
+        )
+
+    started = time.perf_counter()
+    order = query.populate_existing().first()
+    metrics.observe("order_lock.wait_ms", (time.perf_counter() - started) * 1000)
+
+    if has_request_context():
+        g.setdefault("loaded_orders", {})[ref_no] = order
+
+    return order
+
+
+ORDER_RELATIONSHIPS = (
+    "order_details",
+    "delivery_information",
+    "transaction_history",
+    "transaction_timeline",
+    "dispute",
+    "customer",
+)
+
+
+def order_fields(fields: str = None, expand: str = None) -> tuple:
+    """
+    resolve the fields= and expand= query parameters into the top level
+    OrderSchema fields to return. fields picks fields explicitly, expand
+    adds nested collections to the id and reference_no. with neither,
+    every field is returned. raises ValueError on an unknown field
+    """
+
+    from project.merchants.models import OrderSchema
+
+    allowed = OrderSchema.Meta.fields
+
+    if fields is None and expand is None:
+        return allowed
+
+    selected = [] if fields is None else [f for f in fields.split(",") if f]
+    if fields is None:
+        selected += ["id", "reference_no"]
+    if expand is not None:
+        selected += [e for e in expand.split(",") if e]
+
+    unknown = set(selected) - set(allowed)
+    if unknown:
+        raise ValueError(f"unknown order fields {', '.join(sorted(unknown))}")
+
+    return tuple(field for field in allowed if field in selected)
+
+
+def order_load_options(fields: tuple) -> list:
+    """
+    selectinload options for the relationships among the requested fields
+    """
+
+    from project.merchants.models import Order
+
+    return [
+        selectinload(getattr(Order, field))
+        for field in fields
+        if field in ORDER_RELATIONSHIPS
+    ]
+
+
+# per request count of SQL statements, reported in the X-Query-Count
+# response header and checked against the budget set by @query_budget
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def count_statement(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g.sql_statement_count = g.get("sql_statement_count", 0) + 1
+
+
+def report_statement_count(response):
+    count = g.get("sql_statement_count", 0)
+    response.headers["X-Query-Count"] = str(count)
+
+    budget = g.get("query_budget")
+    if budget is not None and count > budget:
+        print(
+            f"query budget exceeded on {request.endpoint} -- {count} statements, budget {budget}"
+        )
+        metrics.incr(f"query_budget_exceeded.{request.endpoint}")
+
+    return response
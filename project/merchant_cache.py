@@ -0,0 +1,106 @@
+import hashlib
+import json
+import redis
+from flask import g
+from sqlalchemy import event
+from sqlalchemy.orm import Session, joinedload, make_transient_to_detached
+from project import r_client, db
+from project import metrics
+
+
+# redis cache of the authenticated merchant row plus a hash of its api key,
+# so @jwt_required() routes don't hit postgres twice just to authenticate.
+# entries are dropped whenever a Merchant or MerchantDetails row is
+# committed, which covers detail updates, email verification and suspension
+
+MERCHANT_CACHE_PREFIX = "merchant_identity:"
+MERCHANT_CACHE_TTL = 300
+
+
+def hash_api_key(api_key: str) -> str:
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+
+def load_merchant(merchant_id: str):
+    """
+    return the merchant with the given id, attached to the current session.
+    the api key hash is kept on flask.g for api_secret_key_required
+    """
+
+    from project.merchants.models import Merchant
+
+    cache_key = f"{MERCHANT_CACHE_PREFIX}{merchant_id}"
+
+    try:
+        cached = r_client.get(cache_key)
+    except redis.exceptions.RedisError as e:
+        print(f"merchant cache unavailable -- {e}")
+        cached = None
+
+    if cached:
+        metrics.incr("merchant_cache.hit")
+        entry = json.loads(cached)
+        merchant = Merchant(**entry["merchant"])
+        make_transient_to_detached(merchant)
+        g.merchant_api_key_hash = entry["api_key_hash"]
+        return db.session.merge(merchant, load=False)
+
+    metrics.incr("merchant_cache.miss")
+    merchant = (
+        Merchant.query.options(joinedload(Merchant.merchant_details))
+        .filter_by(id=merchant_id)
+        .one_or_none()
+    )
+    if merchant is None:
+        return None
+
+    api_key_hash = (
+        hash_api_key(merchant.merchant_details.api_secret_key)
+        if merchant.merchant_details
+        else None
+    )
+    g.merchant_api_key_hash = api_key_hash
+
+    entry = {
+        "merchant": {
+            column: getattr(merchant, column)
+            for column in Merchant.__table__.columns.keys()
+        },
+        "api_key_hash": api_key_hash,
+    }
+    try:
+        r_client.set(cache_key, json.dumps(entry), ex=MERCHANT_CACHE_TTL)
+    except redis.exceptions.RedisError as e:
+        print(f"failed to cache merchant {merchant_id} -- {e}")
+
+    return merchant
+
+
+def invalidate_merchant(merchant_id: str):
+    try:
+        r_client.delete(f"{MERCHANT_CACHE_PREFIX}{merchant_id}")
+    except redis.exceptions.RedisError as e:
+        print(f"failed to invalidate cached merchant {merchant_id} -- {e}")
+
+
+@event.listens_for(Session, "after_flush")
+def collect_changed_merchants(session, flush_context):
+    from project.merchants.models import Merchant, MerchantDetails
+
+    changed = session.info.setdefault("changed_merchants", set())
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Merchant):
+            changed.add(obj.id)
+        elif isinstance(obj, MerchantDetails) and obj.merchant_id:
+            changed.add(obj.merchant_id)
+
+
+@event.listens_for(Session, "after_commit")
+def invalidate_changed_merchants(session):
+    for merchant_id in session.info.pop("changed_merchants", ()):
+        invalidate_merchant(merchant_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def discard_changed_merchants(session):
+    session.info.pop("changed_merchants", None)
@@ -0,0 +1,184 @@
+from datetime import datetime
+from sqlalchemy import case, func, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from project import db
+from project.ledger import BUYER, ESCROW, MERCHANT, FEES
+from project.order_status import OrderStatus
+
+
+# per merchant totals kept on one MerchantStats row. order counts move
+# with every status change and amounts with every ledger entry, as
+# relative updates in the same transaction as the change itself, so the
+# dashboard reads a single row instead of summing every order
+
+ACCOUNT_COLUMNS = {
+    ESCROW: "amount_held",
+    MERCHANT: "amount_disbursed",
+    FEES: "fees_earned",
+}
+
+
+def status_column(status) -> str:
+    return f"{OrderStatus(status).value}_count"
+
+
+def apply_deltas(connection, merchant_id: str, deltas: dict):
+    """
+    add deltas to the merchant's stats row with a single upsert, INSERT
+    ... ON CONFLICT DO UPDATE SET x = x + excluded.x, so concurrent first
+    writes for a merchant without a row can't collide on its primary key
+    """
+
+    from project.merchants.models import MerchantStats
+
+    deltas = {column: delta for column, delta in deltas.items() if delta}
+    if not merchant_id or not deltas:
+        return
+
+    dialect_insert = (
+        sqlite.insert if connection.dialect.name == "sqlite" else postgresql.insert
+    )
+    query = dialect_insert(MerchantStats).values(
+        merchant_id=merchant_id, date_updated=datetime.utcnow(), **deltas
+    )
+    connection.execute(
+        query.on_conflict_do_update(
+            index_elements=[MerchantStats.merchant_id],
+            set_={
+                **{
+                    column: getattr(MerchantStats, column) + query.excluded[column]
+                    for column in deltas
+                },
+                "date_updated": query.excluded.date_updated,
+            },
+        )
+    )
+
+
+def record_status_change(connection, merchant_id: str, old, new):
+    deltas = {status_column(new): 1}
+    if old is None:
+        deltas["total_orders"] = 1
+    else:
+        deltas[status_column(old)] = -1
+    apply_deltas(connection, merchant_id, deltas)
+
+
+def record_new_orders(merchant_id: str, count: int):
+    apply_deltas(
+        db.session.connection(),
+        merchant_id,
+        {"total_orders": count, status_column(OrderStatus.INITIATED): count},
+    )
+
+
+def record_transfer(merchant_id: str, source: str, destination: str, amount: int):
+    deltas = {}
+    if source in ACCOUNT_COLUMNS:
+        deltas[ACCOUNT_COLUMNS[source]] = -amount
+    if destination in ACCOUNT_COLUMNS:
+        deltas[ACCOUNT_COLUMNS[destination]] = amount
+    if source == BUYER:
+        deltas["amount_paid"] = amount
+    if destination == BUYER:
+        deltas["amount_refunded"] = amount
+    apply_deltas(db.session.connection(), merchant_id, deltas)
+
+
+def stats_data(stats) -> dict:
+    def value(column):
+        return (getattr(stats, column) or 0) if stats else 0
+
+    return {
+        "total_orders": value("total_orders"),
+        "orders_by_status": {
+            status.value: value(status_column(status)) for status in OrderStatus
+        },
+        "amount_paid": value("amount_paid"),
+        "amount_held": value("amount_held"),
+        "amount_disbursed": value("amount_disbursed"),
+        "amount_refunded": value("amount_refunded"),
+        "fees_earned": value("fees_earned"),
+        "date_updated": stats.date_updated.isoformat() if stats else None,
+    }
+
+
+def get_merchant_stats(merchant_id: str) -> dict:
+    """
+    a merchant's order counts per status and amounts in kobo, read from
+    their stats row
+    """
+
+    from project.merchants.models import MerchantStats
+
+    return stats_data(db.session.get(MerchantStats, merchant_id))
+
+
+def rebuild_merchant_stats() -> int:
+    """
+    recompute every merchant's stats row from the Order, OrderBalance and
+    LedgerPosting tables, for repairs. returns the number of merchants
+    """
+
+    from project.merchants.models import (
+        Merchant,
+        MerchantStats,
+        Order,
+        OrderBalance,
+        LedgerPosting,
+    )
+
+    rows = {
+        merchant_id: {"merchant_id": merchant_id}
+        for (merchant_id,) in db.session.query(Merchant.id)
+    }
+
+    for merchant_id, status, count in db.session.query(
+        Order.merchant_id, Order.status, func.count(Order.id)
+    ).group_by(Order.merchant_id, Order.status):
+        if merchant_id in rows:
+            row = rows[merchant_id]
+            row[status_column(status)] = count
+            row["total_orders"] = row.get("total_orders", 0) + count
+
+    for merchant_id, held, disbursed, fees in (
+        db.session.query(
+            Order.merchant_id,
+            func.sum(OrderBalance.escrow),
+            func.sum(OrderBalance.merchant),
+            func.sum(OrderBalance.fees),
+        )
+        .join(OrderBalance, OrderBalance.order_id == Order.id)
+        .group_by(Order.merchant_id)
+    ):
+        if merchant_id in rows:
+            rows[merchant_id].update(
+                amount_held=int(held or 0),
+                amount_disbursed=int(disbursed or 0),
+                fees_earned=int(fees or 0),
+            )
+
+    for merchant_id, paid, refunded in (
+        db.session.query(
+            Order.merchant_id,
+            func.sum(case((LedgerPosting.amount < 0, -LedgerPosting.amount), else_=0)),
+            func.sum(case((LedgerPosting.amount > 0, LedgerPosting.amount), else_=0)),
+        )
+        .join(LedgerPosting, LedgerPosting.order_id == Order.id)
+        .filter(LedgerPosting.account == BUYER)
+        .group_by(Order.merchant_id)
+    ):
+        if merchant_id in rows:
+            rows[merchant_id].update(
+                amount_paid=int(paid or 0), amount_refunded=int(refunded or 0)
+            )
+
+    now = datetime.utcnow()
+    db.session.query(MerchantStats).delete()
+    if rows:
+        db.session.execute(
+            insert(MerchantStats),
+            [{**row, "date_updated": now} for row in rows.values()],
+        )
+    db.session.commit()
+    return len(rows)
@@ -32,9 +32,11 @@ from .models import (
     BusinessDetailsSchema,
     Dispute,
     DisputeSchema,
+    MerchantStats,
 )
 
-from ..decorators import api_secret_key_required
+from ..decorators import api_secret_key_required, query_budget
+from ..merchant_stats import get_merchant_stats as load_merchant_stats
 from ..api_services.paystack_api import PaystackClient, validate_account_details
 from itsdangerous import URLSafeTimedSerializer, SignatureExpired, BadSignature
 
@@ -88,8 +90,11 @@ def register_merchant():
             merchant=new_merchant,
         )
 
+        merchant_stats = MerchantStats(merchant=new_merchant)
+
         db.session.add(new_merchant)
         db.session.add(merchant_details)
+        db.session.add(merchant_stats)
         db.session.commit()
 
         current_merchant = MerchantDetails.query.filter_by(
@@ -175,7 +180,9 @@ def login_merchant():
 def get_merchcant_details():
 
     try:
-        merchant_schema = MerchantSchema()
+        # orders are paged through get_all_orders, dumping every order of
+        # the merchant here is unbounded
+        merchant_schema = MerchantSchema(exclude=("orders",))
 
         data = merchant_schema.dump(current_user)
 
@@ -185,6 +192,29 @@ def get_merchcant_details():
         return jsonify({"status": "error", "message": "something went wrong"}), 500
 
 
+@merchant.get("get_merchant_stats")
+@query_budget(2)
+@jwt_required()
+@api_secret_key_required
+def get_merchant_stats():
+    try:
+        data = load_merchant_stats(current_user.id)
+
+        return (
+            jsonify(
+                {
+                    "status": "success",
+                    "message": "retrieved merchant stats, amounts are in kobo",
+                    "data": data,
+                }
+            ),
+            200,
+        )
+    except Exception as e:
+        print(e)
+        return jsonify({"status": "error", "message": "something went wrong"}), 500
+
+
 @merchant.put("update_merchant_details")
 @jwt_required()
 @api_secret_key_required
@@ -267,23 +297,19 @@ def update_merchant_details():
 def send_verification_email():
     try:
         from project.api_services.sendgrid_api import Mailer
+        from project.email_outbox import queue_email
 
         email_address = current_user.merchant_details.email_address
         first_name = current_user.merchant_details.legal_first_name
         first_name = first_name.capitalize()
 
-        mailer = Mailer()
+        token = Mailer().verification_token(email_address)
+        r_client.set(f"token-{token}", current_user.id)
 
-        data, status = mailer.send_verification_mail(
-            email=email_address, name=first_name
-        )
-
-        print("sent the mail")
-        print(data)
-        r_client.set(f"token-{data['token']}", current_user.id)
-        print("set in redis")
+        queue_email("verification", email_address, {"name": first_name, "token": token})
+        db.session.commit()
 
-        return jsonify(data), status
+        return jsonify({"data": "verification email queued", "token": token}), 200
 
     except Exception as e:
         db.session.rollback()
@@ -365,15 +391,17 @@ def register_business():
         valid_acc, va_stat_code = validate_account_details(
             {
                 "bank_name": data.get("bank_name"),
+                "bank_code": data.get("bank_code"),
                 "account_number": data.get("bank_account_number"),
             }
         )
 
         if not valid_acc["status"]:
-            return (
-                jsonify({"status": "error", "message": valid_acc["message"]}),
-                va_stat_code,
-            )
+            response = {"status": "error", "message": valid_acc["message"]}
+            if valid_acc.get("candidates"):
+                # resend with the bank_code of the intended bank
+                response["candidates"] = valid_acc["candidates"]
+            return jsonify(response), va_stat_code
         acc_name = data.get("bank_account_name")
         input_result = acc_name.replace("-", "")
         input_result = input_result.lower()
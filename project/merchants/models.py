@@ -1,19 +1,61 @@
+import os
+import time
 import uuid
 from datetime import datetime, timedelta
 from project import db, ma
-from sqlalchemy import LargeBinary
+from project.order_status import OrderFlag, OrderStatus, PAID_STATUSES
+from project.merchant_stats import record_status_change
+from project.timeline import TimelineEvent
+from sqlalchemy import LargeBinary, TypeDecorator, Uuid, event
+from sqlalchemy.ext.hybrid import hybrid_property
+
+
+def uuid7() -> uuid.UUID:
+    """
+    time ordered uuid (version 7), a 48 bit millisecond timestamp followed
+    by random bits. ids created close together sort next to each other,
+    so inserts append to the end of the primary key index instead of
+    landing on random pages
+    """
+
+    value = (time.time_ns() // 1_000_000) << 80 | int.from_bytes(os.urandom(10), "big")
+    value = value & ~(0xF << 76) | 0x7 << 76
+    value = value & ~(0x3 << 62) | 0x2 << 62
+    return uuid.UUID(int=value)
 
 
 def unique_id():
-    return uuid.uuid4().hex
+    return uuid7().hex
+
+
+class HexUUID(TypeDecorator):
+    """
+    native uuid column that is read and written as the 32 character hex
+    string ids have always been, so the api and the rest of the code
+    never see a different id format
+    """
+
+    impl = Uuid
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, uuid.UUID):
+            return value
+        try:
+            return uuid.UUID(hex=str(value))
+        except ValueError:
+            # a string that can't be a uuid matches nothing, the same as
+            # looking up an id that doesn't exist
+            return None
+
+    def process_result_value(self, value, dialect):
+        return value.hex if value is not None else None
 
 
 class Merchant(db.Model):
     __tablename__ = "Merchant"
 
-    id = db.Column(
-        db.String(50), primary_key=True, nullable=False, default=unique_id, index=True
-    )
+    id = db.Column(HexUUID, primary_key=True, nullable=False, default=unique_id)
     send_monthly_reports = db.Column(db.Boolean, default=True)
     suspended = db.Column(db.Boolean, default=False)
     email_verified = db.Column(db.Boolean, default=False)
@@ -27,6 +69,9 @@ class Merchant(db.Model):
         "BusinessDetails", cascade="all,delete", backref="merchant", uselist=False
     )
     orders = db.relationship("Order", backref="merchant")
+    merchant_stats = db.relationship(
+        "MerchantStats", cascade="all,delete", backref="merchant", uselist=False
+    )
 
     def __repr__(self):
         return f"Merchant(id={self.id})"
@@ -50,9 +95,7 @@ class MerchantSchema(ma.Schema):
 class MerchantDetails(db.Model):
     __tablename__ = "MerchantDetails"
 
-    id = db.Column(
-        db.String(50), primary_key=True, nullable=False, default=unique_id, index=True
-    )
+    id = db.Column(HexUUID, primary_key=True, nullable=False, default=unique_id)
     legal_first_name = db.Column(db.String(30), nullable=False)
     legal_other_name = db.Column(db.String(30))
     legal_last_name = db.Column(db.String(30), nullable=False)
@@ -68,7 +111,7 @@ class MerchantDetails(db.Model):
     date_last_updated = db.Column(
         db.DateTime, nullable=False, default=datetime.utcnow()
     )
-    merchant_id = db.Column(db.String(50), db.ForeignKey("Merchant.id"))
+    merchant_id = db.Column(HexUUID, db.ForeignKey("Merchant.id"), index=True)
 
     def __repr__(self):
         return f"MerchantDetails(id={self.id}, email={self.email_address})"
@@ -92,9 +135,7 @@ class MerchantDetailsSchema(ma.Schema):
 class BusinessDetails(db.Model):
     __tablename__ = "BusinessDetails"
 
-    id = db.Column(
-        db.String(50), primary_key=True, nullable=False, default=unique_id, index=True
-    )
+    id = db.Column(HexUUID, primary_key=True, nullable=False, default=unique_id)
     name = db.Column(db.String(40), nullable=False, unique=True)
     description = db.Column(db.Text, nullable=False)
     bank_account_number = db.Column(db.String(15), nullable=False)
@@ -111,7 +152,7 @@ class BusinessDetails(db.Model):
     lower_bound_product_price_range = db.Column(db.Float, nullable=False)
     date_joined = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     date_last_updated = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
-    merchant_id = db.Column(db.String(50), db.ForeignKey("Merchant.id"))
+    merchant_id = db.Column(HexUUID, db.ForeignKey("Merchant.id"), index=True)
 
     def __repr__(self):
         return f"Business Details --- {self.name}, {self.email_address}, {self.product_sold}, {self.date_joined}"
@@ -136,79 +177,82 @@ class BusinessDetailsSchema(ma.Schema):
         )
 
 
+def status_property(*statuses):
+    """
+    read only boolean that holds while the order is in one of statuses.
+    usable in queries, e.g. Order.order_closed == True
+    """
+
+    def getter(self):
+        return (self.status or OrderStatus.INITIATED) in statuses
+
+    def expression(cls):
+        return cls.status.in_(statuses)
+
+    return hybrid_property(getter, expr=expression)
+
+
+def flag_property(flag: OrderFlag):
+    """
+    boolean kept as one bit of the flags column, usable in queries
+    """
+
+    def getter(self):
+        return bool((self.flags or 0) & flag)
+
+    def setter(self, value):
+        flags = self.flags or 0
+        self.flags = int(flags | flag) if value else flags & ~int(flag)
+
+    def expression(cls):
+        return cls.flags.op("&")(int(flag)) != 0
+
+    return hybrid_property(getter, setter, expr=expression)
+
+
 class Order(db.Model):
     __tablename__ = "Order"
-    id = db.Column(
-        db.String(50), primary_key=True, nullable=False, default=unique_id, index=True
+    __table_args__ = (
+        db.Index(
+            "ix_Order_merchant_id_date_initiated_id",
+            "merchant_id",
+            "date_initiated",
+            "id",
+        ),
+        db.Index(
+            "ix_Order_inspection_deadline_at_open",
+            "inspection_deadline_at",
+            "id",
+            postgresql_where=db.text("status != 'closed'"),
+        ),
+        db.Index("ix_Order_merchant_id_status", "merchant_id", "status"),
+        db.Index("ix_Order_status_date_updated", "status", "date_updated"),
+    )
+
+    id = db.Column(HexUUID, primary_key=True, nullable=False, default=unique_id)
+    reference_no = db.Column(db.String(50), nullable=False, unique=True, index=True)
+    status = db.Column(
+        db.Enum(
+            OrderStatus,
+            name="order_status",
+            native_enum=False,
+            length=30,
+            values_callable=lambda statuses: [status.value for status in statuses],
+        ),
+        nullable=False,
+        default=OrderStatus.INITIATED,
     )
-    reference_no = db.Column(db.String(50), nullable=False, index=True)
-    order_initiated = db.Column(db.Boolean, default=True, nullable=False)
-    order_commenced = db.Column(db.Boolean, default=False, nullable=False)
-    order_closed = db.Column(db.Boolean, default=False, nullable=False)
-    order_rated = db.Column(db.Boolean, default=False, nullable=False)
+    flags = db.Column(db.Integer, nullable=False, default=0)
     date_initiated = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     date_commenced = db.Column(db.DateTime, default=None)
     date_closed = db.Column(db.DateTime, default=None)
-    payment_initiated = db.Column(db.Boolean, default=False, nullable=False)
-    payment_abandoned = db.Column(db.Boolean, default=False, nullable=False)
-    full_payment_verified = db.Column(db.Boolean, default=False, nullable=False)
-    delivery_time_triggered = db.Column(db.Boolean, default=False, nullable=False)
-    delivery_time_elapsed = db.Column(db.Boolean, default=False)
-    need_to_balance = db.Column(db.Boolean, default=False, nullable=False)
-    product_overpay = db.Column(db.Boolean, default=False, nullable=False)
-    partial_dispersals = db.Column(db.Boolean, default=False, nullable=False)
-    partial_disbursements = db.Column(db.Boolean, default=False, nullable=False)
-    partial_disbursement_approved = db.Column(db.Boolean, default=False, nullable=False)
-    partial_disbursement_initiated = db.Column(
-        db.Boolean, default=False, nullable=False
-    )
-    partial_disbursement_processing = db.Column(
-        db.Boolean, default=False, nullable=False
-    )
-    partial_disbursement_dispatched = db.Column(
-        db.Boolean, default=False, nullable=False
-    )
-    product_sent_out = db.Column(db.Boolean, default=False, nullable=False)
-    seller_confirm_delivery = db.Column(db.Boolean, default=False, nullable=False)
-    buyer_confirm_delivery = db.Column(db.Boolean, default=False, nullable=False)
     date_seller_confirm_delivery = db.Column(db.DateTime, default=None)
     date_buyer_confirm_delivery = db.Column(db.DateTime, default=None)
-    inspection_time_triggered = db.Column(db.Boolean, default=False, nullable=False)
-    inspection_time_elapsed = db.Column(db.Boolean, default=False)
-    conditions_set = db.Column(db.Boolean, default=False, nullable=False)
-    conditions_met = db.Column(db.Boolean, default=False, nullable=False)
-    dispute_raised = db.Column(db.Boolean, default=False, nullable=False)
+    inspection_deadline_at = db.Column(db.DateTime, default=None)
     dispute_raised_date = db.Column(db.DateTime, default=None)
-    dispute_time_triggered = db.Column(db.Boolean, default=False)
-    dispute_time_elapsed = db.Column(db.Boolean, default=False)
-    dispute_ongoing = db.Column(db.Boolean, default=False, nullable=False)
-    dispute_resloved = db.Column(db.Boolean, default=False, nullable=False)
     dispute_conclusion = db.Column(db.String(20), default=None)
-    arbitration_required = db.Column(db.Boolean, default=False)
-    arbitration_ongoing = db.Column(db.Boolean, default=False)
-    arbitration_conluded = db.Column(db.Boolean, default=False)
-    product_to_be_returned = db.Column(db.Boolean, default=False, nullable=False)
-    product_return_commenced = db.Column(db.Boolean, default=False, nullable=False)
-    product_return_confirm_buyer = db.Column(db.Boolean, default=False, nullable=False)
-    product_return_confirm_seller = db.Column(db.Boolean, default=False, nullable=False)
-    refund_initiated = db.Column(db.Boolean, default=False, nullable=False)
-    refund_approved = db.Column(db.Boolean, default=False, nullable=False)
-    refund_processing = db.Column(db.Boolean, default=False, nullable=False)
-    refund_dispatched = db.Column(db.Boolean, default=False, nullable=False)
-    full_amount_refunded = db.Column(db.Boolean, default=False, nullable=False)
-    extra_time_initiated = db.Column(db.Boolean, default=False, nullable=False)
-    extra_time_elapsed = db.Column(db.Boolean, default=False, nullable=False)
-    seller_disbursement_approved = db.Column(db.Boolean, default=False, nullable=False)
-    seller_disbursement_initiated = db.Column(db.Boolean, default=False, nullable=False)
-    seller_disbursement_processing = db.Column(
-        db.Boolean, default=False, nullable=False
-    )
-    seller_disbursement_dispatched = db.Column(
-        db.Boolean, default=False, nullable=False
-    )
-    special_attention = db.Column(db.Boolean, default=False, nullable=False)
     date_updated = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
-    merchant_id = db.Column(db.String(50), db.ForeignKey("Merchant.id"))
+    merchant_id = db.Column(HexUUID, db.ForeignKey("Merchant.id"))
     order_details = db.relationship(
         "OrderDetails", cascade="all,delete", backref="order", uselist=False
     )
@@ -234,12 +278,98 @@ class Order(db.Model):
     arbitration = db.relationship(
         "Arbitration", cascade="all,delete", backref="order", uselist=False
     )
+    order_balance = db.relationship(
+        "OrderBalance", cascade="all,delete", backref="order", uselist=False
+    )
+
+    # where the order is in its lifecycle, derived from status
+    full_payment_verified = status_property(*PAID_STATUSES)
+    order_commenced = status_property(*PAID_STATUSES)
+    need_to_balance = status_property(OrderStatus.PARTIALLY_PAID)
+    dispute_ongoing = status_property(OrderStatus.DISPUTED)
+    dispute_resloved = status_property(
+        OrderStatus.DISPUTE_RESOLVED, OrderStatus.ARBITRATION
+    )
+    arbitration_required = status_property(OrderStatus.ARBITRATION)
+    product_to_be_returned = status_property(
+        OrderStatus.RETURNING, OrderStatus.REFUND_APPROVED, OrderStatus.REFUNDING
+    )
+    refund_approved = status_property(
+        OrderStatus.REFUND_APPROVED, OrderStatus.REFUNDING
+    )
+    refund_initiated = status_property(OrderStatus.REFUNDING)
+    refund_processing = status_property(OrderStatus.REFUNDING)
+    seller_disbursement_approved = status_property(
+        OrderStatus.DISBURSEMENT_APPROVED, OrderStatus.DISBURSING
+    )
+    seller_disbursement_initiated = status_property(OrderStatus.DISBURSING)
+    seller_disbursement_processing = status_property(OrderStatus.DISBURSING)
+    # a closed order has had its money sent out, to the seller or back
+    # to the buyer
+    order_closed = status_property(OrderStatus.CLOSED)
+    refund_dispatched = status_property(OrderStatus.CLOSED)
+    seller_disbursement_dispatched = status_property(OrderStatus.CLOSED)
+
+    # facts that hold whatever the status, kept in flags. an order can be
+    # sent out and delivered while under dispute, so those are flags too
+    conditions_set = flag_property(OrderFlag.CONDITIONS_SET)
+    conditions_met = flag_property(OrderFlag.CONDITIONS_MET)
+    product_overpay = flag_property(OrderFlag.PRODUCT_OVERPAY)
+    product_sent_out = flag_property(OrderFlag.PRODUCT_SENT_OUT)
+    seller_confirm_delivery = flag_property(OrderFlag.SELLER_CONFIRMED_DELIVERY)
+    buyer_confirm_delivery = flag_property(OrderFlag.BUYER_CONFIRMED_DELIVERY)
+    delivery_time_elapsed = flag_property(OrderFlag.DELIVERY_TIME_ELAPSED)
+    extra_time_initiated = flag_property(OrderFlag.EXTRA_TIME)
+    extra_time_elapsed = flag_property(OrderFlag.EXTRA_TIME_ELAPSED)
+    inspection_time_elapsed = flag_property(OrderFlag.INSPECTION_TIME_ELAPSED)
+    dispute_raised = flag_property(OrderFlag.DISPUTE_RAISED)
+    dispute_time_elapsed = flag_property(OrderFlag.DISPUTE_TIME_ELAPSED)
+    partial_dispersals = flag_property(OrderFlag.PARTIAL_DISPERSALS)
+    partial_disbursements = flag_property(OrderFlag.PARTIAL_DISBURSEMENTS)
+    partial_disbursement_approved = flag_property(
+        OrderFlag.PARTIAL_DISBURSEMENT_APPROVED
+    )
+    partial_disbursement_initiated = flag_property(
+        OrderFlag.PARTIAL_DISBURSEMENT_INITIATED
+    )
+    partial_disbursement_dispatched = flag_property(
+        OrderFlag.PARTIAL_DISBURSEMENT_DISPATCHED
+    )
+    full_amount_refunded = flag_property(OrderFlag.FULL_AMOUNT_REFUNDED)
+    special_attention = flag_property(OrderFlag.SPECIAL_ATTENTION)
+    order_rated = flag_property(OrderFlag.ORDER_RATED)
+
+    # the return confirmations live on the product return
+    @property
+    def product_return_confirm_buyer(self):
+        return bool(self.product_return and self.product_return.buyer_confirm_return)
+
+    @property
+    def product_return_confirm_seller(self):
+        return bool(self.product_return and self.product_return.seller_confirm_return)
 
     def __repr__(self):
         return f"Transaction --- {self.reference_no}"
 
 
+@event.listens_for(Order, "before_insert")
+def count_new_order(mapper, connection, order):
+    record_status_change(
+        connection, order.merchant_id, None, order.status or OrderStatus.INITIATED
+    )
+
+
+@event.listens_for(Order, "before_update")
+def count_status_change(mapper, connection, order):
+    history = db.inspect(order).attrs.status.history
+    if history.added and history.deleted:
+        record_status_change(
+            connection, order.merchant_id, history.deleted[0], history.added[0]
+        )
+
+
 class OrderSchema(ma.Schema):
+    status = ma.Enum(OrderStatus, by_value=True)
     order_details = ma.Nested("OrderDetailsSchema")
     delivery_information = ma.Nested("TransactionHistorySchema", many=True)
     transaction_history = ma.Nested("TransactionHistorySchema", many=True)
@@ -253,6 +383,7 @@ class OrderSchema(ma.Schema):
         fields = (
             "id",
             "reference_no",
+            "status",
             "order_details",
             "delivery_information",
             "transaction_history",
@@ -265,9 +396,7 @@ class OrderSchema(ma.Schema):
 class OrderDetails(db.Model):
     __tabelname__ = "OrderDetails"
 
-    id = db.Column(
-        db.String(50), primary_key=True, nullable=False, default=unique_id, index=True
-    )
+    id = db.Column(HexUUID, primary_key=True, nullable=False, default=unique_id)
     product_name = db.Column(db.String(30), nullable=False)
     product_category = db.Column(db.String(20), nullable=False)
     product_description = db.Column(db.Text)
@@ -292,7 +421,7 @@ class OrderDetails(db.Model):
     current_holdings_amount = db.Column(db.Float)
     order_rating = db.Column(db.Float, default=None)
     order_feedback = db.Column(db.Text)
-    order_id = db.Column(db.String(50), db.ForeignKey("Order.id"))
+    order_id = db.Column(HexUUID, db.ForeignKey("Order.id"), index=True)
     details_metadata = db.Column(db.JSON, default=None)
 
 
@@ -319,9 +448,7 @@ class OrderDetailsSchema(ma.Schema):
 class TransactionHistory(db.Model):
     __tablename__ = "TransactionHistory"
 
-    id = db.Column(
-        db.String(50), primary_key=True, nullable=False, default=unique_id, index=True
-    )
+    id = db.Column(HexUUID, primary_key=True, nullable=False, default=unique_id)
     amount = db.Column(db.Float, nullable=False)
     status = db.Column(db.String(20), nullable=False)
     trans_reference = db.Column(db.String(50), nullable=False, unique=True)
@@ -329,7 +456,7 @@ class TransactionHistory(db.Model):
     receiver = db.Column(db.String(70), nullable=False)
     description = db.Column(db.Text, nullable=False)
     remark = db.Column(db.Text, nullable=False)
-    order_id = db.Column(db.String(50), db.ForeignKey("Order.id"))
+    order_id = db.Column(HexUUID, db.ForeignKey("Order.id"), index=True)
 
 
 class TransactionHistorySchema(ma.Schema):
@@ -349,9 +476,7 @@ class TransactionHistorySchema(ma.Schema):
 class Customer(db.Model):
     __tablename__ = "Customer"
 
-    id = db.Column(
-        db.String(50), primary_key=True, nullable=False, default=unique_id, index=True
-    )
+    id = db.Column(HexUUID, primary_key=True, nullable=False, default=unique_id)
     first_name = db.Column(db.String(20), nullable=False)
     last_name = db.Column(db.String(20), nullable=False)
     bank_name = db.Column(db.String(40), default=None)
@@ -364,7 +489,7 @@ class Customer(db.Model):
     country = db.Column(db.String(20), nullable=False)
     city = db.Column(db.String(20), nullable=False)
     address = db.Column(db.Text, nullable=False)
-    order_id = db.Column(db.String(50), db.ForeignKey("Order.id"))
+    order_id = db.Column(HexUUID, db.ForeignKey("Order.id"), index=True)
 
 
 class CustomerSchema(ma.Schema):
@@ -383,9 +508,7 @@ class CustomerSchema(ma.Schema):
 
 class TransactionCondition(db.Model):
     __tablename__ = "TransactionCondition"
-    id = db.Column(
-        db.String(50), primary_key=True, nullable=False, default=unique_id, index=True
-    )
+    id = db.Column(HexUUID, primary_key=True, nullable=False, default=unique_id)
     condition_title = db.Column(db.String(20), nullable=False)
     condition_description = db.Column(db.Text, nullable=False)
     partial_disburse_requisite = db.Column(db.Boolean, default=None)
@@ -394,7 +517,7 @@ class TransactionCondition(db.Model):
     date_met = db.Column(db.DateTime, default=None)
     dispute_raised = db.Column(db.Boolean, default=False, nullable=False)
     dispute_settled = db.Column(db.Boolean, default=False)
-    order_id = db.Column(db.String(50), db.ForeignKey("Order.id"))
+    order_id = db.Column(HexUUID, db.ForeignKey("Order.id"), index=True)
 
     def __repr__(self):
         return f" trans condition --- {self.condition_title}; condition met -- {self.condition_met}; date -- {self.date_added}"
@@ -417,9 +540,7 @@ class TransactionConditionSchema(ma.Schema):
 class Dispute(db.Model):
     __tablename__ = "Dispute"
 
-    id = db.Column(
-        db.String(50), primary_key=True, nullable=False, default=unique_id, index=True
-    )
+    id = db.Column(HexUUID, primary_key=True, nullable=False, default=unique_id)
     dispute_title = db.Column(db.String(20), nullable=False)
     dispute_reason = db.Column(db.Text, nullable=False)
     dispute_resolved = db.Column(db.Boolean, default=False, nullable=False)
@@ -428,7 +549,7 @@ class Dispute(db.Model):
     )
     dispute_resolved_date = db.Column(db.DateTime)
     condition_disputed = db.Column(db.String(50))
-    order_id = db.Column(db.String(50), db.ForeignKey("Order.id"))
+    order_id = db.Column(HexUUID, db.ForeignKey("Order.id"), index=True)
 
     def __repr__(self):
         return f"dispute -- {self.dispute_title}, dispute resolution -- {self.dispute_resolved}, date raised -- {self.dispute_raised_date}, settle date -- {self.dispute_resolved_date}"
@@ -449,9 +570,7 @@ class DisputeSchema(ma.Schema):
 class Arbitration(db.Model):
     __tablename__ = "Arbitration"
 
-    id = db.Column(
-        db.String(50), primary_key=True, nullable=False, default=unique_id, index=True
-    )
+    id = db.Column(HexUUID, primary_key=True, nullable=False, default=unique_id)
     independent_body_name = db.Column(db.String(30), nullable=False)
     ongoing = db.Column(db.Boolean, default=False, nullable=False)
     initiation_date = db.Column(db.DateTime, default=datetime.utcnow)
@@ -462,15 +581,13 @@ class Arbitration(db.Model):
     conclusion = db.Column(db.String(30))
     party_to_remit = db.Column(db.String(30))
     resolve_date = db.Column(db.DateTime)
-    order_id = db.Column(db.String(50), db.ForeignKey("Order.id"))
+    order_id = db.Column(HexUUID, db.ForeignKey("Order.id"), index=True)
 
 
 class ProductReturn(db.Model):
     __tablename__ = "ProductReturn"
 
-    id = db.Column(
-        db.String(50), primary_key=True, nullable=False, default=unique_id, index=True
-    )
+    id = db.Column(HexUUID, primary_key=True, nullable=False, default=unique_id)
     buyer_initiates_return = db.Column(db.Boolean, default=True, nullable=False)
     date_initiated_return = db.Column(db.DateTime, default=datetime.utcnow)
     product_in_transit = db.Column(db.Boolean, default=False, nullable=False)
@@ -496,35 +613,58 @@ class ProductReturn(db.Model):
     product_return_complete = db.Column(db.Boolean, default=False, nullable=False)
     amount_to_refund = db.Column(db.Float, nullable=False)
     date_of_completion = db.Column(db.DateTime)
-    order_id = db.Column(db.String(50), db.ForeignKey("Order.id"))
+    order_id = db.Column(HexUUID, db.ForeignKey("Order.id"), index=True)
 
 
 class TransactionTimeline(db.Model):
     __tablename__ = "TransactionTimeline"
+    __table_args__ = (
+        db.Index("ix_TransactionTimeline_order_id_date", "order_id", "date", "id"),
+        {"postgresql_partition_by": "RANGE (date)"},
+    )
 
+    # date is part of the key because the table is partitioned on it
     id = db.Column(
-        db.String(50), primary_key=True, nullable=False, default=unique_id, index=True
+        HexUUID, primary_key=True, nullable=False, default=unique_id, index=True
+    )
+    event_code = db.Column(
+        db.Enum(
+            TimelineEvent,
+            name="timeline_event",
+            native_enum=False,
+            length=40,
+            values_callable=lambda events: [event.value for event in events],
+        ),
+        nullable=False,
     )
     event_occurrance = db.Column(db.Text, nullable=False)
     category = db.Column(db.String(30))
-    date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
-    order_id = db.Column(db.String(50), db.ForeignKey("Order.id"))
+    date = db.Column(
+        db.DateTime, primary_key=True, nullable=False, default=datetime.utcnow
+    )
+    order_id = db.Column(HexUUID, db.ForeignKey("Order.id"))
 
     def __repr__(self):
         return f"Timeline event -- {self.event_occurrance} --, date -- {self.date}"
 
 
+@event.listens_for(TransactionTimeline, "before_update")
+@event.listens_for(TransactionTimeline, "before_delete")
+def reject_timeline_change(mapper, connection, timeline):
+    raise ValueError("transaction timeline events are append-only")
+
+
 class TransactionTimelineSchema(ma.Schema):
+    event_code = ma.Enum(TimelineEvent, by_value=True)
+
     class Meta:
-        fields = ("id", "event_occurrance", "date", "category")
+        fields = ("id", "event_code", "event_occurrance", "date", "category")
 
 
 class DeliveryInformation(db.Model):
     __tablename__ = "DeliveryInformation"
 
-    id = db.Column(
-        db.String(50), primary_key=True, nullable=False, default=unique_id, index=True
-    )
+    id = db.Column(HexUUID, primary_key=True, nullable=False, default=unique_id)
     event = db.Column(db.String(30), nullable=False)
     delivery_description = db.Column(db.String(30), default=None)
     delivery_courier = db.Column(db.String(30), default=None)
@@ -534,9 +674,142 @@ class DeliveryInformation(db.Model):
     tracking_number = db.Column(db.String(30), default=None)
     special_instructions = db.Column(db.Text)
     delivery_metadata = db.Column(db.JSON, default=None)
-    order_id = db.Column(db.String(50), db.ForeignKey("Order.id"))
+    order_id = db.Column(HexUUID, db.ForeignKey("Order.id"), index=True)
 
 
 class DeliveryInformationSchema(ma.Schema):
     class Meta:
         model = DeliveryInformation
+
+
+class WebhookEvent(db.Model):
+    __tablename__ = "WebhookEvent"
+    __table_args__ = (
+        db.UniqueConstraint(
+            "provider", "event_key", name="uq_WebhookEvent_provider_event_key"
+        ),
+        db.Index("ix_WebhookEvent_status_date_received", "status", "date_received"),
+    )
+
+    id = db.Column(HexUUID, primary_key=True, nullable=False, default=unique_id)
+    provider = db.Column(db.String(20), nullable=False)
+    event_key = db.Column(db.String(150), nullable=False)
+    event = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.JSON, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default="pending")
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text)
+    date_received = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    date_processed = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f"WebhookEvent(provider={self.provider}, event_key={self.event_key}, status={self.status})"
+
+
+class EmailOutbox(db.Model):
+    __tablename__ = "EmailOutbox"
+    __table_args__ = (
+        db.Index("ix_EmailOutbox_status_date_created", "status", "date_created"),
+    )
+
+    id = db.Column(HexUUID, primary_key=True, nullable=False, default=unique_id)
+    template = db.Column(db.String(50), nullable=False)
+    recipient = db.Column(db.String(120), nullable=False)
+    payload = db.Column(db.JSON, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default="pending")
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text)
+    date_created = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    date_sent = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f"EmailOutbox(template={self.template}, recipient={self.recipient}, status={self.status})"
+
+
+class LedgerPosting(db.Model):
+    __tablename__ = "LedgerPosting"
+    __table_args__ = (
+        db.UniqueConstraint(
+            "reference", "account", name="uq_LedgerPosting_reference_account"
+        ),
+        db.Index("ix_LedgerPosting_order_id_date_created", "order_id", "date_created"),
+    )
+
+    id = db.Column(HexUUID, primary_key=True, nullable=False, default=unique_id)
+    entry_id = db.Column(db.String(50), nullable=False)
+    order_id = db.Column(HexUUID, db.ForeignKey("Order.id"), nullable=False)
+    account = db.Column(db.String(20), nullable=False)
+    amount = db.Column(db.BigInteger, nullable=False)
+    reference = db.Column(db.String(100), nullable=False)
+    description = db.Column(db.String(255))
+    date_created = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"LedgerPosting(order_id={self.order_id}, account={self.account}, amount={self.amount})"
+
+
+class LedgerPostingSchema(ma.Schema):
+    class Meta:
+        fields = (
+            "id",
+            "entry_id",
+            "account",
+            "amount",
+            "reference",
+            "description",
+            "date_created",
+        )
+
+
+class OrderBalance(db.Model):
+    __tablename__ = "OrderBalance"
+
+    order_id = db.Column(
+        HexUUID, db.ForeignKey("Order.id"), primary_key=True, nullable=False
+    )
+    buyer = db.Column(db.BigInteger, nullable=False, default=0)
+    escrow = db.Column(db.BigInteger, nullable=False, default=0)
+    merchant = db.Column(db.BigInteger, nullable=False, default=0)
+    fees = db.Column(db.BigInteger, nullable=False, default=0)
+    date_updated = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"OrderBalance(order_id={self.order_id}, escrow={self.escrow})"
+
+
+class OrderBalanceSchema(ma.Schema):
+    class Meta:
+        fields = ("buyer", "escrow", "merchant", "fees", "date_updated")
+
+
+class MerchantStats(db.Model):
+    __tablename__ = "MerchantStats"
+
+    merchant_id = db.Column(
+        HexUUID, db.ForeignKey("Merchant.id"), primary_key=True, nullable=False
+    )
+    total_orders = db.Column(db.Integer, nullable=False, default=0)
+    initiated_count = db.Column(db.Integer, nullable=False, default=0)
+    payment_pending_count = db.Column(db.Integer, nullable=False, default=0)
+    partially_paid_count = db.Column(db.Integer, nullable=False, default=0)
+    commenced_count = db.Column(db.Integer, nullable=False, default=0)
+    shipped_count = db.Column(db.Integer, nullable=False, default=0)
+    inspection_count = db.Column(db.Integer, nullable=False, default=0)
+    disputed_count = db.Column(db.Integer, nullable=False, default=0)
+    dispute_resolved_count = db.Column(db.Integer, nullable=False, default=0)
+    arbitration_count = db.Column(db.Integer, nullable=False, default=0)
+    returning_count = db.Column(db.Integer, nullable=False, default=0)
+    refund_approved_count = db.Column(db.Integer, nullable=False, default=0)
+    refunding_count = db.Column(db.Integer, nullable=False, default=0)
+    disbursement_approved_count = db.Column(db.Integer, nullable=False, default=0)
+    disbursing_count = db.Column(db.Integer, nullable=False, default=0)
+    closed_count = db.Column(db.Integer, nullable=False, default=0)
+    amount_paid = db.Column(db.BigInteger, nullable=False, default=0)
+    amount_held = db.Column(db.BigInteger, nullable=False, default=0)
+    amount_disbursed = db.Column(db.BigInteger, nullable=False, default=0)
+    amount_refunded = db.Column(db.BigInteger, nullable=False, default=0)
+    fees_earned = db.Column(db.BigInteger, nullable=False, default=0)
+    date_updated = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"MerchantStats(merchant_id={self.merchant_id}, total_orders={self.total_orders})"
@@ -0,0 +1,58 @@
+import redis
+from project import r_client
+
+
+# lightweight counters and histograms kept in redis so that every worker
+# process reports into the same place. metrics must never break a request,
+# so every redis error is swallowed here.
+
+COUNTERS_KEY = "metrics:counters"
+HISTOGRAM_PREFIX = "metrics:hist:"
+DEFAULT_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+def incr(name: str, amount: int = 1):
+    """
+    increment a named counter
+    """
+
+    try:
+        r_client.hincrby(COUNTERS_KEY, name, amount)
+    except redis.exceptions.RedisError as e:
+        print(f"failed to record metric {name} -- {e}")
+
+
+def observe(name: str, value: float, buckets: tuple = DEFAULT_BUCKETS):
+    """
+    record a value (usually a duration in milliseconds) into a
+    cumulative histogram with the given bucket upper bounds
+    """
+
+    try:
+        key = f"{HISTOGRAM_PREFIX}{name}"
+        pipe = r_client.pipeline(transaction=False)
+        for bound in buckets:
+            if value <= bound:
+                pipe.hincrby(key, f"le_{bound}", 1)
+        pipe.hincrby(key, "le_inf", 1)
+        pipe.hincrbyfloat(key, "sum", value)
+        pipe.hincrby(key, "count", 1)
+        pipe.execute()
+    except redis.exceptions.RedisError as e:
+        print(f"failed to record metric {name} -- {e}")
+
+
+def snapshot() -> dict:
+    """
+    return every counter and histogram currently recorded
+    """
+
+    counters = r_client.hgetall(COUNTERS_KEY)
+    histograms = {}
+    for key in r_client.scan_iter(match=f"{HISTOGRAM_PREFIX}*"):
+        histograms[key[len(HISTOGRAM_PREFIX) :]] = r_client.hgetall(key)
+
+    return {
+        "counters": {name: int(value) for name, value in counters.items()},
+        "histograms": histograms,
+    }
@@ -0,0 +1,118 @@
+import redis
+from project import r_client, db
+from project import metrics
+
+
+# redis set holding the reference number of every order ever created.
+# membership checks are O(1) so guarded routes never have to pull the
+# whole collection of reference numbers across the wire.
+
+ORDER_INDEX_KEY = "order_ref_index"
+
+
+def add_reference(ref_no: str):
+    """
+    add a newly created order reference number to the index
+    """
+
+    try:
+        r_client.sadd(ORDER_INDEX_KEY, ref_no)
+    except redis.exceptions.RedisError as e:
+        print(f"failed to index order {ref_no} -- {e}")
+
+
+def add_references(ref_nos: list):
+    """
+    add several order reference numbers to the index in one round trip
+    """
+
+    if not ref_nos:
+        return
+
+    try:
+        r_client.sadd(ORDER_INDEX_KEY, *ref_nos)
+    except redis.exceptions.RedisError as e:
+        print(f"failed to index {len(ref_nos)} orders -- {e}")
+
+
+def reference_exists(ref_no: str) -> bool:
+    """
+    check if an order with the given reference number exists.
+    the redis index is checked first, misses (or an unavailable redis)
+    fall back to the database and repair the index on a hit
+    """
+
+    from project.merchants.models import Order
+
+    if not ref_no:
+        return False
+
+    try:
+        if r_client.sismember(ORDER_INDEX_KEY, ref_no):
+            metrics.incr("order_index.hit")
+            return True
+        metrics.incr("order_index.miss")
+    except redis.exceptions.RedisError as e:
+        print(f"order index unavailable, falling back to database -- {e}")
+
+    found = db.session.query(
+        Order.query.filter_by(reference_no=ref_no).exists()
+    ).scalar()
+
+    if found:
+        metrics.incr("order_index.db_fallback_hit")
+        add_reference(ref_no)
+
+    return found
+
+
+def rebuild_index(batch_size: int = 5000) -> int:
+    """
+    rebuild the index from the Order.reference_no column. the new set is
+    built under a temporary key and swapped in atomically so lookups keep
+    working while the rebuild runs
+    """
+
+    from project.merchants.models import Order
+
+    temp_key = f"{ORDER_INDEX_KEY}:rebuild"
+    r_client.delete(temp_key)
+
+    total = 0
+    batch = []
+    for (ref_no,) in db.session.query(Order.reference_no).yield_per(batch_size):
+        batch.append(ref_no)
+        if len(batch) >= batch_size:
+            r_client.sadd(temp_key, *batch)
+            total += len(batch)
+            batch = []
+
+    if batch:
+        r_client.sadd(temp_key, *batch)
+        total += len(batch)
+
+    if total:
+        r_client.rename(temp_key, ORDER_INDEX_KEY)
+    else:
+        r_client.delete(ORDER_INDEX_KEY)
+
+    return total
+
+
+def index_stats() -> dict:
+    """
+    size of the index and how often lookups needed the database fallback
+    """
+
+    counters = r_client.hmget(
+        metrics.COUNTERS_KEY,
+        ["order_index.hit", "order_index.miss", "order_index.db_fallback_hit"],
+    )
+    hits, misses, fallback_hits = (int(value or 0) for value in counters)
+
+    return {
+        "indexed_orders": r_client.scard(ORDER_INDEX_KEY),
+        "hits": hits,
+        "misses": misses,
+        "db_fallback_hits": fallback_hits,
+    }
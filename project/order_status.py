@@ -0,0 +1,114 @@
+import enum
+from project import metrics
+
+
+# order lifecycle as an explicit state machine. status is the one place to
+# ask where an order is, moves between statuses are checked against
+# TRANSITIONS. facts that hold independently of the lifecycle (conditions
+# met, flagged for attention, partial disbursements ...) are bits of the
+# order's flags column
+
+
+class OrderStatus(str, enum.Enum):
+    INITIATED = "initiated"
+    PAYMENT_PENDING = "payment_pending"
+    PARTIALLY_PAID = "partially_paid"
+    COMMENCED = "commenced"
+    SHIPPED = "shipped"
+    INSPECTION = "inspection"
+    DISPUTED = "disputed"
+    DISPUTE_RESOLVED = "dispute_resolved"
+    ARBITRATION = "arbitration"
+    RETURNING = "returning"
+    REFUND_APPROVED = "refund_approved"
+    REFUNDING = "refunding"
+    DISBURSEMENT_APPROVED = "disbursement_approved"
+    DISBURSING = "disbursing"
+    CLOSED = "closed"
+
+
+TRANSITIONS = {
+    OrderStatus.INITIATED: {OrderStatus.PAYMENT_PENDING},
+    OrderStatus.PAYMENT_PENDING: {OrderStatus.PARTIALLY_PAID, OrderStatus.COMMENCED},
+    OrderStatus.PARTIALLY_PAID: {OrderStatus.COMMENCED},
+    OrderStatus.COMMENCED: {OrderStatus.SHIPPED, OrderStatus.DISPUTED},
+    OrderStatus.SHIPPED: {OrderStatus.INSPECTION, OrderStatus.DISPUTED},
+    OrderStatus.INSPECTION: {
+        OrderStatus.DISPUTED,
+        OrderStatus.DISBURSEMENT_APPROVED,
+        OrderStatus.CLOSED,
+    },
+    OrderStatus.DISPUTED: {OrderStatus.DISPUTE_RESOLVED},
+    OrderStatus.DISPUTE_RESOLVED: {
+        OrderStatus.INSPECTION,
+        OrderStatus.ARBITRATION,
+        OrderStatus.RETURNING,
+    },
+    OrderStatus.ARBITRATION: {OrderStatus.INSPECTION, OrderStatus.RETURNING},
+    OrderStatus.RETURNING: {OrderStatus.REFUND_APPROVED},
+    OrderStatus.REFUND_APPROVED: {OrderStatus.REFUNDING},
+    OrderStatus.REFUNDING: {OrderStatus.CLOSED},
+    OrderStatus.DISBURSEMENT_APPROVED: {OrderStatus.DISBURSING, OrderStatus.CLOSED},
+    OrderStatus.DISBURSING: {OrderStatus.CLOSED},
+    OrderStatus.CLOSED: set(),
+}
+
+
+class OrderFlag(enum.IntFlag):
+    CONDITIONS_SET = 1
+    CONDITIONS_MET = 2
+    PRODUCT_OVERPAY = 4
+    SELLER_CONFIRMED_DELIVERY = 8
+    DELIVERY_TIME_ELAPSED = 16
+    EXTRA_TIME = 32
+    INSPECTION_TIME_ELAPSED = 64
+    DISPUTE_RAISED = 128
+    DISPUTE_TIME_ELAPSED = 256
+    PARTIAL_DISBURSEMENT_APPROVED = 512
+    PARTIAL_DISBURSEMENT_INITIATED = 1024
+    PARTIAL_DISBURSEMENT_DISPATCHED = 2048
+    SPECIAL_ATTENTION = 4096
+    ORDER_RATED = 8192
+    EXTRA_TIME_ELAPSED = 16384
+    FULL_AMOUNT_REFUNDED = 32768
+    PARTIAL_DISPERSALS = 65536
+    PARTIAL_DISBURSEMENTS = 131072
+    PRODUCT_SENT_OUT = 262144
+    BUYER_CONFIRMED_DELIVERY = 524288
+
+
+OPEN_STATUSES = tuple(status for status in OrderStatus if status != OrderStatus.CLOSED)
+PAID_STATUSES = tuple(
+    status
+    for status in OrderStatus
+    if status
+    not in (
+        OrderStatus.INITIATED,
+        OrderStatus.PAYMENT_PENDING,
+        OrderStatus.PARTIALLY_PAID,
+    )
+)
+
+
+def can_transition(order, status: OrderStatus) -> bool:
+    current = order.status or OrderStatus.INITIATED
+    return status == current or status in TRANSITIONS[current]
+
+
+def transition(order, status: OrderStatus):
+    """
+    move an order to status. moving to the status it is already in does
+    nothing, a move the transition table doesn't allow raises ValueError
+    """
+
+    current = order.status or OrderStatus.INITIATED
+    if status == current:
+        return
+
+    if status not in TRANSITIONS[current]:
+        raise ValueError(
+            f"order {order.reference_no} can't move from {current.value} to {status.value}"
+        )
+
+    order.status = status
+    metrics.incr(f"order_status.{status.value}")
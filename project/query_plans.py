@@ -0,0 +1,151 @@
+from contextlib import contextmanager
+from flask import current_app, url_for
+from sqlalchemy import event, text
+from project import db
+
+
+# query plan regression check. the read endpoints are called for a sample
+# merchant and order and every SELECT they run is EXPLAINed, a Seq Scan
+# on a table holding at least min_rows rows means a query is missing an
+# index. needs postgres seeded to realistic sizes, see project/seed.py
+
+MIN_ROWS = 10000
+
+
+def plan_endpoints(order, dispute=None) -> list:
+    """
+    the endpoints to check as (endpoint, view args) pairs
+    """
+
+    endpoints = [
+        ("merchant.get_merchcant_details", {}),
+        ("merchant.get_merchant_stats", {}),
+        ("transaction.get_all_orders", {}),
+        ("transaction.get_all_orders", {"status": order.status.value}),
+        ("transaction.export_orders", {}),
+        ("transaction.get_order", {"ref_no": order.reference_no}),
+        ("transaction.retrieve_conditions", {"ref_no": order.reference_no}),
+        ("transaction.get_transaction_history", {"ref_no": order.reference_no}),
+        ("transaction.get_transaction_timeline", {"ref_no": order.reference_no}),
+        ("transaction.get_order_balance", {"ref_no": order.reference_no}),
+        ("dispute.get_disputes", {"ref_no": order.reference_no}),
+    ]
+    if dispute:
+        endpoints.append(
+            ("dispute.get_dispute", {"ref_no": order.reference_no, "id": dispute.id})
+        )
+    return endpoints
+
+
+@contextmanager
+def captured_selects():
+    """
+    collect the SELECT statements run on the engine inside the block as
+    (statement, parameters) pairs
+    """
+
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    event.listen(db.engine, "before_cursor_execute", capture)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, "before_cursor_execute", capture)
+
+
+def seq_scans(plan: dict) -> list:
+    """
+    names of the relations read with a Seq Scan anywhere in a plan
+    """
+
+    found = []
+    if plan.get("Node Type") == "Seq Scan":
+        found.append(plan.get("Relation Name"))
+    for child in plan.get("Plans", []):
+        found += seq_scans(child)
+    return found
+
+
+def table_sizes() -> dict:
+    return dict(
+        db.session.execute(
+            text(
+                "SELECT relname, reltuples FROM pg_class "
+                "WHERE relkind = 'r' AND relnamespace = 'public'::regnamespace"
+            )
+        ).all()
+    )
+
+
+def check_query_plans(min_rows: int = MIN_ROWS) -> list:
+    """
+    call every endpoint in plan_endpoints and EXPLAIN the SELECTs it
+    runs, returns the offending queries as dicts of endpoint, table, rows
+    and statement. raises ValueError when not on postgres or there is no
+    order to check against
+    """
+
+    from flask_jwt_extended import create_access_token
+    from project.merchants.models import Order, Dispute
+
+    if db.engine.dialect.name != "postgresql":
+        raise ValueError("query plans can only be checked on postgres")
+
+    dispute = Dispute.query.filter(Dispute.order_id.isnot(None)).first()
+    order = dispute.order if dispute else Order.query.first()
+    if not order:
+        raise ValueError("no orders to check, seed the database first")
+
+    merchant = order.merchant
+    headers = {
+        "Authorization": f"Bearer {create_access_token(identity=merchant)}",
+        "X-API-Key": merchant.merchant_details.api_secret_key,
+    }
+
+    sizes = table_sizes()
+    client = current_app.test_client()
+    failures = []
+
+    for endpoint, view_args in plan_endpoints(order, dispute):
+        with current_app.test_request_context():
+            path = url_for(endpoint, **view_args)
+
+        # a fresh app context per call, requests would otherwise share
+        # flask.g and the session with the command
+        with current_app.app_context(), captured_selects() as statements:
+            response = client.get(path, headers=headers)
+            response.get_data()
+
+        if response.status_code != 200:
+            failures.append(
+                {
+                    "endpoint": path,
+                    "table": None,
+                    "rows": None,
+                    "statement": f"returned {response.status_code}",
+                }
+            )
+
+        connection = db.session.connection()
+        for statement, parameters in statements:
+            (plan,) = connection.exec_driver_sql(
+                f"EXPLAIN (FORMAT JSON) {statement}", parameters
+            ).scalar()
+            for table in seq_scans(plan["Plan"]):
+                rows = sizes.get(table, 0)
+                if rows >= min_rows:
+                    failures.append(
+                        {
+                            "endpoint": path,
+                            "table": table,
+                            "rows": int(rows),
+                            "statement": statement,
+                        }
+                    )
+
+    db.session.rollback()
+    return failures
@@ -0,0 +1,177 @@
+import random
+from datetime import datetime, timedelta
+from sqlalchemy import insert, text
+from project import db
+
+
+# synthetic merchants and orders for exercising the database at realistic
+# sizes, for the query plan check and benchmarks. never run against
+# production, every row goes through the same bulk inserts as
+# initialize_orders
+
+SEED_CUSTOMER = {
+    "customer_first_name": "seed",
+    "customer_last_name": "customer",
+    "customer_phone_no": "08000000000",
+    "customer_email_address": "seed@example.com",
+    "customer_country": "ng",
+    "customer_city": "lagos",
+    "customer_address": "1 Seed Street",
+}
+
+
+def seed_merchants(count: int) -> list:
+    """
+    create count merchants with completed accounts, returns their ids
+    """
+
+    from project.merchants.models import Merchant, MerchantDetails, unique_id
+
+    merchants, details = [], []
+    for _ in range(count):
+        merchant_id, key = unique_id(), unique_id()
+        merchants.append(
+            {
+                "id": merchant_id,
+                "email_verified": True,
+                "account_creation_complete": True,
+            }
+        )
+        details.append(
+            {
+                "id": unique_id(),
+                "legal_first_name": "seed",
+                "legal_last_name": "merchant",
+                "residing_country": "ng",
+                "residing_state": "lagos",
+                "residing_address": "1 Seed Street",
+                "email_address": f"{key[-20:]}@seed.test",
+                "password": key,
+                "api_secret_key": f"seed-sk-{key}",
+                "api_public_key": f"seed-pk-{key}",
+                "phone_no": key[-15:],
+                "date_joined": datetime.utcnow(),
+                "date_last_updated": datetime.utcnow(),
+                "merchant_id": merchant_id,
+            }
+        )
+
+    if merchants:
+        db.session.execute(insert(Merchant), merchants)
+        db.session.execute(insert(MerchantDetails), details)
+        db.session.commit()
+
+    return [merchant["id"] for merchant in merchants]
+
+
+def seed_orders(
+    merchant_ids: list, count: int, batch_size: int = 5000, seed: int = 0
+) -> int:
+    """
+    create count orders spread over the given merchants and the past year,
+    each with its details, customer, timeline event, balance, a payment
+    and a condition, and a dispute on every tenth order. returns the
+    number of orders created
+    """
+
+    from project.merchants.models import (
+        Order,
+        OrderDetails,
+        Customer,
+        TransactionTimeline,
+        OrderBalance,
+        TransactionHistory,
+        TransactionCondition,
+        Dispute,
+        unique_id,
+    )
+    from project.merchant_stats import record_new_orders
+    from project.order_index import add_references
+    from project.transactions.transaction_api import order_rows
+
+    rand = random.Random(seed)
+    now = datetime.utcnow()
+    created = 0
+
+    while created < count:
+        size = min(batch_size, count - created)
+        rows, histories, conditions, disputes = [], [], [], []
+        per_merchant = {}
+
+        for _ in range(size):
+            merchant_id = rand.choice(merchant_ids)
+            date = now - timedelta(seconds=rand.randint(0, 365 * 24 * 60 * 60))
+            row = order_rows(
+                {
+                    "product_name": "seed product",
+                    "product_category": "seed",
+                    "product_amount": rand.randint(1000, 500000),
+                    "product_inspection_time": 2,
+                    "product_delivery_time": 3,
+                    "partial_dispersals": False,
+                    "customer_details": SEED_CUSTOMER,
+                },
+                merchant_id,
+                date,
+            )
+            order_id = row["order"]["id"]
+            rows.append(row)
+            per_merchant[merchant_id] = per_merchant.get(merchant_id, 0) + 1
+
+            histories.append(
+                {
+                    "id": unique_id(),
+                    "amount": row["order_details"]["amount_to_pay"],
+                    "status": "success",
+                    "trans_reference": unique_id(),
+                    "sender": "seed customer",
+                    "receiver": "TrustLock Holdings",
+                    "description": "seed payment",
+                    "remark": "seed payment",
+                    "order_id": order_id,
+                }
+            )
+            conditions.append(
+                {
+                    "id": unique_id(),
+                    "condition_title": "seed condition",
+                    "condition_description": "seed condition",
+                    "date_added": date,
+                    "order_id": order_id,
+                }
+            )
+            if rand.random() < 0.1:
+                disputes.append(
+                    {
+                        "id": unique_id(),
+                        "dispute_title": "seed dispute",
+                        "dispute_reason": "seed dispute",
+                        "dispute_raised_date": date,
+                        "order_id": order_id,
+                    }
+                )
+
+        db.session.execute(insert(Order), [row["order"] for row in rows])
+        db.session.execute(insert(OrderDetails), [row["order_details"] for row in rows])
+        db.session.execute(insert(Customer), [row["customer"] for row in rows])
+        db.session.execute(
+            insert(TransactionTimeline), [row["timeline"] for row in rows]
+        )
+        db.session.execute(insert(OrderBalance), [row["order_balance"] for row in rows])
+        db.session.execute(insert(TransactionHistory), histories)
+        db.session.execute(insert(TransactionCondition), conditions)
+        if disputes:
+            db.session.execute(insert(Dispute), disputes)
+        for merchant_id, orders in per_merchant.items():
+            record_new_orders(merchant_id, orders)
+        db.session.commit()
+        add_references([row["order"]["reference_no"] for row in rows])
+
+        created += size
+
+    # fresh planner statistics so the new rows show up in query plans
+    if db.engine.dialect.name == "postgresql":
+        db.session.execute(text("ANALYZE"))
+        db.session.commit()
+
+    return created
@@ -0,0 +1,36 @@
+from project.api_services.sendgrid_api import celery
+
+
+@celery.task(name="process_webhook_event", acks_late=True)
+def process_webhook_event_task(event_id: str):
+    from project.jobs import app
+    from project.webhooks import process_webhook_event
+
+    with app.app_context():
+        process_webhook_event(event_id)
+
+
+@celery.task(bind=True, name="send_email", max_retries=None)
+def send_email_task(self, outbox_id: str):
+    from project.jobs import app
+    from project.email_outbox import deliver_email
+
+    with app.app_context():
+        status = deliver_email(outbox_id)
+
+    if status == "pending":
+        raise self.retry(countdown=30 * 2**self.request.retries)
+
+
+@celery.task(name="send_bulk_emails")
+def send_bulk_emails_task(outbox_ids: list):
+    from project.jobs import app
+    from project.email_outbox import deliver_bulk_emails
+
+    with app.app_context():
+        statuses = deliver_bulk_emails(outbox_ids)
+
+    # emails that failed are retried one by one with backoff
+    for outbox_id, status in statuses.items():
+        if status == "pending":
+            send_email_task.apply_async((outbox_id,), countdown=30)
@@ -0,0 +1,140 @@
+import enum
+from datetime import datetime
+from sqlalchemy import text
+from project import db
+
+
+# the transaction timeline is an append-only event store. each event has a
+# typed event_code to query by, the free text in event_occurrance is only
+# for display. on postgres the table is range partitioned by month on
+# date, partitions are created ahead of time by a scheduled job and old
+# ones are dropped whole for retention
+
+
+class TimelineEvent(str, enum.Enum):
+    ORDER_CREATED = "order_created"
+    CONDITION_SET = "condition_set"
+    PAYMENT_INITIATED = "payment_initiated"
+    PAYMENT_PARTIAL = "payment_partial"
+    PAYMENT_COMPLETED = "payment_completed"
+    PRODUCT_SENT_OUT = "product_sent_out"
+    SELLER_CONFIRMED_DELIVERY = "seller_confirmed_delivery"
+    BUYER_CONFIRMED_DELIVERY = "buyer_confirmed_delivery"
+    DELIVERY_ELAPSED = "delivery_elapsed"
+    CONDITION_MET = "condition_met"
+    CONDITIONS_MET = "conditions_met"
+    INSPECTION_EXTENDED = "inspection_extended"
+    INSPECTION_ELAPSED = "inspection_elapsed"
+    AUTO_PAYOUT_FAILED = "auto_payout_failed"
+    CONDITION_DISPUTED = "condition_disputed"
+    DISPUTE_RAISED = "dispute_raised"
+    CONDITION_DISPUTE_SETTLED = "condition_dispute_settled"
+    DISPUTE_RESOLVED = "dispute_resolved"
+    DISPUTES_RESOLVED = "disputes_resolved"
+    DISPUTE_ELAPSED = "dispute_elapsed"
+    DISPUTE_ACCEPTED = "dispute_accepted"
+    DISPUTE_REJECTED = "dispute_rejected"
+    DISPUTE_UNRESOLVED = "dispute_unresolved"
+    RETURN_SENT_OUT = "return_sent_out"
+    RETURN_CONFIRMED_BUYER = "return_confirmed_buyer"
+    RETURN_CONFIRMED_SELLER = "return_confirmed_seller"
+    RETURN_ELAPSED = "return_elapsed"
+    RETURN_INSPECTION_ELAPSED = "return_inspection_elapsed"
+    RETURN_ACCEPTED = "return_accepted"
+    REFUND_APPROVED = "refund_approved"
+    REFUND_INITIATED = "refund_initiated"
+    REFUND_COMPLETED = "refund_completed"
+    PARTIAL_DISBURSEMENT_APPROVED = "partial_disbursement_approved"
+    PARTIAL_DISBURSEMENT_INITIATED = "partial_disbursement_initiated"
+    PARTIAL_DISBURSEMENT_COMPLETED = "partial_disbursement_completed"
+    DISBURSEMENT_APPROVED = "disbursement_approved"
+    DISBURSEMENT_INITIATED = "disbursement_initiated"
+    DISBURSEMENT_COMPLETED = "disbursement_completed"
+    ORDER_RATED = "order_rated"
+    ORDER_CLOSED = "order_closed"
+    # events recorded before event codes existed that matched no code
+    OTHER = "other"
+
+
+TIMELINE_TABLE = "TransactionTimeline"
+PARTITIONS_AHEAD = 2
+
+
+def month_start(date: datetime, offset: int = 0) -> datetime:
+    month = date.year * 12 + date.month - 1 + offset
+    return datetime(month // 12, month % 12 + 1, 1)
+
+
+def partition_name(month: datetime) -> str:
+    return f"{TIMELINE_TABLE}_y{month.year}m{month.month:02d}"
+
+
+def partitioned() -> bool:
+    return db.engine.dialect.name == "postgresql"
+
+
+def ensure_timeline_partitions(months_ahead: int = PARTITIONS_AHEAD) -> list:
+    """
+    create the monthly partitions from the current month up to
+    months_ahead months out, returns the names of the partitions
+    """
+
+    if not partitioned():
+        return []
+
+    now = datetime.utcnow()
+    names = []
+    for offset in range(months_ahead + 1):
+        start, end = month_start(now, offset), month_start(now, offset + 1)
+        name = partition_name(start)
+        db.session.execute(
+            text(
+                f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "{TIMELINE_TABLE}" '
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+            )
+        )
+        names.append(name)
+
+    db.session.commit()
+    return names
+
+
+def drop_timeline_partitions(before: datetime) -> list:
+    """
+    detach and drop every monthly partition that ends on or before the
+    start of before's month, returns the names dropped
+    """
+
+    if not partitioned():
+        return []
+
+    cutoff = month_start(before)
+    rows = db.session.execute(
+        text(
+            """
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE parent.relname = :table
+            """
+        ),
+        {"table": TIMELINE_TABLE},
+    ).scalars()
+
+    dropped = []
+    for name in sorted(rows):
+        prefix = f"{TIMELINE_TABLE}_y"
+        if not name.startswith(prefix):
+            continue
+        year, month = name[len(prefix) :].split("m")
+        if month_start(datetime(int(year), int(month), 1), 1) > cutoff:
+            continue
+        db.session.execute(
+            text(f'ALTER TABLE "{TIMELINE_TABLE}" DETACH PARTITION "{name}"')
+        )
+        db.session.execute(text(f'DROP TABLE "{name}"'))
+        dropped.append(name)
+
+    db.session.commit()
+    return dropped
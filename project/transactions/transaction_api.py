@@ -6,7 +6,7 @@ import os
 from dotenv import load_dotenv
 import uuid
 from nanoid import generate
-from flask import request, jsonify, current_app
+from flask import request, jsonify, current_app, stream_with_context
 
 from flask_jwt_extended import (
     get_jwt_identity,
@@ -17,9 +17,30 @@ from flask_jwt_extended import (
 )
 import re
 import json
-
-from project import db, jwt, bcrypt, r_client
-from project.helpers import calculate_fees, signature_validation
+import csv
+from itertools import islice
+import io
+
+from sqlalchemy import tuple_, insert
+from sqlalchemy.ext.hybrid import hybrid_property
+
+from project import db, ma, jwt, bcrypt, r_client
+from project import ledger
+from project.helpers import (
+    signature_validation,
+    encode_cursor,
+    decode_cursor,
+)
+from project.order_index import add_reference, add_references
+from project.order_status import OrderFlag, OrderStatus, can_transition, transition
+from project.merchant_stats import record_new_orders
+from project.timeline import TimelineEvent
+from project.deadlines import (
+    schedule_deadline,
+    cancel_deadline,
+    DELIVERY,
+    INSPECTION,
+)
 from . import transaction
 from project.api_services.paystack_api import PaystackClient
 from project.api_services.kora_api import KoraClient
@@ -46,9 +67,34 @@ from ..merchants.models import (
     BusinessDetailsSchema,
     Dispute,
     DisputeSchema,
+    OrderBalance,
+    OrderBalanceSchema,
+    LedgerPostingSchema,
+    unique_id,
 )
 
-from ..decorators import api_secret_key_required, order_exists
+from ..decorators import (
+    api_secret_key_required,
+    idempotent,
+    order_exists,
+    provider_call_started,
+    query_budget,
+)
+from ..webhooks import receive_webhook_event
+from ..email_outbox import queue_email
+from ..fees import (
+    quote,
+    quote_many_memoized,
+    to_kobo,
+    from_kobo,
+    current_schedule_version,
+)
+from ..loaders import (
+    load_order,
+    order_fields,
+    order_load_options,
+    ORDER_RELATIONSHIPS,
+)
 
 load_dotenv()
 
@@ -59,21 +105,21 @@ load_dotenv()
 def get_amount_quote():
     try:
         data = request.get_json()
-        price = data.get("price")
-        price = float(price)
 
-        escrow_fees, process_fees, escrow_percent = calculate_fees(price)
-        total_fees = escrow_fees + process_fees
+        try:
+            fees = quote(data.get("price"))
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
 
         return (
             jsonify(
                 {
                     "status": "success",
                     "prices": {
-                        "escrow_percent": escrow_percent,
-                        "escrow_fees": escrow_fees,
-                        "process_fees": process_fees,
-                        "total_fees": total_fees,
+                        "escrow_percent": float(fees.escrow_percent),
+                        "escrow_fees": from_kobo(fees.escrow_fee),
+                        "process_fees": from_kobo(fees.process_fee),
+                        "total_fees": from_kobo(fees.total_fees),
                     },
                 }
             ),
@@ -85,6 +131,97 @@ def get_amount_quote():
         return jsonify({"status": "error", "message": "something went wrong"}), 500
 
 
+MAX_BULK_QUOTES = 10_000
+
+
+@transaction.post("get_amount_quotes")
+@jwt_required()
+@api_secret_key_required
+def get_amount_quotes():
+    """
+    quote many prices at once. takes a json array of prices (or an object
+    with a prices array) or a csv body with one price per row
+    """
+
+    try:
+        if request.mimetype == "text/csv":
+            # stop reading one row past the limit, the length check below
+            # rejects the upload without the rest of it being parsed
+            rows = csv.reader(io.TextIOWrapper(request.stream, encoding="utf-8"))
+            prices = list(
+                islice(
+                    (
+                        row[0].strip()
+                        for row in rows
+                        if row and row[0].strip() and row[0].strip().lower() != "price"
+                    ),
+                    MAX_BULK_QUOTES + 1,
+                )
+            )
+        else:
+            data = request.get_json()
+            prices = data.get("prices") if isinstance(data, dict) else data
+
+        if not isinstance(prices, list) or not prices:
+            return (
+                jsonify({"status": "error", "message": "a list of prices is required"}),
+                400,
+            )
+
+        if len(prices) > MAX_BULK_QUOTES:
+            return (
+                jsonify(
+                    {
+                        "status": "error",
+                        "message": f"at most {MAX_BULK_QUOTES} prices can be quoted at once",
+                    }
+                ),
+                400,
+            )
+
+        kobo_prices, errors = [], {}
+        for index, price in enumerate(prices):
+            try:
+                kobo_prices.append(to_kobo(price))
+            except ValueError as e:
+                errors[index] = str(e)
+
+        fee_quotes = iter(quote_many_memoized(kobo_prices))
+
+        results = []
+        for index, price in enumerate(prices):
+            if index in errors:
+                results.append({"price": price, "error": errors[index]})
+                continue
+
+            fees = next(fee_quotes)
+            results.append(
+                {
+                    "price": from_kobo(fees.price),
+                    "escrow_percent": float(fees.escrow_percent),
+                    "escrow_fees": from_kobo(fees.escrow_fee),
+                    "process_fees": from_kobo(fees.process_fee),
+                    "total_fees": from_kobo(fees.total_fees),
+                    "amount_to_pay": from_kobo(fees.amount_to_pay),
+                }
+            )
+
+        return (
+            jsonify(
+                {
+                    "status": "success",
+                    "fee_schedule": current_schedule_version(),
+                    "prices": results,
+                }
+            ),
+            200,
+        )
+
+    except Exception as e:
+        print(e)
+        return jsonify({"status": "error", "message": "something went wrong"}), 500
+
+
 @transaction.post("initialize_order")
 @jwt_required()
 @api_secret_key_required
@@ -114,11 +251,11 @@ def initialize_order():
 
         current_merchant = Merchant.query.filter_by(id=current_user.id).first()
         ref_no = generate()
-        escrow_fee, process_fee, escrow_percent = calculate_fees(
-            data.get("product_amount")
-        )
-        total_fees = escrow_fee + process_fee
-        amount_to_pay = total_fees + data.get("product_amount")
+        fees = quote(data.get("product_amount"))
+        escrow_fee = from_kobo(fees.escrow_fee)
+        process_fee = from_kobo(fees.process_fee)
+        escrow_percent = float(fees.escrow_percent)
+        amount_to_pay = from_kobo(fees.amount_to_pay)
 
         customer_details = {
             key: value.lower()
@@ -166,18 +303,22 @@ def initialize_order():
 
         timeline_update = TransactionTimeline(
             event_occurrance=f"Order Success fully created with ref_no {ref_no}",
+            event_code=TimelineEvent.ORDER_CREATED,
             category="Order Creation",
             order=new_order,
         )
 
+        order_balance = OrderBalance(order=new_order)
+
         order_schema = OrderSchema()
         order = order_schema.dump(new_order)
-        r_client.rpush("order_ref_nos", ref_no)
         db.session.add(new_order)
         db.session.add(new_order_details)
         db.session.add(customer)
         db.session.add(timeline_update)
+        db.session.add(order_balance)
         db.session.commit()
+        add_reference(ref_no)
 
         return jsonify(
             {
@@ -195,20 +336,308 @@ def initialize_order():
         return jsonify({"status": "error", "message": "something went wrong"}), 500
 
 
+MAX_BULK_ORDERS = 1_000
+
+REQUIRED_ORDER_FIELDS = (
+    "product_name",
+    "product_category",
+    "product_amount",
+    "product_inspection_time",
+    "product_delivery_time",
+)
+REQUIRED_CUSTOMER_FIELDS = (
+    "customer_first_name",
+    "customer_last_name",
+    "customer_phone_no",
+    "customer_email_address",
+    "customer_country",
+    "customer_city",
+    "customer_address",
+)
+OPTIONAL_ORDER_FIELDS = ("product_description", "amount_to_partially_disburse")
+
+
+def check_fields(model, values: dict, prefix: str = ""):
+    """
+    check payload values against the column types of model, the column
+    being the field name without prefix. raises ValueError naming the
+    first field whose value wouldn't fit its column
+    """
+
+    for field, value in values.items():
+        if value is None:
+            continue
+
+        column_type = model.__table__.columns[field[len(prefix) :]].type
+        python_type = column_type.python_type
+        if python_type is str:
+            length = getattr(column_type, "length", None)
+            if not isinstance(value, str) or (length and len(value) > length):
+                raise ValueError(
+                    f"{field} must be text of at most {length} characters"
+                    if length
+                    else f"{field} must be text"
+                )
+        elif python_type in (int, float):
+            number_types = (int,) if python_type is int else (int, float)
+            if isinstance(value, bool) or not isinstance(value, number_types):
+                raise ValueError(
+                    f"{field} must be a whole number"
+                    if python_type is int
+                    else f"{field} must be a number"
+                )
+        elif python_type is bool and not isinstance(value, bool):
+            raise ValueError(f"{field} must be true or false")
+
+
+def order_rows(data: dict, merchant_id: str, now: datetime) -> dict:
+    """
+    validate one order payload and build the Order, OrderDetails, Customer
+    and TransactionTimeline rows for it. raises ValueError when invalid
+    """
+
+    if not isinstance(data, dict):
+        raise ValueError("order must be an object")
+
+    customer_details = data.get("customer_details")
+    if not isinstance(customer_details, dict):
+        raise ValueError("please ensure customer details are added")
+
+    missing = [field for field in REQUIRED_ORDER_FIELDS if data.get(field) is None]
+    missing += [
+        field for field in REQUIRED_CUSTOMER_FIELDS if not customer_details.get(field)
+    ]
+    if missing:
+        raise ValueError(f"missing fields {', '.join(missing)}")
+
+    # one value that doesn't fit its column would fail a whole bulk insert
+    partial_dispersals = data.get("partial_dispersals")
+    if partial_dispersals is not None and not isinstance(partial_dispersals, bool):
+        raise ValueError("partial_dispersals must be true or false")
+    check_fields(
+        OrderDetails,
+        {
+            field: data.get(field)
+            for field in REQUIRED_ORDER_FIELDS + OPTIONAL_ORDER_FIELDS
+        },
+    )
+    check_fields(
+        Customer,
+        {field: customer_details.get(field) for field in REQUIRED_CUSTOMER_FIELDS},
+        prefix="customer_",
+    )
+
+    fees = quote(data.get("product_amount"))
+
+    customer_details = {
+        key: value.lower()
+        if isinstance(value, str) and key != "customer_address"
+        else value
+        for key, value in customer_details.items()
+    }
+
+    order_id = unique_id()
+    ref_no = generate()
+
+    return {
+        "order": {
+            "id": order_id,
+            "reference_no": ref_no,
+            "flags": int(OrderFlag.PARTIAL_DISPERSALS) if partial_dispersals else 0,
+            "merchant_id": merchant_id,
+            "date_initiated": now,
+            "date_updated": now,
+        },
+        "order_details": {
+            "id": unique_id(),
+            "product_name": data.get("product_name"),
+            "product_category": data.get("product_category"),
+            "product_description": data.get("product_description"),
+            "product_amount": data.get("product_amount"),
+            "escrow_percent": float(fees.escrow_percent),
+            "escrow_fee": from_kobo(fees.escrow_fee),
+            "process_fee": from_kobo(fees.process_fee),
+            "amount_to_pay": from_kobo(fees.amount_to_pay),
+            "amount_to_balance": from_kobo(fees.amount_to_pay),
+            "amount_to_partially_disburse": data.get("amount_to_partially_disburse"),
+            "amount_remaining_to_be_disbursed": data.get("product_amount"),
+            "product_inspection_time": data.get("product_inspection_time"),
+            "product_delivery_time": data.get("product_delivery_time"),
+            "total_amount_to_be_disbursed": data.get("product_amount"),
+            "current_holdings_amount": 0.0,
+            "details_metadata": data.get("metadata"),
+            "date_updated": now,
+            "order_id": order_id,
+        },
+        "customer": {
+            "id": unique_id(),
+            "first_name": customer_details.get("customer_first_name"),
+            "last_name": customer_details.get("customer_last_name"),
+            "phone_no": customer_details.get("customer_phone_no"),
+            "email_address": customer_details.get("customer_email_address"),
+            "country": customer_details.get("customer_country"),
+            "city": customer_details.get("customer_city"),
+            "address": customer_details.get("customer_address"),
+            "order_id": order_id,
+        },
+        "timeline": {
+            "id": unique_id(),
+            "event_code": TimelineEvent.ORDER_CREATED,
+            "event_occurrance": f"Order Success fully created with ref_no {ref_no}",
+            "category": "Order Creation",
+            "date": now,
+            "order_id": order_id,
+        },
+        "order_balance": {"order_id": order_id, "date_updated": now},
+    }
+
+
+@transaction.post("initialize_orders")
+@jwt_required()
+@api_secret_key_required
+@idempotent
+def initialize_orders():
+    """
+    create a batch of orders in one transaction. each table gets a single
+    multi-row INSERT and the order index is updated in one redis call.
+    invalid orders are reported per item and the rest are still created
+    """
+
+    try:
+
+        if not current_user.account_creation_complete:
+            return (
+                jsonify(status="error", message="please complete account creation"),
+                400,
+            )
+
+        data = request.get_json()
+        orders = data.get("orders") if isinstance(data, dict) else data
+
+        if not isinstance(orders, list) or not orders:
+            return (
+                jsonify({"status": "error", "message": "a list of orders is required"}),
+                400,
+            )
+
+        if len(orders) > MAX_BULK_ORDERS:
+            return (
+                jsonify(
+                    {
+                        "status": "error",
+                        "message": f"at most {MAX_BULK_ORDERS} orders can be created at once",
+                    }
+                ),
+                400,
+            )
+
+        now = datetime.utcnow()
+        results, rows = [], []
+        for index, order_data in enumerate(orders):
+            try:
+                order_row = order_rows(order_data, current_user.id, now)
+            except ValueError as e:
+                results.append({"index": index, "status": "error", "message": str(e)})
+                continue
+
+            rows.append(order_row)
+            results.append(
+                {
+                    "index": index,
+                    "status": "success",
+                    "reference_no": order_row["order"]["reference_no"],
+                    "escrow_fee": order_row["order_details"]["escrow_fee"],
+                    "process_fee": order_row["order_details"]["process_fee"],
+                    "amount_to_pay": order_row["order_details"]["amount_to_pay"],
+                }
+            )
+
+        if rows:
+            db.session.execute(insert(Order), [row["order"] for row in rows])
+            db.session.execute(
+                insert(OrderDetails), [row["order_details"] for row in rows]
+            )
+            db.session.execute(insert(Customer), [row["customer"] for row in rows])
+            db.session.execute(
+                insert(TransactionTimeline), [row["timeline"] for row in rows]
+            )
+            db.session.execute(
+                insert(OrderBalance), [row["order_balance"] for row in rows]
+            )
+            record_new_orders(current_user.id, len(rows))
+            db.session.commit()
+            add_references([row["order"]["reference_no"] for row in rows])
+
+        return (
+            jsonify(
+                {
+                    "status": "success",
+                    "message": f"successfully initiated {len(rows)} of {len(orders)} orders",
+                    "orders": results,
+                }
+            ),
+            200,
+        )
+
+    except Exception as e:
+        db.session.rollback()
+        print(e)
+        return jsonify({"status": "error", "message": "something went wrong"}), 500
+
+
 @transaction.get("get_all_orders")
+@query_budget(8)
 @jwt_required()
 @api_secret_key_required
 def get_all_orders():
     try:
-        orders = Order.query.filter_by(merchant_id=current_user.id)
+        try:
+            limit = min(int(request.args.get("limit", 50)), 200)
+            fields = order_fields(
+                fields=request.args.get("fields"), expand=request.args.get("expand")
+            )
+            cursor = request.args.get("cursor")
+            cursor = decode_cursor(cursor) if cursor else None
+            status = request.args.get("status")
+            status = OrderStatus(status) if status else None
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+
+        if limit < 1:
+            return (
+                jsonify({"status": "error", "message": "limit must be at least 1"}),
+                400,
+            )
+
+        query = (
+            Order.query.filter_by(merchant_id=current_user.id)
+            .options(*order_load_options(fields))
+            .order_by(Order.date_initiated.desc(), Order.id.desc())
+        )
+        if status:
+            query = query.filter(Order.status == status)
+        if cursor:
+            query = query.filter(tuple_(Order.date_initiated, Order.id) < cursor)
+
+        orders = query.limit(limit + 1).all()
+        next_cursor = (
+            encode_cursor(orders[limit - 1].date_initiated, orders[limit - 1].id)
+            if len(orders) > limit
+            else None
+        )
 
-        order_schema = OrderSchema(many=True)
+        order_schema = OrderSchema(many=True, only=fields)
 
-        schema = order_schema.dump(orders)
+        schema = order_schema.dump(orders[:limit])
 
         return (
             jsonify(
-                {"status": "success", "message": "retrieved all orders", "data": schema}
+                {
+                    "status": "success",
+                    "message": "retrieved orders",
+                    "data": schema,
+                    "next_cursor": next_cursor,
+                }
             ),
             200,
         )
@@ -218,13 +647,145 @@ def get_all_orders():
         return jsonify({"status": "error", "message": "something went wrong"}), 500
 
 
+@transaction.get("export_orders")
+@jwt_required()
+@api_secret_key_required
+def export_orders():
+    try:
+        export_format = request.args.get("format", "ndjson").lower()
+        if export_format not in ("ndjson", "csv"):
+            return (
+                jsonify({"status": "error", "message": "format must be ndjson or csv"}),
+                400,
+            )
+
+        try:
+            fields = order_fields(
+                fields=request.args.get("fields"), expand=request.args.get("expand")
+            )
+            start_date = request.args.get("start_date")
+            start_date = datetime.fromisoformat(start_date) if start_date else None
+            end_date = request.args.get("end_date")
+            end_date = datetime.fromisoformat(end_date) if end_date else None
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+
+        query = Order.query.filter_by(merchant_id=current_user.id)
+        if start_date:
+            query = query.filter(Order.date_initiated >= start_date)
+        if end_date:
+            query = query.filter(Order.date_initiated <= end_date)
+
+        # any status or flag boolean on Order can be used as a filter,
+        # e.g. ?order_closed=true&dispute_raised=false
+        for name, descriptor in db.inspect(Order).all_orm_descriptors.items():
+            value = request.args.get(name)
+            if value is None or not isinstance(descriptor, hybrid_property):
+                continue
+            if value.lower() not in ("true", "false"):
+                return (
+                    jsonify(
+                        {
+                            "status": "error",
+                            "message": f"{name} must be true or false",
+                        }
+                    ),
+                    400,
+                )
+            condition = getattr(Order, name)
+            query = query.filter(condition if value.lower() == "true" else ~condition)
+
+        query = (
+            query.options(*order_load_options(fields))
+            .order_by(Order.date_initiated, Order.id)
+            .yield_per(500)
+        )
+
+        order_schema = OrderSchema(only=fields)
+
+        def generate_ndjson():
+            for order in query:
+                yield json.dumps(order_schema.dump(order), default=str) + "\n"
+
+        def generate_csv():
+            # csv rows carry the order and its single valued relationships,
+            # nested collections are only available in the ndjson export.
+            # the header comes from the schema so every row has the same
+            # columns whatever its values
+            columns = [
+                field
+                for field in fields
+                if field not in ORDER_RELATIONSHIPS
+                or field in ("order_details", "customer")
+            ]
+            header = []
+            for field in columns:
+                schema_field = order_schema.fields[field]
+                if isinstance(schema_field, ma.Nested) and not schema_field.many:
+                    header += [f"{field}.{key}" for key in schema_field.schema.fields]
+                else:
+                    header.append(field)
+
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(header)
+
+            for order in query:
+                row = {}
+                for field, value in order_schema.dump(order).items():
+                    if field not in columns:
+                        continue
+                    if isinstance(value, dict):
+                        row.update(
+                            {f"{field}.{key}": item for key, item in value.items()}
+                        )
+                    else:
+                        row[field] = value
+
+                writer.writerow([row.get(column) for column in header])
+
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate(0)
+
+            yield buffer.getvalue()
+
+        stream_rows, mimetype = (
+            (generate_ndjson, "application/x-ndjson")
+            if export_format == "ndjson"
+            else (generate_csv, "text/csv")
+        )
+
+        return current_app.response_class(
+            stream_with_context(stream_rows()),
+            mimetype=mimetype,
+            headers={
+                "Content-Disposition": f"attachment; filename=orders.{export_format}"
+            },
+        )
+
+    except Exception as e:
+        print(e)
+        return jsonify({"status": "error", "message": "something went wrong"}), 500
+
+
 @transaction.get("get_order/<ref_no>")
+@query_budget(8)
 @jwt_required()
 @api_secret_key_required
-@order_exists
+@order_exists(
+    load=(
+        "order_details",
+        "delivery_information",
+        "transaction_history",
+        "transaction_timeline",
+        "dispute",
+        "customer",
+    )
+)
 def get_order(ref_no):
     try:
-        order = Order.query.filter_by(reference_no=ref_no).first()
+        order = load_order(ref_no)
 
         order_schema = OrderSchema()
 
@@ -262,7 +823,7 @@ def set_conditions(ref_no):
                 400,
             )
 
-        target_order = Order.query.filter_by(reference_no=ref_no).first()
+        target_order = load_order(ref_no)
         if not target_order:
             return (
                 jsonify(
@@ -291,6 +852,7 @@ def set_conditions(ref_no):
 
             new_timeline = TransactionTimeline(
                 event_occurrance=f"Condition '{condition.get('condition_title')}' has been set",
+                event_code=TimelineEvent.CONDITION_SET,
                 category="Conditions",
                 order=target_order,
             )
@@ -320,14 +882,20 @@ def set_conditions(ref_no):
 @transaction.post("initiate_product_payment/<ref_no>")
 @jwt_required()
 @api_secret_key_required
-@order_exists
+@idempotent
+@order_exists(load=("order_details", "customer"))
 def initiate_product_payment(ref_no):
     try:
 
-        current_merchant = Merchant.query.filter_by(id=current_user.id).first()
-        target_order = Order.query.filter_by(
-            merchant_id=current_merchant.id, reference_no=ref_no
-        ).first()
+        target_order = load_order(ref_no)
+
+        if target_order.merchant_id != current_user.id:
+            return (
+                jsonify(
+                    {"status": "error", "message": f"order {ref_no} doesn't exist"}
+                ),
+                400,
+            )
 
         if target_order.full_payment_verified:
             return (
@@ -370,6 +938,7 @@ def initiate_product_payment(ref_no):
             "callback_url": "https://elegant-buck-deciding.ngrok-free.app/api/dev/v1/verify_payment",
         }
 
+        provider_call_started()
         response, status_code = paystack_client.initialize_transaction(payload)
 
         if not response["status"]:
@@ -384,12 +953,14 @@ def initiate_product_payment(ref_no):
         filler2 = "full"
         timeline_update = TransactionTimeline(
             event_occurrance=f"Transaction for {(filler1 if target_order.need_to_balance else filler2)} payment of escrow service for order {ref_no} succesfully initialized with ref_no {trans_ref_no}",
+            event_code=TimelineEvent.PAYMENT_INITIATED,
             category="Deposit Initiation",
             order=target_order,
         )
 
         db.session.add(timeline_update)
-        target_order.payment_initiated = True
+        if not target_order.need_to_balance:
+            transition(target_order, OrderStatus.PAYMENT_PENDING)
         target_order.date_updated = datetime.utcnow()
         db.session.commit()
 
@@ -452,6 +1023,28 @@ def verify_payment():
 
         naira_amount = response["data"]["amount"] / 100
 
+        payment_reference = f'ps_res_{response["data"]["reference"]}'
+        if ledger.posted(payment_reference):
+            return (
+                jsonify(
+                    {
+                        "status": "error",
+                        "message": "payment has already been verified",
+                    }
+                ),
+                400,
+            )
+
+        ledger.transfer(
+            target_order.id,
+            ledger.BUYER,
+            ledger.ESCROW,
+            response["data"]["amount"],
+            payment_reference,
+            f"Payment into escrow for order {order_ref_no}",
+        )
+        ledger.sync_order_amounts(target_order)
+
         if info_dict["need_to_balance"]:
             amount_to_balance = target_order.order_details.amount_to_balance
             if naira_amount < amount_to_balance:
@@ -459,7 +1052,7 @@ def verify_payment():
 
                 new_trans_entry = TransactionHistory(
                     amount=naira_amount,
-                    trans_reference=f'ps_res_{response["data"]["reference"]}',
+                    trans_reference=payment_reference,
                     sender=f"{target_order.customer.first_name} {target_order.customer.last_name}",
                     status="Success",
                     remark=f"Paystack Services to TrustLock Holdings for user {current_user.id}",
@@ -470,6 +1063,7 @@ def verify_payment():
 
                 new_timeline = TransactionTimeline(
                     event_occurrance=f"Partial payment of {naira_amount} paid into TrustLock Holdings.",
+                    event_code=TimelineEvent.PAYMENT_PARTIAL,
                     category="Order Deposit",
                     order=target_order,
                 )
@@ -477,30 +1071,25 @@ def verify_payment():
                 db.session.add(new_trans_entry)
                 db.session.add(new_timeline)
 
-                target_order.order_details.current_holdings_amount += naira_amount
                 target_order.order_details.amount_paid += naira_amount
                 target_order.order_details.amount_to_balance = balance_payment
                 target_order.order_details.date_updated = datetime.utcnow()
 
-                db.session.commit()
-
-                from project.api_services.sendgrid_api import Mailer
-
-                mailer = Mailer()
-
                 formatted_price = "{:,.2f}".format(naira_amount)
-                payload = {
-                    "customer_name": current_user.orders.customer.first_name,
-                    "amount_paid": f"N {formatted_price}.",
-                    "product_name": target_order.order_details.product_name,
-                    "transaction_id": response["data"]["reference"],
-                    "payment_date": datetime.utcnow(),
-                }
-
-                data, status = mailer.send_payment_confirmation_mail(
-                    current_user.orders.customer.email_address, payload
+                queue_email(
+                    "payment_confirmation",
+                    target_order.customer.email_address,
+                    {
+                        "customer_name": target_order.customer.first_name.capitalize(),
+                        "amount_paid": f"N {formatted_price}.",
+                        "product_name": target_order.order_details.product_name,
+                        "transaction_id": response["data"]["reference"],
+                        "payment_date": str(datetime.utcnow()),
+                    },
                 )
-                print(data, status)
+
+                db.session.commit()
+
                 return (
                     jsonify(
                         {
@@ -515,7 +1104,7 @@ def verify_payment():
             if naira_amount >= amount_to_balance:
                 new_trans_entry = TransactionHistory(
                     amount=naira_amount,
-                    trans_reference=f'ps_res_{response["data"]["reference"]}',
+                    trans_reference=payment_reference,
                     sender=f"{target_order.customer.first_name} {target_order.customer.last_name}",
                     receiver="TrustLock Holdings",
                     status="Success",
@@ -526,6 +1115,7 @@ def verify_payment():
 
                 new_timeline = TransactionTimeline(
                     event_occurrance=f"Full balance payment of {naira_amount} paid into TrustLock Holdings. Order has been commenced",
+                    event_code=TimelineEvent.PAYMENT_COMPLETED,
                     category="Order Deposit",
                     order=target_order,
                 )
@@ -534,7 +1124,6 @@ def verify_payment():
                 db.session.add(new_timeline)
 
                 target_order.order_details.amount_paid += naira_amount
-                target_order.order_details.current_holdings_amount += naira_amount
                 target_order.order_details.amount_to_balance = 0.0
                 target_order.product_overpay = (
                     True if naira_amount > amount_to_balance else False
@@ -544,29 +1133,38 @@ def verify_payment():
                     if naira_amount > amount_to_balance
                     else 0.0
                 )
-                target_order.full_payment_verified = True
-                target_order.order_commenced = True
-                target_order.delivery_time_triggered = True
+                transition(target_order, OrderStatus.COMMENCED)
+                ledger.transfer(
+                    target_order.id,
+                    ledger.ESCROW,
+                    ledger.FEES,
+                    ledger.order_fees(target_order.order_details),
+                    f"fees_{target_order.id}",
+                    f"Escrow and processing fees for order {order_ref_no}",
+                )
+                ledger.sync_order_amounts(target_order)
                 target_order.date_commenced = datetime.utcnow()
-                target_order.need_to_balance = False
                 target_order.date_updated = datetime.utcnow()
-                db.session.commit()
-
-                from project.api_services.sendgrid_api import Mailer
-
-                mailer = Mailer()
 
                 formatted_price = "{:,.2f}".format(naira_amount)
-                payload = {
-                    "customer_name": (target_order.customer.first_name).capitalize(),
-                    "amount_paid": f"N {formatted_price}.",
-                    "product_name": target_order.order_details.product_name,
-                    "transaction_id": response["data"]["reference"],
-                    "payment_date": datetime.utcnow(),
-                }
+                queue_email(
+                    "payment_confirmation",
+                    target_order.customer.email_address,
+                    {
+                        "customer_name": target_order.customer.first_name.capitalize(),
+                        "amount_paid": f"N {formatted_price}.",
+                        "product_name": target_order.order_details.product_name,
+                        "transaction_id": response["data"]["reference"],
+                        "payment_date": str(datetime.utcnow()),
+                    },
+                )
 
-                data, status = mailer.send_payment_confirmation_mail(
-                    target_order.customer.email_address, payload
+                db.session.commit()
+                schedule_deadline(
+                    DELIVERY,
+                    order_ref_no,
+                    target_order.date_commenced
+                    + timedelta(days=target_order.order_details.product_delivery_time),
                 )
 
                 return (
@@ -583,7 +1181,7 @@ def verify_payment():
             balance_payment = amount_to_pay - naira_amount
             new_trans_entry = TransactionHistory(
                 amount=naira_amount,
-                trans_reference=f'ps_res_{response["data"]["reference"]}',
+                trans_reference=payment_reference,
                 sender=f"{target_order.customer.first_name} {target_order.customer.last_name}",
                 status="Success",
                 remark=f"Paystack Services to TrustLock Holdings for user {current_user.id}",
@@ -594,6 +1192,7 @@ def verify_payment():
 
             new_timeline = TransactionTimeline(
                 event_occurrance=f"Partial payment of {naira_amount} paid into TrustLock Holdings.",
+                event_code=TimelineEvent.PAYMENT_PARTIAL,
                 category="Order Deposit",
                 order=target_order,
             )
@@ -601,32 +1200,26 @@ def verify_payment():
             db.session.add(new_trans_entry)
             db.session.add(new_timeline)
 
-            target_order.order_details.current_holdings_amount = naira_amount
             target_order.order_details.amount_paid = naira_amount
             target_order.order_details.amount_to_balance = balance_payment
             target_order.order_details.date_updated = datetime.utcnow()
-            target_order.need_to_balance = True
-
-            db.session.commit()
-
-            from project.api_services.sendgrid_api import Mailer
-
-            mailer = Mailer()
+            transition(target_order, OrderStatus.PARTIALLY_PAID)
 
             formatted_price = "{:,.2f}".format(naira_amount)
-            payload = {
-                "customer_name": current_user.orders.customer.first_name,
-                "amount_paid": f"N {formatted_price}.",
-                "product_name": target_order.order_details.product_name,
-                "transaction_id": response["data"]["reference"],
-                "payment_date": datetime.utcnow(),
-            }
-
-            data, status = mailer.send_payment_confirmation_mail(
-                current_user.orders.customer.email_address, payload
+            queue_email(
+                "payment_confirmation",
+                target_order.customer.email_address,
+                {
+                    "customer_name": target_order.customer.first_name.capitalize(),
+                    "amount_paid": f"N {formatted_price}.",
+                    "product_name": target_order.order_details.product_name,
+                    "transaction_id": response["data"]["reference"],
+                    "payment_date": str(datetime.utcnow()),
+                },
             )
-            print(data, status)
-            # MAKE THIS A THREAD!!!!!
+
+            db.session.commit()
+
             return (
                 jsonify(
                     {
@@ -641,7 +1234,7 @@ def verify_payment():
         if naira_amount >= amount_to_pay:
             new_trans_entry = TransactionHistory(
                 amount=naira_amount,
-                trans_reference=f'ps_res_{response["data"]["reference"]}',
+                trans_reference=payment_reference,
                 sender=f"{target_order.customer.first_name} {target_order.customer.last_name}",
                 receiver="TrustLock Holdings",
                 status="Success",
@@ -652,6 +1245,7 @@ def verify_payment():
 
             new_timeline = TransactionTimeline(
                 event_occurrance=f"Full payment of {naira_amount} paid into TrustLock Holdings. Order has been commenced",
+                event_code=TimelineEvent.PAYMENT_COMPLETED,
                 category="Order Deposit",
                 order=target_order,
             )
@@ -660,7 +1254,6 @@ def verify_payment():
             db.session.add(new_timeline)
 
             target_order.order_details.amount_paid = naira_amount
-            target_order.order_details.current_holdings_amount = naira_amount
             target_order.product_overpay = (
                 True if naira_amount > amount_to_pay else False
             )
@@ -668,28 +1261,38 @@ def verify_payment():
                 (naira_amount - amount_to_pay) if naira_amount > amount_to_pay else 0.0
             )
             target_order.order_details.amount_to_balance = 0.00
-            target_order.full_payment_verified = True
-            target_order.delivery_time_triggered = True
-            target_order.order_commenced = True
+            transition(target_order, OrderStatus.COMMENCED)
+            ledger.transfer(
+                target_order.id,
+                ledger.ESCROW,
+                ledger.FEES,
+                ledger.order_fees(target_order.order_details),
+                f"fees_{target_order.id}",
+                f"Escrow and processing fees for order {order_ref_no}",
+            )
+            ledger.sync_order_amounts(target_order)
             target_order.date_commenced = datetime.utcnow()
             target_order.date_updated = datetime.utcnow()
-            db.session.commit()
-
-            from project.api_services.sendgrid_api import Mailer
-
-            mailer = Mailer()
 
             formatted_price = "{:,.2f}".format(naira_amount)
-            payload = {
-                "customer_name": (target_order.customer.first_name).capitalize(),
-                "amount_paid": f"N {formatted_price}.",
-                "product_name": target_order.order_details.product_name,
-                "transaction_id": response["data"]["reference"],
-                "payment_date": datetime.utcnow(),
-            }
+            queue_email(
+                "payment_confirmation",
+                target_order.customer.email_address,
+                {
+                    "customer_name": target_order.customer.first_name.capitalize(),
+                    "amount_paid": f"N {formatted_price}.",
+                    "product_name": target_order.order_details.product_name,
+                    "transaction_id": response["data"]["reference"],
+                    "payment_date": str(datetime.utcnow()),
+                },
+            )
 
-            data, status = mailer.send_payment_confirmation_mail(
-                target_order.customer.email_address, payload
+            db.session.commit()
+            schedule_deadline(
+                DELIVERY,
+                order_ref_no,
+                target_order.date_commenced
+                + timedelta(days=target_order.order_details.product_delivery_time),
             )
 
             return (
@@ -714,7 +1317,7 @@ def verify_payment():
 @order_exists
 def confirm_product_sentout(ref_no):
     try:
-        target_order = Order.query.filter_by(reference_no=ref_no).first()
+        target_order = load_order(ref_no)
 
         if not (target_order.full_payment_verified and target_order.order_commenced):
             return (
@@ -734,10 +1337,14 @@ def confirm_product_sentout(ref_no):
             )
 
         target_order.product_sent_out = True
+        # a dispute raised before delivery keeps the order in the dispute flow
+        if target_order.status == OrderStatus.COMMENCED:
+            transition(target_order, OrderStatus.SHIPPED)
         target_order.date_updated = datetime.utcnow()
 
         new_timeline = TransactionTimeline(
             event_occurrance=f"Order {ref_no} has just been sent out for delivey",
+            event_code=TimelineEvent.PRODUCT_SENT_OUT,
             category="Delivery Sendout",
             order=target_order,
         )
@@ -768,7 +1375,7 @@ def confirm_product_sentout(ref_no):
 def seller_confirm_delivery(ref_no):
     try:
 
-        target_order = Order.query.filter_by(reference_no=ref_no).first()
+        target_order = load_order(ref_no)
 
         if not target_order.product_sent_out:
             return (
@@ -795,6 +1402,7 @@ def seller_confirm_delivery(ref_no):
 
         new_timeline = TransactionTimeline(
             event_occurrance=f"Order {ref_no} has just been confirmed by seller as delivered, awaiting buyer confirmation",
+            event_code=TimelineEvent.SELLER_CONFIRMED_DELIVERY,
             category="Delivery Verification",
             order=target_order,
         )
@@ -821,12 +1429,12 @@ def seller_confirm_delivery(ref_no):
 @transaction.put("buyer_confirm_delivery/<ref_no>")
 @jwt_required()
 @api_secret_key_required
-@order_exists
+@order_exists(load=("order_details",))
 def buyer_confirm_delivery(ref_no):
 
     try:
 
-        target_order = Order.query.filter_by(reference_no=ref_no).first()
+        target_order = load_order(ref_no)
 
         if not target_order.product_sent_out:
             return (
@@ -847,18 +1455,25 @@ def buyer_confirm_delivery(ref_no):
 
         target_order.seller_confirm_delivery = True
         target_order.buyer_confirm_delivery = True
-        target_order.inspection_time_triggered = True
+        if target_order.status == OrderStatus.SHIPPED:
+            transition(target_order, OrderStatus.INSPECTION)
         target_order.date_buyer_confirm_delivery = datetime.utcnow()
+        target_order.inspection_deadline_at = datetime.utcnow() + timedelta(
+            days=target_order.order_details.product_inspection_time
+        )
         target_order.date_updated = datetime.utcnow()
 
         new_timeline = TransactionTimeline(
             event_occurrance=f"Order {ref_no} has just been confirmed by buyer as delivered, inspection time triggered",
+            event_code=TimelineEvent.BUYER_CONFIRMED_DELIVERY,
             category="Delivery Verification",
             order=target_order,
         )
 
         db.session.add(new_timeline)
         db.session.commit()
+        cancel_deadline(DELIVERY, ref_no)
+        schedule_deadline(INSPECTION, ref_no, target_order.inspection_deadline_at)
 
         return (
             jsonify(
@@ -877,12 +1492,13 @@ def buyer_confirm_delivery(ref_no):
 
 
 @transaction.get("retrieve_conditions/<ref_no>")
+@query_budget(3)
 @jwt_required()
 @api_secret_key_required
-@order_exists
+@order_exists(load=("transaction_condition",))
 def retrieve_conditions(ref_no):
     try:
-        target_order = Order.query.filter_by(reference_no=ref_no).first()
+        target_order = load_order(ref_no)
 
         target_conditions = target_order.transaction_condition
 
@@ -912,7 +1528,7 @@ def retrieve_conditions(ref_no):
 @order_exists
 def validate_conditions(ref_no, con_id):
     try:
-        target_order = Order.query.filter_by(reference_no=ref_no).first()
+        target_order = load_order(ref_no)
 
         if not target_order.buyer_confirm_delivery:
             return (
@@ -939,6 +1555,7 @@ def validate_conditions(ref_no, con_id):
             target_condition.date_met = datetime.utcnow()
             new_timeline = TransactionTimeline(
                 event_occurrance=f"Condition {target_condition.id} has been confirmed as met",
+                event_code=TimelineEvent.CONDITION_MET,
                 category="Condition Confirmation",
                 order=target_order,
             )
@@ -985,10 +1602,10 @@ def validate_conditions(ref_no, con_id):
 @transaction.put("validate_all_conditions/<ref_no>")
 @jwt_required()
 @api_secret_key_required
-@order_exists
+@order_exists(load=("transaction_condition",))
 def validate_all_conditions(ref_no):
     try:
-        target_order = Order.query.filter_by(reference_no=ref_no).first()
+        target_order = load_order(ref_no)
 
         if not target_order.buyer_confirm_delivery:
             return (
@@ -1025,6 +1642,7 @@ def validate_all_conditions(ref_no):
                 condition.date_met = datetime.utcnow()
                 new_timeline = TransactionTimeline(
                     event_occurrance=f"Condition {condition.id} has been confirmed as met",
+                    event_code=TimelineEvent.CONDITION_MET,
                     category="Condition Confirmation",
                     order=target_order,
                 )
@@ -1053,10 +1671,10 @@ def validate_all_conditions(ref_no):
 @transaction.put("verify_conditions_met/<ref_no>")
 @jwt_required()
 @api_secret_key_required
-@order_exists
+@order_exists(load=("transaction_condition",))
 def verify_conditions(ref_no):
     try:
-        target_order = Order.query.filter_by(reference_no=ref_no).first()
+        target_order = load_order(ref_no)
 
         all_conditions_met = all(
             condition.condition_met == True
@@ -1079,6 +1697,7 @@ def verify_conditions(ref_no):
 
             new_timeline = TransactionTimeline(
                 event_occurrance=f"All conditions have been met and verified",
+                event_code=TimelineEvent.CONDITIONS_MET,
                 category="Condition Confirmation",
                 order=target_order,
             )
@@ -1118,7 +1737,7 @@ def verify_conditions(ref_no):
 @order_exists
 def approve_partial_disbursement(ref_no):
     try:
-        target_order = Order.query.filter_by(reference_no=ref_no).first()
+        target_order = load_order(ref_no)
 
         if target_order.partial_disbursement_approved:
             return (
@@ -1183,6 +1802,7 @@ def approve_partial_disbursement(ref_no):
             target_order.partial_disbursement_approved = True
             new_timeline = TransactionTimeline(
                 event_occurrance=f"Partial Disbursements for order {ref_no} ready for initiation",
+                event_code=TimelineEvent.PARTIAL_DISBURSEMENT_APPROVED,
                 category="Disbursement Approval",
                 order=target_order,
             )
@@ -1209,10 +1829,11 @@ def approve_partial_disbursement(ref_no):
 @transaction.put("initiate_partial_disbursements/<ref_no>")
 @jwt_required()
 @api_secret_key_required
-@order_exists
+@idempotent
+@order_exists(load=("order_details",))
 def initiate_partial_disbursement(ref_no):
     try:
-        target_order = Order.query.filter_by(reference_no=ref_no).first()
+        target_order = load_order(ref_no)
         nec_details = current_user.business_details
 
         if target_order.partial_disbursement_initiated:
@@ -1231,10 +1852,23 @@ def initiate_partial_disbursement(ref_no):
                 400,
             )
 
-        target_order_details = OrderDetails.query.filter_by(order=target_order).first()
+        target_order_details = target_order.order_details
+
+        amount = to_kobo(target_order_details.amount_to_partially_disburse)
+        balance = ledger.get_balance(target_order.id)
+        if not amount or amount > ledger.merchant_payable(
+            target_order_details, balance
+        ):
+            return (
+                jsonify(
+                    {
+                        "status": "error",
+                        "message": "order balance can't cover the partial disbursement",
+                    }
+                ),
+                400,
+            )
 
-        amount = target_order_details.amount_to_partially_disburse
-        amount = amount * 100
         pk_reference = f"pk_trans_partial_{uuid.uuid1()}"
         reason = f"Payout to {nec_details.name} for partial payment of order {ref_no}"
 
@@ -1249,6 +1883,7 @@ def initiate_partial_disbursement(ref_no):
             "reference": pk_reference,
         }
 
+        provider_call_started()
         response, stat_code = p_client.initiate_payout(payload=payload)
 
         if stat_code == 401:
@@ -1259,7 +1894,7 @@ def initiate_partial_disbursement(ref_no):
                 "reference": k_ref,
                 "destination": {
                     "type": "bank_account",
-                    "amount": target_order_details.amount_to_partially_disburse,
+                    "amount": from_kobo(amount),
                     "currency": "NGN",
                     "narration": reason,
                     "bank_account": {
@@ -1280,12 +1915,12 @@ def initiate_partial_disbursement(ref_no):
                 r_client.set(k_ref, ref_no)
                 new_timeline = TransactionTimeline(
                     event_occurrance=f"Partial Disbursements have been successfully initiated with ref_no {k_ref}",
+                    event_code=TimelineEvent.PARTIAL_DISBURSEMENT_INITIATED,
                     category="Disbursement Initiation",
                     order=target_order,
                 )
                 db.session.add(new_timeline)
                 target_order.partial_disbursement_initiated = True
-                target_order.partial_disbursement_processing = True
                 db.session.commit()
 
                 return (
@@ -1318,465 +1953,47 @@ def initiate_partial_disbursement(ref_no):
 
 @transaction.post("verify_kora_transaction_callback")
 def verify_kora_transaction_callback():
-    response = {}
-    try:
-        current_app.lock.acquire()
-        response["status"] = "Lock acquired. Processing task..."
-        validated_request = signature_validation(request=request, service="kora")
-        if validated_request:
-            print("successfully validated signature")
-            data = request.get_json()
-            if data["event"] == "transfer.success":
-                trans_data = data.get("data")
-                trans_ref = trans_data["reference"]
-                order_refno = r_client.get(trans_ref)
-                target_order = Order.query.filter_by(reference_no=order_refno).first()
-                merchant = Merchant.query.filter_by(id=target_order.merchant_id).first()
-
-                if trans_ref.startswith("k_trans_partial"):
-                    if target_order.partial_disbursement_dispatched:
-                        response["result"] = "Task completed successfully."
-                        return (
-                            jsonify(
-                                {
-                                    "status": "success",
-                                    "message": "successfully verified already",
-                                }
-                            ),
-                            200,
-                        )
-
-                    target_order.order_details.amount_partially_disbursed += trans_data[
-                        "amount"
-                    ]
-                    target_order.order_details.amount_remaining_to_be_disbursed -= (
-                        trans_data["amount"]
-                    )
-                    target_order.order_details.total_amount_disbursed = trans_data[
-                        "amount"
-                    ]
-                    target_order.order_details.current_holdings_amount -= trans_data[
-                        "amount"
-                    ]
-                    target_order.partial_disbursement_processing = False
-                    target_order.partial_disbursement_dispatched = True
-
-                    new_transaction = TransactionHistory(
-                        amount=trans_data["amount"],
-                        status="Success",
-                        trans_reference=trans_ref,
-                        sender="TrustLock Holdings",
-                        receiver=merchant.busines_details.name,
-                        description=f"Partial disbursement of funds from TrustLock to {merchant.busines_details.name} with referernce {trans_ref}",
-                        remark=f"Korapay Limited payout to TrustLock merchant {merchant.busines_details.name}",
-                        order=target_order,
-                    )
-
-                    new_timeline = TransactionTimeline(
-                        event_occurrance=f"Partial disbursement of {trans_data['amount']} to {merchant.busines_details.name} successfully verified.",
-                        category="Disbursement Verification",
-                        order=target_order,
-                    )
-
-                    db.session.add_all([new_transaction, new_timeline])
-                    db.session.commit()
-
-                    response["result"] = "Task completed successfully."
-                    return (
-                        jsonify(
-                            {
-                                "status": "success",
-                                "message": "successfully verified partial payout",
-                            }
-                        ),
-                        200,
-                    )
-
-                if trans_ref.startswith("k_trans_full"):
-                    print("initiation of full fund begun")
-                    print(data)
-                    if target_order.seller_disbursement_dispatched:
-                        response["result"] = "Task completed successfully."
-                        return (
-                            jsonify(
-                                {
-                                    "status": "success",
-                                    "message": "successfully verified already",
-                                }
-                            ),
-                            200,
-                        )
-
-                    if (
-                        target_order.seller_disbursement_approved
-                        and target_order.seller_disbursement_processing
-                    ):
-                        print("successfully asserted prerequisites")
-                        target_order.order_details.amount_remaining_to_be_disbursed -= (
-                            trans_data["amount"]
-                        )
-                        target_order.order_details.total_amount_disbursed += trans_data[
-                            "amount"
-                        ]
-                        target_order.order_details.current_holdings_amount -= (
-                            trans_data["amount"]
-                        )
-                        target_order.seller_disbursement_processing = False
-                        target_order.seller_disbursement_dispatched = True
-                        target_order.order_closed = True
-                        target_order.order_details.date_updated = datetime.utcnow()
-                        target_order.date_updated = datetime.utcnow()
-                        target_order.date_closed = datetime.utcnow()
-
-                        new_transaction = TransactionHistory(
-                            amount=trans_data["amount"],
-                            status="Success",
-                            trans_reference=trans_ref,
-                            sender="TrustLock Holdings",
-                            receiver=merchant.business_details.name,
-                            description=f"Full disbursement of funds from TrustLock to {merchant.business_details.name} with referernce {trans_ref}",
-                            remark=f"Korapay Limited payout to TrustLock merchant {merchant.business_details.name}",
-                            order=target_order,
-                        )
-
-                        new_timeline = TransactionTimeline(
-                            event_occurrance=f"Full disbursement of {trans_data['amount']} to {merchant.business_details.name} successfully verified.",
-                            category="Disbursement Verification",
-                            order=target_order,
-                        )
-
-                        new_timeline1 = TransactionTimeline(
-                            event_occurrance=f"Order {order_refno} has been successfully closed",
-                            category="Order Close",
-                            order=target_order,
-                        )
-
-                        db.session.add_all([new_transaction, new_timeline])
-                        db.session.add(new_timeline1)
-                        db.session.commit()
-
-                        response["result"] = "Task completed successfully."
-                        print("added to db successfully")
-                        return (
-                            jsonify(
-                                {
-                                    "status": "success",
-                                    "message": "successfully verified partial payout",
-                                }
-                            ),
-                            200,
-                        )
-                    else:
-                        print("order not approved")
-                        print(target_order.seller_disbursement_approved)
-                        print(target_order.seller_disbursement_processing)
-                        response["result"] = "Task completed successfully."
-                        return (
-                            jsonify(
-                                {"status": "failed", "message": "order not approved"}
-                            ),
-                            400,
-                        )
-
-                if trans_ref.startswith("k_refund"):
-                    if target_order.refund_dispatched:
-                        return (
-                            jsonify(
-                                status="success",
-                                message="transaction has already been verified",
-                            ),
-                            200,
-                        )
-                    customer_name = f"{target_order.customer.first_name} {target_order.customer.last_name}"
-                    target_order.full_amount_refunded = (
-                        True
-                        if not target_order.partial_disbursement_dispatched
-                        else False
-                    )
-                    target_order.order_details.amount_refunded = trans_data["amount"]
-                    target_order.order_details.current_holdings_amount -= trans_data[
-                        "amount"
-                    ]
-                    target_order.order_details.date_updated = datetime.utcnow()
-                    target_order.refund_processing = False
-                    target_order.refund_dispatched = True
-                    target_order.date_updated = datetime.utcnow()
-                    target_order.order_closed = True
-                    target_order.date_closed = datetime.utcnow()
-
-                    new_transaction = TransactionHistory(
-                        amount=trans_data["amount"],
-                        status="Success",
-                        trans_reference=trans_ref,
-                        sender="TrustLock Holdings",
-                        receiver=customer_name,
-                        description=f"Refund of funds to {customer_name} due to return of order {order_refno}",
-                        remark=f"Korapay Limited refund to TrustLock customer {customer_name}",
-                        order=target_order,
-                    )
-
-                    new_timeline = TransactionTimeline(
-                        event_occurrance=f"Refund of {trans_data['amount']} to {customer_name} successfully verified.",
-                        category="Refund",
-                        order=target_order,
-                    )
-
-                    new_timeline1 = TransactionTimeline(
-                        event_occurrance=f"Order {order_refno} has been successfully closed",
-                        category="Order Close",
-                        order=target_order,
-                    )
-
-                    db.session.add_all([new_transaction, new_timeline, new_timeline1])
-                    db.session.commit()
-                    # SEND EMAIL TO INFORM PARTIES THAT REFUND WAS SUCCESSFUL AND ORDER HAS BEEN CLOSED
-
-                    response["result"] = "Task completed successfully."
-                    return (
-                        jsonify(
-                            {
-                                "status": "success",
-                                "message": "successfully verified refund",
-                            }
-                        ),
-                        200,
-                    )
-
-            elif data["event"] == "transfer.failed":
-                # ADD LOGIC TO PROCESS TRANSACTION WHEN THE ATTEMPT FAILED
-                return (
-                    jsonify(
-                        {
-                            "status": "success",
-                            "message": "transfer status received successfully",
-                        }
-                    ),
-                    200,
-                )
-            else:
-                # ADD LOGIC TO PROCESS TRANSACTION WHEN THE ATTEMPT FAILED
-                return (
-                    jsonify(
-                        {
-                            "status": "success",
-                            "message": "transfer status received successfully",
-                        }
-                    ),
-                    200,
-                )
-
-        else:
-            response["result"] = "Task completed successfully."
-            return (
-                jsonify({"status": "error", "message": "enable to initiate handshake"}),
-                400,
-            )
-
-    except Exception as e:
-        db.session.rollback()
-        print(e)
-        response["error"] = str(e)
-        return jsonify({"status": "error", "message": "something went wrong"}), 500
-
-    finally:
-        current_app.lock.release()
-        response["status"] = "Lock released."
-        print(response)
+    return receive_callback(service="kora")
 
 
 @transaction.post("verify_paystack_transaction_callback")
 def verify_paystack_transaction_callback():
-    response = {}
-    try:
-        current_app.lock.acquire()
-        response["status"] = "Lock acquired. Processing task..."
-        validated_request = signature_validation(request=request, service="paystack")
-        if validated_request:
-            data = request.get_json()
-            if data["event"] == "transfer.success":
-                trans_data = data.get("data")
-                amount = trans_data["amount"] / 100
-                trans_ref = trans_data["reference"]
-                info_dict = r_client.get(trans_ref).decode("utf-8")
-                info_dict = json.loads(info_dict)
-                order_refno = info_dict["order_ref"]
-                target_order = Order.query.filter_by(reference_no=order_refno).first()
-                merchant = Merchant.query.filter_by(id=target_order.merchant_id).first()
-
-                if trans_ref.startswith("pk_trans_full"):
-                    if target_order.seller_disbursement_dispatched:
-                        response["result"] = "Task completed successfully."
-                        return (
-                            jsonify(
-                                {
-                                    "status": "success",
-                                    "message": "successfully verified already",
-                                }
-                            ),
-                            200,
-                        )
+    return receive_callback(service="paystack")
 
-                    if (
-                        target_order.seller_disbursement_approved
-                        and target_order.seller_disbursement_processing
-                    ):
-                        target_order.order_details.amount_remaining_to_be_disbursed -= (
-                            amount
-                        )
-                        target_order.order_details.total_amount_disbursed += amount
-                        target_order.order_details.current_holdings_amount -= amount
-                        target_order.seller_disbursement_processing = False
-                        target_order.seller_disbursement_dispatched = True
-                        target_order.order_closed = True
-                        target_order.order_details.date_updated = datetime.utcnow
-                        target_order.date_updated = datetime.utcnow
-                        target_order.date_closed = datetime.utcnow
-
-                        new_transaction = TransactionHistory(
-                            amount=amount,
-                            status="Success",
-                            trans_reference=trans_ref,
-                            sender="TrustLock Holdings",
-                            receiver=merchant.busines_details.name,
-                            description=f"Full disbursement of funds from TrustLock to {merchant.busines_details.name} with referernce {trans_ref}",
-                            remark=f"Paystack Limited payout to TrustLock merchant {merchant.busines_details.name}",
-                            order=target_order,
-                        )
 
-                        new_timeline = TransactionTimeline(
-                            event_occurrance=f"Full disbursement of {amount} to {merchant.busines_details.name} successfully verified.",
-                            category="Disbursement Verification",
-                            order=target_order,
-                        )
+def receive_callback(service: str):
+    """
+    verify a provider callback and store it in the webhook inbox, the
+    event itself is applied by a celery worker
+    """
 
-                        new_timeline1 = TransactionTimeline(
-                            event_occurrance=f"Order {order_refno} has been successfully closed",
-                            category="Order Close",
-                            order=target_order,
-                        )
-
-                        db.session.add_all(new_transaction, new_timeline)
-                        db.session.add(new_timeline1)
-                        db.session.commit()
-
-                        response["result"] = "Task completed successfully."
-                        return (
-                            jsonify(
-                                {
-                                    "status": "success",
-                                    "message": "successfully verified partial payout",
-                                }
-                            ),
-                            200,
-                        )
-                    else:
-                        response["result"] = "Task completed successfully."
-                        return (
-                            jsonify(
-                                {"status": "failed", "message": "order not approved"}
-                            ),
-                            400,
-                        )
-
-                if trans_ref.startswith("pk_trans_partial"):
-                    if target_order.partial_disbursement_dispatched:
-                        response["result"] = "Task completed successfully."
-                        return (
-                            jsonify(
-                                {
-                                    "status": "success",
-                                    "message": "successfully verified already",
-                                }
-                            ),
-                            200,
-                        )
-
-                    target_order.order_details.amount_partially_disbursed += amount
-                    target_order.order_details.amount_remaining_to_be_disbursed -= (
-                        amount
-                    )
-                    target_order.order_details.total_amount_disbursed = amount
-                    target_order.order_details.current_holdings_amount -= amount
-                    target_order.partial_disbursement_processing = False
-                    target_order.partial_disbursement_dispatched = True
-
-                    new_transaction = TransactionHistory(
-                        amount=amount,
-                        status="Success",
-                        trans_reference=trans_ref,
-                        sender="TrustLock Holdings",
-                        receiver=merchant.busines_details.name,
-                        description=f"Partial disbursement of funds from TrustLock to {merchant.busines_details.name} with referernce {trans_ref}",
-                        remark=f"Paystack Limited payout to TrustLock merchant {merchant.busines_details.name}",
-                        order=target_order,
-                    )
-
-                    new_timeline = TransactionTimeline(
-                        event_occurrance=f"Partial disbursement of {amount} to {merchant.busines_details.name} successfully verified.",
-                        category="Disbursement Verification",
-                        order=target_order,
-                    )
-
-                    db.session.add_all(new_transaction, new_timeline)
-                    db.session.commit()
-
-                    response["result"] = "Task completed successfully."
-                    return (
-                        jsonify(
-                            {
-                                "status": "success",
-                                "message": "successfully verified partial payout",
-                            }
-                        ),
-                        200,
-                    )
-
-            if data["event"] == "transfer.failed":
-                # ADD LOGIC TO PROCESS TRANSACTION WHEN THE ATTEMPT FAILED
-                return (
-                    jsonify(
-                        {
-                            "status": "success",
-                            "message": "transfer status received successfully",
-                        }
-                    ),
-                    200,
-                )
-
-            if data["event"] == "transfer.reveresed":
-                # ADD LOGIC TO PROCESS TRANSACTION WHEN THE ATTEMPT WAS REVERESED
-                return (
-                    jsonify(
-                        {
-                            "status": "success",
-                            "message": "transfer status received successfully",
-                        }
-                    ),
-                    200,
-                )
-
-            if data["event"] == "charge.success":
-                print(json.dumps(data["data"], indent=4))
-                return jsonify({"status": True, "message": "callback successful"}), 200
-        else:
-            response["result"] = "Task completed successfully."
+    try:
+        validated_request = signature_validation(request=request, service=service)
+        if not validated_request:
             print("unable to verify handshake")
             return (
                 jsonify({"status": "error", "message": "enable to initiate handshake"}),
                 400,
             )
 
+        event = receive_webhook_event(service, request.get_json())
+        return (
+            jsonify(
+                {
+                    "status": "success",
+                    "message": "event received successfully"
+                    if event
+                    else "event already received",
+                }
+            ),
+            200,
+        )
+
     except Exception as e:
         db.session.rollback()
         print(e)
-        response["error"] = str(e)
         return jsonify({"status": "error", "message": "something went wrong"}), 500
 
-    finally:
-        current_app.lock.release()
-        response["status"] = "Lock released."
-        print(response)
-
 
 @transaction.put("approve_seller_disbursement/<ref_no>")
 @jwt_required()
@@ -1784,7 +2001,7 @@ def verify_paystack_transaction_callback():
 @order_exists
 def approve_seller_disbursement(ref_no):
     try:
-        target_order = Order.query.filter_by(reference_no=ref_no).first()
+        target_order = load_order(ref_no)
 
         if target_order.seller_disbursement_approved:
             return (
@@ -1819,10 +2036,11 @@ def approve_seller_disbursement(ref_no):
             )
 
         print("all conditions passed")
-        target_order.seller_disbursement_approved = True
+        transition(target_order, OrderStatus.DISBURSEMENT_APPROVED)
 
         new_timeline = TransactionTimeline(
             event_occurrance=f"Full Disbursements of funds for order {ref_no} ready for initiation",
+            event_code=TimelineEvent.DISBURSEMENT_APPROVED,
             category="Disbursement Approval",
             order=target_order,
         )
@@ -1849,10 +2067,11 @@ def approve_seller_disbursement(ref_no):
 @transaction.put("initiate_seller_payout/<ref_no>")
 @jwt_required()
 @api_secret_key_required
-@order_exists
+@idempotent
+@order_exists(load=("order_details",))
 def initialize_seller_payout(ref_no):
     try:
-        target_order = Order.query.filter_by(reference_no=ref_no).first()
+        target_order = load_order(ref_no)
         nec_details = BusinessDetails.query.filter_by(
             merchant_id=target_order.merchant_id
         ).one()
@@ -1873,10 +2092,32 @@ def initialize_seller_payout(ref_no):
                 400,
             )
 
+        # checked before any money moves, nothing may fail once the payout
+        # has been sent
+        if not can_transition(target_order, OrderStatus.DISBURSING):
+            return (
+                jsonify(
+                    {
+                        "status": "error",
+                        "message": f"order can't be paid out while {target_order.status.value}",
+                    }
+                ),
+                400,
+            )
+
         target_order_details = target_order.order_details
 
-        amount = target_order_details.amount_remaining_to_be_disbursed
-        amount = amount * 100
+        amount = ledger.merchant_payable(
+            target_order_details, ledger.get_balance(target_order.id)
+        )
+        if not amount:
+            return (
+                jsonify(
+                    {"status": "error", "message": "nothing left to pay out for order"}
+                ),
+                400,
+            )
+
         pk_ref = f"pk_trans_full_{uuid.uuid1()}"
         reason = f"Payout to {nec_details.name} for full payment of order {ref_no}"
 
@@ -1891,6 +2132,7 @@ def initialize_seller_payout(ref_no):
             "reference": pk_ref,
         }
 
+        provider_call_started()
         response, stat_code = p_client.initiate_payout(payload=payload)
         if stat_code == 400:
             # USING KORAPAY TO IMMEDIATELY SEND OUT MONEY IF PAYSTACK DOESNT WORK
@@ -1900,7 +2142,7 @@ def initialize_seller_payout(ref_no):
                 "reference": k_ref,
                 "destination": {
                     "type": "bank_account",
-                    "amount": target_order_details.amount_remaining_to_be_disbursed,
+                    "amount": from_kobo(amount),
                     "currency": "NGN",
                     "narration": reason,
                     "bank_account": {
@@ -1919,11 +2161,11 @@ def initialize_seller_payout(ref_no):
             if k_response["status"] and k_stat_code == 200:
 
                 r_client.set(k_ref, ref_no)
-                target_order.seller_disbursement_initiated = True
-                target_order.seller_disbursement_processing = True
+                transition(target_order, OrderStatus.DISBURSING)
                 target_order.date_updated = datetime.utcnow()
                 new_timeline = TransactionTimeline(
                     event_occurrance=f"Full Disbursements have been successfully initiated with ref_no {k_ref}",
+                    event_code=TimelineEvent.DISBURSEMENT_INITIATED,
                     category="Disbursement Initiation",
                     order=target_order,
                 )
@@ -1958,11 +2200,11 @@ def initialize_seller_payout(ref_no):
                 "transfer_code": response["data"]["transfer_code"],
             }
             r_client.set(pk_ref, json.dumps(info_dict))
-            target_order.seller_disbursement_initiated = True
-            target_order.seller_disbursement_processing = True
+            transition(target_order, OrderStatus.DISBURSING)
             target_order.date_updated = datetime.utcnow()
             new_timeline = TransactionTimeline(
                 event_occurrance=f"Full Disbursements have been successfully initiated with ref_no {pk_ref}",
+                event_code=TimelineEvent.DISBURSEMENT_INITIATED,
                 category="Disbursement Initiation",
                 order=target_order,
             )
@@ -1998,12 +2240,13 @@ def initialize_seller_payout(ref_no):
 
 
 @transaction.get("get_transaction_history/<ref_no>")
+@query_budget(3)
 @jwt_required()
 @api_secret_key_required
 @order_exists
 def get_transaction_history(ref_no):
     try:
-        target_order = Order.query.filter_by(reference_no=ref_no).first()
+        target_order = load_order(ref_no)
 
         transaction_history = TransactionHistory.query.filter_by(
             order=target_order
@@ -2030,20 +2273,64 @@ def get_transaction_history(ref_no):
 
 
 @transaction.get("get_transaction_timeline/<ref_no>")
+@query_budget(3)
 @jwt_required()
 @api_secret_key_required
 @order_exists
 def get_transaction_timeline(ref_no):
+    """
+    page through an order's timeline oldest first. next_cursor points
+    after the last event returned, so a client can keep polling with it
+    for new events. since= starts after a given time instead and
+    event_code= picks one kind of event
+    """
+
     try:
-        target_order = Order.query.filter_by(reference_no=ref_no).first()
+        try:
+            limit = min(int(request.args.get("limit", 100)), 500)
+            cursor = request.args.get("cursor")
+            cursor = decode_cursor(cursor) if cursor else None
+            since = request.args.get("since")
+            since = datetime.fromisoformat(since) if since else None
+            event_code = request.args.get("event_code")
+            event_code = TimelineEvent(event_code) if event_code else None
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+
+        if limit < 1:
+            return (
+                jsonify({"status": "error", "message": "limit must be at least 1"}),
+                400,
+            )
 
-        transaction_timeline = TransactionTimeline.query.filter_by(
-            order=target_order
-        ).all()
+        target_order = load_order(ref_no)
+
+        query = TransactionTimeline.query.filter_by(order_id=target_order.id)
+        if since:
+            query = query.filter(TransactionTimeline.date > since)
+        if event_code:
+            query = query.filter(TransactionTimeline.event_code == event_code)
+        if cursor:
+            query = query.filter(
+                tuple_(TransactionTimeline.date, TransactionTimeline.id) > cursor
+            )
+
+        events = (
+            query.order_by(TransactionTimeline.date, TransactionTimeline.id)
+            .limit(limit + 1)
+            .all()
+        )
+        has_more = len(events) > limit
+        events = events[:limit]
+
+        if events:
+            next_cursor = encode_cursor(events[-1].date, events[-1].id)
+        else:
+            next_cursor = request.args.get("cursor")
 
         schema = TransactionTimelineSchema(many=True)
 
-        trans_schemas = schema.dump(transaction_timeline)
+        trans_schemas = schema.dump(events)
 
         return (
             jsonify(
@@ -2051,6 +2338,8 @@ def get_transaction_timeline(ref_no):
                     "status": "success",
                     "message": "retrieved order timeline",
                     "data": trans_schemas,
+                    "next_cursor": next_cursor,
+                    "has_more": has_more,
                 }
             ),
             200,
@@ -2061,15 +2350,53 @@ def get_transaction_timeline(ref_no):
         return jsonify({"status": "error", "message": "something went wrong"}), 500
 
 
-@transaction.post("rate_order/<ref_no>")
+@transaction.get("get_order_balance/<ref_no>")
+@query_budget(4)
 @jwt_required()
 @api_secret_key_required
 @order_exists
+def get_order_balance(ref_no):
+    try:
+        target_order = load_order(ref_no)
+
+        balance = ledger.get_balance(target_order.id)
+        if not balance:
+            return (
+                jsonify({"status": "error", "message": "order has no ledger balance"}),
+                404,
+            )
+
+        data = OrderBalanceSchema().dump(balance)
+        if request.args.get("postings") == "true":
+            data["postings"] = LedgerPostingSchema(many=True).dump(
+                ledger.get_postings(target_order.id)
+            )
+
+        return (
+            jsonify(
+                {
+                    "status": "success",
+                    "message": "retrieved order balance in kobo",
+                    "data": data,
+                }
+            ),
+            200,
+        )
+
+    except Exception as e:
+        print(e)
+        return jsonify({"status": "error", "message": "something went wrong"}), 500
+
+
+@transaction.post("rate_order/<ref_no>")
+@jwt_required()
+@api_secret_key_required
+@order_exists(load=("order_details",))
 def rate_order(ref_no):
     try:
         data = request.get_json()
 
-        target_order = Order.query.filter_by(reference_no=ref_no).first()
+        target_order = load_order(ref_no)
 
         if not target_order.order_closed:
             return (
@@ -2100,6 +2427,7 @@ def rate_order(ref_no):
 
         new_timeline = TransactionTimeline(
             event_occurrance=f"Order {ref_no} was given a rating of {rating}",
+            event_code=TimelineEvent.ORDER_RATED,
             category="Order Rating",
             order=target_order,
         )
@@ -0,0 +1,415 @@
+import hashlib
+import json
+from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+from project import db, r_client
+from project import ledger
+from project import metrics
+from project.fees import to_kobo, from_kobo
+from project.loaders import lock_order
+from project.order_status import OrderStatus, transition
+from project.timeline import TimelineEvent
+
+
+# durable inbox for payment provider callbacks. the callback routes only
+# verify the signature and store the raw event, keyed by provider and
+# event reference so provider retries are deduplicated, then hand the
+# event id to celery. processing applies the event and marks it processed
+# in one transaction, events that fail stay pending and are retried by
+# the drain job until MAX_WEBHOOK_ATTEMPTS is reached
+
+MAX_WEBHOOK_ATTEMPTS = 5
+WEBHOOK_LAG_BUCKETS = (100, 500, 1000, 5000, 30000, 60000, 300000, 900000)
+
+
+def webhook_event_key(data: dict) -> str:
+    event_data = data.get("data") or {}
+    reference = event_data.get("reference") or event_data.get("id")
+    if reference is None:
+        reference = hashlib.sha256(
+            json.dumps(data, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+    return f"{data.get('event')}:{reference}"
+
+
+def receive_webhook_event(provider: str, data: dict):
+    """
+    store a verified provider callback and queue it for processing.
+    returns the new event, or None when the event was already received
+    """
+
+    from project.merchants.models import WebhookEvent
+
+    event = WebhookEvent(
+        provider=provider,
+        event_key=webhook_event_key(data),
+        event=data.get("event", "unknown"),
+        payload=data,
+    )
+
+    try:
+        db.session.add(event)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        metrics.incr(f"webhook.{provider}.duplicate")
+        return None
+
+    metrics.incr(f"webhook.{provider}.received")
+
+    try:
+        from project.tasks import process_webhook_event_task
+
+        process_webhook_event_task.delay(event.id)
+    except Exception as e:
+        # the drain job picks the event up from the inbox
+        print(f"failed to queue webhook event {event.id} -- {e}")
+
+    return event
+
+
+def process_webhook_event(event_id: str) -> bool:
+    """
+    apply a stored webhook event. the event row is claimed with
+    SKIP LOCKED so concurrent workers never apply the same event twice.
+    returns False if the event failed and was left for a retry
+    """
+
+    from project.merchants.models import WebhookEvent
+
+    event = (
+        WebhookEvent.query.filter_by(id=event_id, status="pending")
+        .with_for_update(skip_locked=True)
+        .first()
+    )
+    if not event:
+        db.session.rollback()
+        return True
+
+    provider = event.provider
+    date_received = event.date_received
+
+    try:
+        result = WEBHOOK_PROCESSORS[provider](event.payload)
+        event.status = "processed"
+        event.attempts += 1
+        event.last_error = None
+        event.date_processed = datetime.utcnow()
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"{provider} webhook event {event_id} failed -- {e}")
+
+        event = WebhookEvent.query.filter_by(id=event_id).first()
+        event.attempts += 1
+        event.last_error = str(e)
+        if event.attempts >= MAX_WEBHOOK_ATTEMPTS:
+            event.status = "failed"
+            metrics.incr(f"webhook.{provider}.failed")
+        db.session.commit()
+        return False
+
+    metrics.incr(f"webhook.{provider}.processed")
+    metrics.observe(
+        f"webhook.{provider}.lag_ms",
+        (datetime.utcnow() - date_received).total_seconds() * 1000,
+        buckets=WEBHOOK_LAG_BUCKETS,
+    )
+    print(f"{provider} webhook event {event_id} processed -- {result}")
+    return True
+
+
+def process_kora_event(data: dict) -> str:
+    from project.merchants.models import (
+        Merchant,
+        TransactionHistory,
+        TransactionTimeline,
+    )
+
+    if data["event"] != "transfer.success":
+        # ADD LOGIC TO PROCESS TRANSACTION WHEN THE ATTEMPT FAILED
+        return "transfer status received successfully"
+
+    trans_data = data.get("data")
+    trans_ref = trans_data["reference"]
+    order_refno = r_client.get(trans_ref)
+    target_order = (
+        lock_order(order_refno, load=("order_details",)) if order_refno else None
+    )
+    if not target_order:
+        raise ValueError(f"no order found for transfer {trans_ref}")
+
+    merchant = Merchant.query.filter_by(id=target_order.merchant_id).first()
+
+    if trans_ref.startswith("k_trans_partial"):
+        if target_order.partial_disbursement_dispatched:
+            return "successfully verified already"
+
+        ledger.transfer(
+            target_order.id,
+            ledger.ESCROW,
+            ledger.MERCHANT,
+            to_kobo(trans_data["amount"]),
+            trans_ref,
+            f"Partial disbursement to {merchant.business_details.name}",
+        )
+        balance = ledger.sync_order_amounts(target_order)
+        target_order.order_details.amount_partially_disbursed = from_kobo(
+            balance.merchant
+        )
+        target_order.partial_disbursement_dispatched = True
+
+        new_transaction = TransactionHistory(
+            amount=trans_data["amount"],
+            status="Success",
+            trans_reference=trans_ref,
+            sender="TrustLock Holdings",
+            receiver=merchant.business_details.name,
+            description=f"Partial disbursement of funds from TrustLock to {merchant.business_details.name} with referernce {trans_ref}",
+            remark=f"Korapay Limited payout to TrustLock merchant {merchant.business_details.name}",
+            order=target_order,
+        )
+
+        new_timeline = TransactionTimeline(
+            event_occurrance=f"Partial disbursement of {trans_data['amount']} to {merchant.business_details.name} successfully verified.",
+            event_code=TimelineEvent.PARTIAL_DISBURSEMENT_COMPLETED,
+            category="Disbursement Verification",
+            order=target_order,
+        )
+
+        db.session.add_all([new_transaction, new_timeline])
+        return "successfully verified partial payout"
+
+    if trans_ref.startswith("k_trans_full"):
+        if target_order.seller_disbursement_dispatched:
+            return "successfully verified already"
+
+        if not (
+            target_order.seller_disbursement_approved
+            and target_order.seller_disbursement_processing
+        ):
+            raise ValueError(f"order {order_refno} not approved for disbursement")
+
+        ledger.transfer(
+            target_order.id,
+            ledger.ESCROW,
+            ledger.MERCHANT,
+            to_kobo(trans_data["amount"]),
+            trans_ref,
+            f"Full disbursement to {merchant.business_details.name}",
+        )
+        ledger.sync_order_amounts(target_order)
+        transition(target_order, OrderStatus.CLOSED)
+        target_order.order_details.date_updated = datetime.utcnow()
+        target_order.date_updated = datetime.utcnow()
+        target_order.date_closed = datetime.utcnow()
+
+        new_transaction = TransactionHistory(
+            amount=trans_data["amount"],
+            status="Success",
+            trans_reference=trans_ref,
+            sender="TrustLock Holdings",
+            receiver=merchant.business_details.name,
+            description=f"Full disbursement of funds from TrustLock to {merchant.business_details.name} with referernce {trans_ref}",
+            remark=f"Korapay Limited payout to TrustLock merchant {merchant.business_details.name}",
+            order=target_order,
+        )
+
+        new_timeline = TransactionTimeline(
+            event_occurrance=f"Full disbursement of {trans_data['amount']} to {merchant.business_details.name} successfully verified.",
+            event_code=TimelineEvent.DISBURSEMENT_COMPLETED,
+            category="Disbursement Verification",
+            order=target_order,
+        )
+
+        new_timeline1 = TransactionTimeline(
+            event_occurrance=f"Order {order_refno} has been successfully closed",
+            event_code=TimelineEvent.ORDER_CLOSED,
+            category="Order Close",
+            order=target_order,
+        )
+
+        db.session.add_all([new_transaction, new_timeline, new_timeline1])
+        return "successfully verified full payout"
+
+    if trans_ref.startswith("k_refund"):
+        if target_order.refund_dispatched:
+            return "transaction has already been verified"
+
+        customer_name = (
+            f"{target_order.customer.first_name} {target_order.customer.last_name}"
+        )
+        target_order.full_amount_refunded = (
+            True if not target_order.partial_disbursement_dispatched else False
+        )
+        ledger.transfer(
+            target_order.id,
+            ledger.ESCROW,
+            ledger.BUYER,
+            to_kobo(trans_data["amount"]),
+            trans_ref,
+            f"Refund to {customer_name}",
+        )
+        target_order.order_details.amount_refunded = trans_data["amount"]
+        ledger.sync_order_amounts(target_order)
+        target_order.order_details.date_updated = datetime.utcnow()
+        target_order.date_updated = datetime.utcnow()
+        transition(target_order, OrderStatus.CLOSED)
+        target_order.date_closed = datetime.utcnow()
+
+        new_transaction = TransactionHistory(
+            amount=trans_data["amount"],
+            status="Success",
+            trans_reference=trans_ref,
+            sender="TrustLock Holdings",
+            receiver=customer_name,
+            description=f"Refund of funds to {customer_name} due to return of order {order_refno}",
+            remark=f"Korapay Limited refund to TrustLock customer {customer_name}",
+            order=target_order,
+        )
+
+        new_timeline = TransactionTimeline(
+            event_occurrance=f"Refund of {trans_data['amount']} to {customer_name} successfully verified.",
+            event_code=TimelineEvent.REFUND_COMPLETED,
+            category="Refund",
+            order=target_order,
+        )
+
+        new_timeline1 = TransactionTimeline(
+            event_occurrance=f"Order {order_refno} has been successfully closed",
+            event_code=TimelineEvent.ORDER_CLOSED,
+            category="Order Close",
+            order=target_order,
+        )
+
+        db.session.add_all([new_transaction, new_timeline, new_timeline1])
+        # SEND EMAIL TO INFORM PARTIES THAT REFUND WAS SUCCESSFUL AND ORDER HAS BEEN CLOSED
+        return "successfully verified refund"
+
+    return f"no action for transfer {trans_ref}"
+
+
+def process_paystack_event(data: dict) -> str:
+    from project.merchants.models import (
+        Merchant,
+        TransactionHistory,
+        TransactionTimeline,
+    )
+
+    if data["event"] == "charge.success":
+        print(json.dumps(data["data"], indent=4))
+        return "callback successful"
+
+    if data["event"] != "transfer.success":
+        # ADD LOGIC TO PROCESS TRANSACTION WHEN THE ATTEMPT FAILED OR WAS REVERESED
+        return "transfer status received successfully"
+
+    trans_data = data.get("data")
+    amount = trans_data["amount"] / 100
+    trans_ref = trans_data["reference"]
+    info_dict = r_client.get(trans_ref)
+    if not info_dict:
+        raise ValueError(f"no order found for transfer {trans_ref}")
+
+    order_refno = json.loads(info_dict)["order_ref"]
+    target_order = lock_order(order_refno, load=("order_details",))
+    merchant = Merchant.query.filter_by(id=target_order.merchant_id).first()
+
+    if trans_ref.startswith("pk_trans_full"):
+        if target_order.seller_disbursement_dispatched:
+            return "successfully verified already"
+
+        if not (
+            target_order.seller_disbursement_approved
+            and target_order.seller_disbursement_processing
+        ):
+            raise ValueError(f"order {order_refno} not approved for disbursement")
+
+        ledger.transfer(
+            target_order.id,
+            ledger.ESCROW,
+            ledger.MERCHANT,
+            trans_data["amount"],
+            trans_ref,
+            f"Full disbursement to {merchant.business_details.name}",
+        )
+        ledger.sync_order_amounts(target_order)
+        transition(target_order, OrderStatus.CLOSED)
+        target_order.order_details.date_updated = datetime.utcnow()
+        target_order.date_updated = datetime.utcnow()
+        target_order.date_closed = datetime.utcnow()
+
+        new_transaction = TransactionHistory(
+            amount=amount,
+            status="Success",
+            trans_reference=trans_ref,
+            sender="TrustLock Holdings",
+            receiver=merchant.business_details.name,
+            description=f"Full disbursement of funds from TrustLock to {merchant.business_details.name} with referernce {trans_ref}",
+            remark=f"Paystack Limited payout to TrustLock merchant {merchant.business_details.name}",
+            order=target_order,
+        )
+
+        new_timeline = TransactionTimeline(
+            event_occurrance=f"Full disbursement of {amount} to {merchant.business_details.name} successfully verified.",
+            event_code=TimelineEvent.DISBURSEMENT_COMPLETED,
+            category="Disbursement Verification",
+            order=target_order,
+        )
+
+        new_timeline1 = TransactionTimeline(
+            event_occurrance=f"Order {order_refno} has been successfully closed",
+            event_code=TimelineEvent.ORDER_CLOSED,
+            category="Order Close",
+            order=target_order,
+        )
+
+        db.session.add_all([new_transaction, new_timeline, new_timeline1])
+        return "successfully verified full payout"
+
+    if trans_ref.startswith("pk_trans_partial"):
+        if target_order.partial_disbursement_dispatched:
+            return "successfully verified already"
+
+        ledger.transfer(
+            target_order.id,
+            ledger.ESCROW,
+            ledger.MERCHANT,
+            trans_data["amount"],
+            trans_ref,
+            f"Partial disbursement to {merchant.business_details.name}",
+        )
+        balance = ledger.sync_order_amounts(target_order)
+        target_order.order_details.amount_partially_disbursed = from_kobo(
+            balance.merchant
+        )
+        target_order.partial_disbursement_dispatched = True
+
+        new_transaction = TransactionHistory(
+            amount=amount,
+            status="Success",
+            trans_reference=trans_ref,
+            sender="TrustLock Holdings",
+            receiver=merchant.business_details.name,
+            description=f"Partial disbursement of funds from TrustLock to {merchant.business_details.name} with referernce {trans_ref}",
+            remark=f"Paystack Limited payout to TrustLock merchant {merchant.business_details.name}",
+            order=target_order,
+        )
+
+        new_timeline = TransactionTimeline(
+            event_occurrance=f"Partial disbursement of {amount} to {merchant.business_details.name} successfully verified.",
+            event_code=TimelineEvent.PARTIAL_DISBURSEMENT_COMPLETED,
+            category="Disbursement Verification",
+            order=target_order,
+        )
+
+        db.session.add_all([new_transaction, new_timeline])
+        return "successfully verified partial payout"
+
+    return f"no action for transfer {trans_ref}"
+
+
+WEBHOOK_PROCESSORS = {
+    "kora": process_kora_event,
+    "paystack": process_paystack_event,
+}